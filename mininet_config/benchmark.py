@@ -0,0 +1,236 @@
+"""
+Benchmark offline del controller implementato in `our_dijkstra.py`.
+
+Vengono generate topologie sintetiche di dimensione crescente (anello con corde
+casuali, oppure uno dei generatori di `topo_generators`: fat-tree, leaf-spine,
+Waxman, anello, griglia), usando oggetti fittizi al posto degli `Switch`/`Link`
+di Ryu, senza bisogno di Mininet. Per ciascuna dimensione si misurano:
+- il tempo di costruzione di `NetLinkGraph`;
+- il tempo medio di una singola esecuzione di `dijkstra_tree`;
+- il tempo per calcolare e serializzare in JSON le rotte di tutti gli switch,
+  come fa `DijkstraCommand.distance_dict_to_json` per la rotta /dijkstra;
+- la memoria occupata dal grafo e il picco di memoria durante il calcolo delle rotte.
+Con `--workers` maggiore di 1 le rotte vengono calcolate con il pool di processi
+di `parallel_paths` (vedi `NetLinkGraph.compute_trees`).
+
+Esecuzione:
+    python benchmark.py [--topology random] [--sizes 10 100 1000 10000] [--runs 5] [--workers 1] [--csv]
+"""
+
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Any, Callable, Optional
+import argparse
+import json
+import math
+import random
+import time
+import tracemalloc
+
+from our_dijkstra import NetLinkGraph, DijkstraCommand
+from parallel_paths import ParallelShortestPaths
+from topo_generators import Fabric, FabricLink, fat_tree, leaf_spine, waxman, ring, grid
+
+
+# Oggetti fittizi che espongono i soli attributi degli oggetti Ryu
+# (`Switch.dp.id`, `Link.src.dpid`, `Link.dst.dpid`) letti da `NetLinkGraph`
+@dataclass(frozen=True)
+class StubDatapath():
+    id: int
+
+@dataclass(frozen=True)
+class StubSwitch():
+    dp: StubDatapath
+
+@dataclass(frozen=True)
+class StubPort():
+    dpid: int
+
+@dataclass(frozen=True)
+class StubLink():
+    src: StubPort
+    dst: StubPort
+
+
+def synthetic_topology(n_switches: int, extra_links: int, seed: int = 0) -> Tuple[List[StubSwitch], Dict[StubLink, float]]:
+    """
+    Genera `n_switches` switch fittizi collegati ad anello (quindi connessi),
+    a cui si aggiungono `extra_links` collegamenti casuali.
+    Restituisce gli switch e i link nello stesso formato di
+    `get_all_switch` e `get_all_link`.
+    """
+    rng = random.Random(seed)
+    switches = [StubSwitch(dp=StubDatapath(id=dpid)) for dpid in range(1, n_switches + 1)]
+
+    pairs = {(dpid, dpid % n_switches + 1) for dpid in range(1, n_switches + 1) if n_switches > 1}
+    max_links = n_switches * (n_switches - 1) // 2
+    while len(pairs) < min(n_switches + extra_links, max_links):
+        a, b = rng.randint(1, n_switches), rng.randint(1, n_switches)
+        if a != b and (b, a) not in pairs:
+            pairs.add((a, b))
+
+    links = {
+        StubLink(src=StubPort(dpid=a), dst=StubPort(dpid=b)): 0.0
+        for (a, b) in pairs
+    }
+    return switches, links
+
+
+def synthetic_parameters(links: Dict[StubLink, float], seed: int = 0) -> Dict[Tuple[int, int], Dict[str, str]]:
+    """
+    Assegna a ciascun link dei parametri di banda e ritardo casuali,
+    nello stesso formato ricevuto dalla rotta /dijkstra.
+    """
+    rng = random.Random(seed)
+    parameters = {}
+    for link in links.keys():
+        params = { "bw": rng.choice((1, 5, 20, 100)), "delay": f"{rng.choice((0.05, 0.5, 2))}ms" }
+        parameters[link.src.dpid, link.dst.dpid] = params
+        parameters[link.dst.dpid, link.src.dpid] = params
+    return parameters
+
+
+def random_fabric(n_switches: int, seed: int = 0) -> Fabric:
+    """
+    La topologia di `synthetic_topology` (con n_switches collegamenti aggiuntivi)
+    e i parametri di `synthetic_parameters`, sotto forma di `Fabric`.
+    """
+    switches, links = synthetic_topology(n_switches=n_switches, extra_links=n_switches, seed=seed)
+    parameters = synthetic_parameters(links, seed=seed)
+    dpids = [switch.dp.id for switch in switches]
+    return Fabric(
+        name="random-%d" % n_switches,
+        switches=dpids,
+        access_switches=dpids,
+        links=[
+            FabricLink(src=link.src.dpid, dst=link.dst.dpid, **parameters[link.src.dpid, link.dst.dpid])
+            for link in links.keys()
+        ],
+    )
+
+
+def _even(value: float) -> int:
+    return max(2, 2 * math.ceil(value / 2))
+
+
+def _spines(n: int) -> int:
+    return max(2, round(math.sqrt(n) / 2))
+
+
+# Generatori indicizzati per nome, ciascuno con circa `n` switch
+SCALED_TOPOLOGIES: Dict[str, Callable[[int], Fabric]] = {
+    "random": random_fabric,
+    "fattree": lambda n: fat_tree(k=_even(math.sqrt(4 * n / 5))), # 5k^2/4 switch
+    "leafspine": lambda n: leaf_spine(spines=_spines(n), leaves=max(1, n - _spines(n))),
+    # beta decresce con n, così che il grado medio resti circa costante (~4)
+    "waxman": lambda n: waxman(n=n, beta=min(0.4, 10 / n)),
+    "ring": ring,
+    "grid": lambda n: grid(rows=math.ceil(math.sqrt(n)), cols=math.ceil(math.sqrt(n))),
+}
+
+
+def stub_topology(fabric: Fabric) -> Tuple[List[StubSwitch], Dict[StubLink, float], Dict[Tuple[int, int], Dict[str, Any]]]:
+    """
+    Switch e link fittizi del `fabric`, nel formato di `get_all_switch` e
+    `get_all_link`, insieme ai parametri di connessione come li riceve /dijkstra.
+    """
+    switches = [StubSwitch(dp=StubDatapath(id=dpid)) for dpid in fabric.switches]
+    links = { StubLink(src=StubPort(dpid=link.src), dst=StubPort(dpid=link.dst)): 0.0 for link in fabric.links }
+    parameters = {}
+    for link in fabric.links:
+        parameters[link.src, link.dst] = parameters[link.dst, link.src] = { "bw": link.bw, "delay": link.delay }
+    return switches, links, parameters
+
+
+def route_json(graph: NetLinkGraph, networks: List[Dict[str, Any]], links: List[Dict[str, Any]]) -> str:
+    # Lo stesso lavoro di `DijkstraCommand.distance_dict_to_json`
+    return json.dumps(DijkstraCommand.route_entries(net_graph=graph, networks=networks, links=links))
+
+
+def measure(fabric: Fabric, runs: int, routes_max: int, parallel: Optional[ParallelShortestPaths] = None) -> Dict[str, Optional[float]]:
+    """
+    Esegue le misure su una topologia; il calcolo delle rotte di tutti gli switch
+    (quadratico nel numero di switch) è omesso oltre `routes_max` switch.
+    """
+    switches, links, parameters = stub_topology(fabric)
+    networks, link_payload = fabric.networks(), fabric.link_payload()
+    result: Dict[str, Optional[float]] = { "switches": len(switches), "links": len(links) }
+
+    start = time.perf_counter()
+    graph = NetLinkGraph(parent_app=None, switches=switches, links=links, connection_parameters=parameters)
+    result["build_ms"] = (time.perf_counter() - start) * 1000
+
+    sources = random.Random(len(switches)).sample(fabric.switches, min(runs, len(switches)))
+    start = time.perf_counter()
+    for source in sources:
+        graph.dijkstra_tree(graph.index[source])
+    result["dijkstra_ms"] = (time.perf_counter() - start) * 1000 / len(sources)
+
+    with_routes = len(switches) <= routes_max
+    result["routes_ms"] = None
+    if with_routes:
+        # Grafo nuovo: nessun albero dei cammini minimi già in memoria
+        graph = NetLinkGraph(parent_app=None, switches=switches, links=links, connection_parameters=parameters, parallel=parallel)
+        start = time.perf_counter()
+        route_json(graph, networks, link_payload)
+        result["routes_ms"] = (time.perf_counter() - start) * 1000
+
+    # Le misure di memoria sono a parte: tracemalloc rallenta sensibilmente l'esecuzione
+    del graph
+    tracemalloc.start()
+    graph = NetLinkGraph(parent_app=None, switches=switches, links=links, connection_parameters=parameters)
+    graph_bytes, _ = tracemalloc.get_traced_memory()
+    result["graph_mib"] = graph_bytes / 2 ** 20
+    result["routes_peak_mib"] = None
+    if with_routes:
+        tracemalloc.reset_peak()
+        route_json(graph, networks, link_payload)
+        result["routes_peak_mib"] = (tracemalloc.get_traced_memory()[1] - graph_bytes) / 2 ** 20
+    tracemalloc.stop()
+    return result
+
+
+COLUMNS = (
+    ("switches", "switch", "d"), ("links", "link", "d"),
+    ("build_ms", "build (ms)", ".2f"), ("dijkstra_ms", "dijkstra (ms)", ".3f"), ("routes_ms", "routes+json (ms)", ".1f"),
+    ("graph_mib", "graph (MiB)", ".2f"), ("routes_peak_mib", "routes peak (MiB)", ".2f"),
+)
+
+
+def run(topology: str, sizes: List[int], runs: int, routes_max: int, workers: int = 1, csv: bool = False):
+    parallel = None
+    if workers > 1:
+        parallel = ParallelShortestPaths(workers=workers, min_switches=0)
+        # Avvio dei processi del pool, escluso dalle misure
+        fabric = ring(2 * workers)
+        switches, links, parameters = stub_topology(fabric)
+        NetLinkGraph(parent_app=None, switches=switches, links=links, connection_parameters=parameters, parallel=parallel).compute_trees(fabric.switches)
+
+    if csv:
+        print(",".join(key for key, _, _ in COLUMNS))
+    else:
+        print(" ".join(f"{title:>{max(8, len(title))}}" for _, title, _ in COLUMNS))
+
+    for n in sizes:
+        result = measure(SCALED_TOPOLOGIES[topology](n), runs=runs, routes_max=routes_max, parallel=parallel)
+        if csv:
+            print(",".join("" if result[key] is None else f"{result[key]:{fmt}}" for key, _, fmt in COLUMNS))
+        else:
+            print(" ".join(
+                f"{'-' if result[key] is None else format(result[key], fmt):>{max(8, len(title))}}"
+                for key, title, fmt in COLUMNS
+            ))
+
+    if parallel is not None:
+        parallel.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark di NetLinkGraph e del calcolo delle rotte su topologie sintetiche")
+    parser.add_argument("--topology", choices=sorted(SCALED_TOPOLOGIES.keys()), default="random")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Numero (approssimativo) di switch")
+    parser.add_argument("--runs", type=int, default=5, help="Numero di switch sorgente per ciascuna dimensione")
+    parser.add_argument("--routes-max", type=int, default=1000, help="Numero massimo di switch per cui calcolare tutte le rotte")
+    parser.add_argument("--workers", type=int, default=1, help="Processi per il calcolo parallelo delle rotte (1: sequenziale)")
+    parser.add_argument("--csv", action="store_true", help="Output in formato CSV, e.g. per tracciare le curve")
+    args = parser.parse_args()
+    run(topology=args.topology, sizes=args.sizes, runs=args.runs, routes_max=args.routes_max, workers=args.workers, csv=args.csv)
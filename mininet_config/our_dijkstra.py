@@ -1,16 +1,48 @@
+from array import array
 from dataclasses import dataclass
 from typing import List, Dict, Tuple, Set, Optional, Union, Any
-from collections import defaultdict
+from collections import OrderedDict
+from contextlib import contextmanager
+import bisect
+import hashlib
+import heapq
+import ipaddress
+import itertools
 import json
+import logging
+import math
+import os
 import sys
+import time
+
+try:
+    import numpy as np
+except ImportError: # NumPy è opzionale: senza, si usa sempre Dijkstra
+    np = None
 
 from ryu.base import app_manager
-from ryu.app.rest_router import RestRouterAPI
+from ryu.app.rest_router import RestRouterAPI, RouterController, VLANID_NONE, REST_COMMAND_RESULT, REST_DETAILS, REST_NG, REST_RESULT
 from ryu.app.wsgi import ControllerBase, Request, Response, route, WSGIApplication
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.lib import hub
+from ryu.topology import event as topo_event
 from ryu.topology.switches import Link, Switch, Port
 from ryu.topology.api import get_all_switch, get_all_link
 from ryu.ofproto import ofproto_v1_3
 
+from parallel_paths import ParallelShortestPaths, csr_from_adjacency, csr_dijkstra, INF
+
+# I messaggi di debug (link e costi, richieste ricevute...) vengono prodotti soltanto
+# se il livello del logger lo consente, e.g. `ryu-manager --verbose` oppure
+# logging.getLogger("our_dijkstra").setLevel(logging.DEBUG)
+LOG = logging.getLogger(__name__)
+
+# Generazione di ciascun `NetLinkGraph`: a differenza di id(), non viene mai riusata
+# da un grafo successivo, così che la chiave del grafo pubblicato ai processi di
+# `ParallelShortestPaths` sia univoca anche dopo una ricostruzione
+_graph_generations = itertools.count()
+
 @dataclass(frozen=True)
 class DijkstraDistanceEntry():
     """
@@ -19,92 +51,850 @@ class DijkstraDistanceEntry():
     grafo su cui calcolare i percorsi minimi.
     """
 
+    __slots__ = ("cost", "previous_dpid")
+
     cost: float
     previous_dpid: Optional[int]
     
 
+class ControllerMetrics():
+    """
+    Classe che raccoglie le metriche del controller e le espone nel formato
+    testuale di Prometheus (vedi la rotta /metrics):
+    - la durata di ciascuna fase (costruzione del grafo, calcolo dei percorsi minimi,
+      serializzazione JSON, installazione dei flow) come istogramma, misurata con `timer`;
+    - contatori di eventi (esecuzioni di Dijkstra, hit/miss della cache, rotte installate...),
+      incrementati con `inc`.
+    Le dimensioni attuali (switch, link, alberi in memoria...) sono lette al momento
+    della richiesta e passate a `render`.
+    """
+
+    # Content-Type del formato testuale di Prometheus (text exposition format 0.0.4)
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    # Estremi superiori (in secondi) dei bucket degli istogrammi
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        # Mappa fase -> [conteggi per bucket (l'ultimo è +Inf), numero di misure, somma delle durate]
+        self.durations: Dict[str, List[Any]] = {}
+        # Mappa (nome, etichette) -> valore
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        entry = self.durations.get(stage)
+        if entry is None:
+            entry = self.durations[stage] = [[0] * (len(self.BUCKETS) + 1), 0, 0.0]
+        entry[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        entry[1] += 1
+        entry[2] += seconds
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    @staticmethod
+    def _escape(value: Any) -> str:
+        # Nei valori delle etichette vanno protetti backslash, virgolette e a capo
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @classmethod
+    def _labels(cls, labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join('%s="%s"' % (name, cls._escape(value)) for name, value in labels) + "}"
+
+    def render(self, gauges: Dict[str, Tuple[str, float]]) -> str:
+        """
+        Restituisce tutte le metriche in formato Prometheus; `gauges` associa
+        al nome di ciascuna grandezza istantanea la descrizione e il valore.
+        """
+        lines: List[str] = [
+            "# HELP dijkstra_stage_duration_seconds Durata delle fasi del controller",
+            "# TYPE dijkstra_stage_duration_seconds histogram",
+        ]
+        for stage, (buckets, count, total) in sorted(self.durations.items()):
+            stage = self._escape(stage)
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS + ("+Inf",), buckets):
+                cumulative += n
+                lines.append('dijkstra_stage_duration_seconds_bucket{stage="%s",le="%s"} %d' % (stage, bound, cumulative))
+            lines.append('dijkstra_stage_duration_seconds_sum{stage="%s"} %.9f' % (stage, total))
+            lines.append('dijkstra_stage_duration_seconds_count{stage="%s"} %d' % (stage, count))
+
+        for name in sorted({name for name, _ in self.counters.keys()}):
+            lines.append("# TYPE %s counter" % name)
+            lines.extend(
+                "%s%s %s" % (name, self._labels(labels), value)
+                for (counter, labels), value in sorted(self.counters.items())
+                if counter == name
+            )
+
+        for name, (description, value) in sorted(gauges.items()):
+            lines.extend(("# HELP %s %s" % (name, description), "# TYPE %s gauge" % name, "%s %s" % (name, value)))
+
+        return "\n".join(lines) + "\n"
+
+
+# Metriche condivise da tutte le componenti del controller
+metrics = ControllerMetrics()
+
+
+class CostModel():
+    """
+    Modello di costo dei collegamenti usato da `NetLinkGraph`: dato un link
+    (i due switch e i parametri di connessione ricevuti, oppure None)
+    ne restituisce il costo. Per aggiungere un modello basta estenderla
+    e registrarla in `DijkstraRouter.COST_MODELS`.
+    """
+
+    name = ""
+
+    def link_cost(self, src_dpid: int, dst_dpid: int, params: Optional[Dict[str, Any]]) -> float:
+        raise NotImplementedError
+
+
+class UnitCostModel(CostModel):
+    """
+    Costo unitario per ogni collegamento: i percorsi minimi sono quelli con meno salti.
+    """
+
+    name = "unit"
+
+    def link_cost(self, src_dpid: int, dst_dpid: int, params: Optional[Dict[str, Any]]) -> float:
+        return 1
+
+
+class StaticCostModel(CostModel):
+    """
+    Costo calcolato dai valori nominali di ritardo e banda (vedi `NetLinkGraph.weight_function`).
+    """
+
+    name = "static"
+
+    def link_cost(self, src_dpid: int, dst_dpid: int, params: Optional[Dict[str, Any]]) -> float:
+        return NetLinkGraph.weight_function(params)
+
+
+class CongestionCostModel(StaticCostModel):
+    """
+    Costo nominale corretto con l'utilizzo misurato dei collegamenti: viene moltiplicato
+    per 1 / (1 - u), come il tempo di permanenza in una coda M/M/1 con utilizzo u,
+    e per (1 + `drop_weight` * p), con p la frazione di pacchetti scartati in uscita.
+    Le misure (vedi `observe`) sono mediate esponenzialmente con peso `smoothing`;
+    per ciascun collegamento conta la direzione più carica.
+    """
+
+    name = "congestion"
+
+    def __init__(self, smoothing: float = 0.5, max_utilization: float = 0.99, drop_weight: float = 10.0):
+        self.smoothing = smoothing
+        self.max_utilization = max_utilization
+        self.drop_weight = drop_weight
+        # Mappa (id_src, id_dst) -> utilizzo in [0, 1] / frazione di pacchetti scartati
+        self.utilization: Dict[Tuple[int, int], float] = {}
+        self.drop_rate: Dict[Tuple[int, int], float] = {}
+
+    def observe(self, src_dpid: int, dst_dpid: int, utilization: float, drop_rate: float) -> None:
+        key = (src_dpid, dst_dpid)
+        for values, value in ((self.utilization, utilization), (self.drop_rate, drop_rate)):
+            previous = values.get(key)
+            values[key] = value if previous is None else previous + self.smoothing * (value - previous)
+
+    def link_cost(self, src_dpid: int, dst_dpid: int, params: Optional[Dict[str, Any]]) -> float:
+        utilization = max(self.utilization.get((src_dpid, dst_dpid), 0), self.utilization.get((dst_dpid, src_dpid), 0))
+        drop_rate = max(self.drop_rate.get((src_dpid, dst_dpid), 0), self.drop_rate.get((dst_dpid, src_dpid), 0))
+        utilization = min(max(utilization, 0), self.max_utilization)
+        return super().link_cost(src_dpid, dst_dpid, params) / (1 - utilization) * (1 + self.drop_weight * drop_rate)
+
+
+class ShortestPathTree():
+    """
+    Albero dei cammini minimi radicato in uno switch, in forma compatta:
+    per ciascun indice di switch (vedi `NetLinkGraph.index`) memorizza
+    il costo del percorso (inf se non raggiungibile), l'indice del
+    predecessore e quello del primo hop, cioè del vicino della sorgente
+    da cui passa il percorso (-1 se assenti).
+    I primi hop sono calcolati insieme a costi e predecessori, e aggiornati
+    con essi: il next-hop verso uno switch si legge quindi in O(1).
+    """
+
+    __slots__ = ("dist", "pred", "hop")
+
+    def __init__(self, dist: array, pred: array, hop: array):
+        self.dist = dist
+        self.pred = pred
+        self.hop = hop
+
+
 class NetLinkGraph():
     """
     Classe che memorizza la topologia degli switch di una rete
-    contenente più subnet all'interno di una matrice delle adiacenze.
-    Tale matrice ha come entrate i costi dei collegamenti fra coppie
-    di switch nella topologia.
+    contenente più subnet, in formato CSR (Compressed Sparse Row).
+    Ogni switch è identificato internamente da un indice denso 0..n-1
+    (`index` e `ids` convertono fra dpid e indici): i vicini dello switch i
+    sono `indices[indptr[i]:indptr[i + 1]]`, e i costi dei rispettivi
+    collegamenti occupano le stesse posizioni di `weights`.
+    Gli algoritmi lavorano soltanto sugli indici; i dpid vengono
+    convertiti ai bordi, nei metodi pubblici.
 
-    La funzione interna `weight_function` è usata per calcolare il costo
-    di ciascun collegamento sulla base del loro ritardo di trasmissione e
-    capacità di banda.
+    Il costo di ciascun collegamento è calcolato dal modello di costo `cost_model`
+    (vedi `CostModel`); quello predefinito usa il metodo statico `weight_function`,
+    basato sul ritardo di trasmissione e sulla capacità di banda del collegamento.
     Se tali informazioni sono assenti, si assume il costo unitario.
+
+    Gli alberi dei cammini minimi già calcolati vengono memorizzati e,
+    quando la topologia cambia (`add_switch`, `set_link`, `remove_link`...),
+    aggiornati in modo incrementale invece di essere ricalcolati da zero.
+    Se è specificato `parallel` (vedi `ParallelShortestPaths`), gli alberi di molte
+    sorgenti su grafi grandi vengono calcolati da un pool di processi (`compute_trees`).
     """    
 
-    def __init__(self, parent_app: app_manager.RyuApp, switches: List[Switch], links: Dict[Link, float], connection_parameters={}):
+    # Floyd-Warshall (vettorizzato con NumPy) viene preferito a Dijkstra ripetuto
+    # soltanto su grafi piccoli e densi, in cui il costo O(V^3) è ripagato
+    FLOYD_WARSHALL_MAX_SWITCHES = 512
+    FLOYD_WARSHALL_MIN_DENSITY = 0.25
+
+    def __init__(self, parent_app: app_manager.RyuApp, switches: List[Switch], links: Dict[Link, float], connection_parameters={}, cost_model: Optional[CostModel] = None, parallel: Optional[ParallelShortestPaths] = None):
         self.parent_app = parent_app
+        self.parallel = parallel
+        # La coppia (generation, version), con la seconda incrementata ad ogni modifica
+        # della topologia, identifica il grafo copiato nella memoria condivisa dei processi di `parallel`
+        self.generation = next(_graph_generations)
+        self.version = 0
+        self.cost_model: CostModel = cost_model if cost_model is not None else StaticCostModel()
         self.switch_map: Dict[int, Switch] = { switch.dp.id: switch for switch in switches }
+        self.connection_parameters: Dict[Tuple[int, int], Dict[str, Any]] = connection_parameters
 
-        def weight_function(params: Optional[Dict[str, Any]]) -> float:
-            if params is None:
-                return 1 # Costo Unitario
-            
-            ALPHA, BETA = 1, 1
-            r, C = params["delay"], params["bw"]
-            r = float(r[:-2]) * (10 ** -3) # delay termina in "ms", da scartare; convertito da ms -> s
-            C = float(C) * (10 ** 6)       # convertito da Mbps -> bps
-            return (ALPHA * r) / (BETA * C)
+        # Indice denso di ciascuno switch (inizialmente in ordine di dpid) e viceversa
+        self.ids: List[int] = sorted(self.switch_map.keys())
+        self.index: Dict[int, int] = { dpid: i for i, dpid in enumerate(self.ids) }
 
+        # Mappa indice sorgente -> albero dei cammini minimi (risultato di `dijkstra_tree`)
+        self.shortest_path_trees: Dict[int, ShortestPathTree] = {}
 
-        # Mappa (id_src, id_dst) -> Costo fra i link
-        self.node_adjacency: Dict[Tuple[int, int], float] = defaultdict(lambda: 0)
+        # Lista delle adiacenze temporanea, da cui si ottengono gli array CSR:
+        # sono presenti soltanto gli switch effettivamente adiacenti
+        adjacency: List[Dict[int, float]] = [{} for _ in self.ids]
         for link in links.keys():
             src: Port = link.src
             dst: Port = link.dst
 
+            # Link verso switch non (più) presenti nella topologia
+            if src.dpid not in self.index or dst.dpid not in self.index:
+                continue
+
             # I seguenti corrispondono ai PESI dei collegamenti fra switch ADIACENTI
-            cost = weight_function(connection_parameters.get((src.dpid, dst.dpid), None))
-            print(f"cost between {src.dpid} and {dst.dpid} = {cost}")
-            self.node_adjacency[src.dpid, dst.dpid] = cost
-            self.node_adjacency[dst.dpid, src.dpid] = cost
-        print()
+            cost = self.link_cost(src.dpid, dst.dpid)
+            adjacency[self.index[src.dpid]][self.index[dst.dpid]] = cost
+            adjacency[self.index[dst.dpid]][self.index[src.dpid]] = cost
+
+        self.indptr, self.indices, self.weights = csr_from_adjacency(adjacency)
+
+        if LOG.isEnabledFor(logging.DEBUG):
+            for src_dpid in self.ids:
+                for dst_dpid, cost in self.neighbors(src_dpid).items():
+                    LOG.debug("Lo switch %s raggiunge %s con costo %s", src_dpid, dst_dpid, cost)
+
+
+    @staticmethod
+    def weight_function(params: Optional[Dict[str, Any]]) -> float:
+        if params is None:
+            return 1 # Costo Unitario
+        
+        ALPHA, BETA = 1, 1
+        r, C = params["delay"], params["bw"]
+        r = float(r[:-2]) * (10 ** -3) # delay termina in "ms", da scartare; convertito da ms -> s
+        C = float(C) * (10 ** 6)       # convertito da Mbps -> bps
+        return (ALPHA * r) / (BETA * C)
+
+
+    def link_cost(self, src_dpid: int, dst_dpid: int) -> float:
+        """
+        Metodo che restituisce il costo del collegamento fra i due switch dati,
+        sulla base dei parametri di connessione ricevuti e del modello di costo.
+        """
+        return self.cost_model.link_cost(src_dpid, dst_dpid, self.connection_parameters.get((src_dpid, dst_dpid), None))
+
+
+    def neighbors(self, dpid: int) -> Dict[int, float]:
+        """
+        Metodo che restituisce gli switch adiacenti a `dpid`, ciascuno con il costo del collegamento.
+        """
+        node = self.index.get(dpid)
+        if node is None:
+            return {}
+        return { self.ids[self.indices[k]]: self.weights[k] for k in range(self.indptr[node], self.indptr[node + 1]) }
+
+
+    def _edge(self, u: int, v: int) -> Optional[int]:
+        """
+        Metodo helper che restituisce la posizione negli array CSR del collegamento u -> v, se presente.
+        """
+        for k in range(self.indptr[u], self.indptr[u + 1]):
+            if self.indices[k] == v:
+                return k
+        return None
+
+
+    def _set_edge(self, u: int, v: int, cost: float) -> None:
+        """
+        Metodo helper che aggiorna il costo del collegamento u -> v o, se assente,
+        lo inserisce in coda ai vicini di u, spostando le righe successive.
+        """
+        k = self._edge(u, v)
+        if k is not None:
+            self.weights[k] = cost
+            return
+        k = self.indptr[u + 1]
+        self.indices.insert(k, v)
+        self.weights.insert(k, cost)
+        for i in range(u + 1, len(self.indptr)):
+            self.indptr[i] += 1
+
+
+    def _delete_edge(self, u: int, v: int) -> None:
+        """
+        Metodo helper che rimuove il collegamento u -> v dagli array CSR.
+        """
+        k = self._edge(u, v)
+        if k is None:
+            return
+        del self.indices[k]
+        del self.weights[k]
+        for i in range(u + 1, len(self.indptr)):
+            self.indptr[i] -= 1
+
 
-        # DEBUG CODE
-        for (src_dpid, dst_dpid) in (self.node_adjacency.keys()):
-            print(f"Lo switch {src_dpid} raggiunge {dst_dpid}")
+    def dijkstra_tree(self, source: int) -> ShortestPathTree:
+        """
+        Metodo che calcola l'albero dei cammini minimi radicato nello switch
+        di indice `source`, con Dijkstra sugli array CSR (vedi `csr_dijkstra`):
+        il prossimo switch da esplorare viene estratto da una coda di priorità
+        (heap binario), e le entry ormai obsolete vengono scartate all'estrazione.
+        """
+        metrics.inc("dijkstra_runs_total")
+        return ShortestPathTree(*csr_dijkstra(self.indptr, self.indices, self.weights, source))
 
 
     def dijkstra(self, starting_switch_id: int) -> Dict[int, DijkstraDistanceEntry]:
         """
         Metodo che calcola i percorsi minimi per raggiungere ogni subnet
         della rete a partire dallo switch avente come id `starting_switch_id`.
-        Restituisce un dizionario contenente tutti i risultati ottenuti.
+        Restituisce un dizionario contenente tutti i risultati ottenuti,
+        indicizzato per dpid (gli switch non raggiungibili hanno costo sys.maxsize).
         """
+        source = self.index.get(starting_switch_id)
+        if source is None:
+            return { dpid: DijkstraDistanceEntry(cost=sys.maxsize, previous_dpid=None) for dpid in self.ids }
 
-        distances: Dict[int, DijkstraDistanceEntry] = {
-            id: DijkstraDistanceEntry(
-                cost=(0 if id == starting_switch_id else sys.maxsize),
-                previous_dpid=None
+        tree = self.dijkstra_tree(source)
+        return {
+            self.ids[i]: DijkstraDistanceEntry(
+                cost=cost if cost < INF else sys.maxsize,
+                previous_dpid=self.ids[previous] if previous >= 0 else None,
             )
-            for id in self.switch_map.keys()
+            for i, (cost, previous) in enumerate(zip(tree.dist, tree.pred))
         }
-        to_explore: Set[int] = set(self.switch_map.keys())
-        
-        # Funzione helper che, identificato lo switch con id `switch_id`,
-        # restituisce tutti gli altri switch ad esso adiacente
-        def yield_neighbors_of(switch_id: int):
-            this_switch = self.switch_map[switch_id]
-            for other_switch in self.switch_map.values():
-                if other_switch != this_switch and self.node_adjacency[this_switch.dp.id, other_switch.dp.id]:
-                    yield other_switch
+
+
+    def shortest_path_tree(self, source: int) -> ShortestPathTree:
+        """
+        Metodo che restituisce l'albero dei cammini minimi radicato nello switch di indice
+        `source`, calcolandolo con `dijkstra_tree` soltanto se non è già presente in memoria.
+        """
+        tree = self.shortest_path_trees.get(source)
+        if tree is None:
+            tree = self.dijkstra_tree(source)
+            self.shortest_path_trees[source] = tree
+        return tree
+
+
+    def compute_trees(self, starting_switch_ids: List[int]) -> None:
+        """
+        Metodo che porta in memoria gli alberi dei cammini minimi di tutte le sorgenti
+        in `starting_switch_ids`. Se il grafo ha almeno `parallel.min_switches` switch,
+        quelli mancanti vengono calcolati in parallelo dai processi di `parallel`,
+        attendendoli con `hub.sleep` così da non bloccare la gestione degli eventi OpenFlow;
+        altrimenti (o se il calcolo parallelo non è disponibile) uno alla volta.
+        """
+        sources = { self.index[dpid] for dpid in starting_switch_ids if dpid in self.index }
+        missing = [source for source in sources if source not in self.shortest_path_trees]
+        if self.parallel is not None and len(missing) > 1 and len(self.ids) >= self.parallel.min_switches:
+            version = self.version
+            results = self.parallel.shortest_path_trees((self.generation, version), (self.indptr, self.indices, self.weights), missing, idle=hub.sleep)
+            # Durante l'attesa la topologia potrebbe essere cambiata: i risultati non sarebbero più validi
+            if results is not None and self.version == version:
+                metrics.inc("dijkstra_runs_total", len(results))
+                for source, (dist, pred, hop) in results.items():
+                    self.shortest_path_trees[source] = ShortestPathTree(dist, pred, hop)
+
+        for source in sources:
+            self.shortest_path_tree(source)
+
+
+    def add_switch(self, switch: Switch) -> None:
+        """
+        Metodo che aggiunge alla topologia un nuovo switch, inizialmente isolato:
+        in ogni albero memorizzato risulta quindi non raggiungibile.
+        """
+        dpid = switch.dp.id
+        self.switch_map[dpid] = switch
+        if dpid in self.index:
+            return
+
+        self.version += 1
+        self.index[dpid] = len(self.ids)
+        self.ids.append(dpid)
+        self.indptr.append(self.indptr[-1])
+        for tree in self.shortest_path_trees.values():
+            tree.dist.append(INF)
+            tree.pred.append(-1)
+            tree.hop.append(-1)
+
+
+    def remove_switch(self, dpid: int) -> Set[int]:
+        """
+        Metodo che rimuove dalla topologia lo switch `dpid` insieme a tutti i suoi link.
+        Gli indici degli switch successivi scalano di uno, così che restino densi.
+        Restituisce gli id degli switch sorgente il cui albero è cambiato.
+        """
+        self.switch_map.pop(dpid, None)
+        node = self.index.get(dpid)
+        if node is None:
+            return set()
+
+        changed: Set[int] = set()
+        self.version += 1
+        for neighbor in list(self.neighbors(dpid).keys()):
+            changed |= self.remove_link(dpid, neighbor)
+        changed.discard(dpid)
+
+        # Lo switch è ormai isolato: nessun predecessore vi fa riferimento
+        # e la sua riga negli array CSR è vuota
+        del self.ids[node]
+        self.index = { dpid: i for i, dpid in enumerate(self.ids) }
+        del self.indptr[node]
+        self.indices = array("q", (v - (v > node) for v in self.indices))
+
+        self.shortest_path_trees.pop(node, None)
+        trees: Dict[int, ShortestPathTree] = {}
+        for source, tree in self.shortest_path_trees.items():
+            del tree.dist[node]
+            del tree.pred[node]
+            del tree.hop[node]
+            tree.pred = array("q", (previous - (previous > node) for previous in tree.pred))
+            tree.hop = array("q", (hop - (hop > node) for hop in tree.hop))
+            trees[source - (source > node)] = tree
+        self.shortest_path_trees = trees
+
+        return changed
+
+
+    def set_link(self, src_dpid: int, dst_dpid: int) -> Set[int]:
+        """
+        Metodo che aggiunge (o aggiorna) il collegamento fra due switch.
+        Ogni albero memorizzato viene aggiornato propagando i soli miglioramenti
+        a partire dagli estremi del link; gli alberi che non ne traggono
+        vantaggio non vengono toccati.
+        Restituisce gli id degli switch sorgente il cui albero è cambiato.
+        """
+        u, v = self.index.get(src_dpid), self.index.get(dst_dpid)
+        if u is None or v is None or u == v:
+            return set()
+
+        cost = self.link_cost(src_dpid, dst_dpid)
+        k = self._edge(u, v)
+        old_cost = self.weights[k] if k is not None else None
+        if old_cost == cost:
+            return set()
+
+        # Un aumento di costo equivale alla rimozione seguita dall'inserimento del link
+        self.version += 1
+        changed: Set[int] = set()
+        if old_cost is not None and cost > old_cost:
+            changed |= self.remove_link(src_dpid, dst_dpid)
+
+        self._set_edge(u, v, cost)
+        self._set_edge(v, u, cost)
+
+        for source, tree in self.shortest_path_trees.items():
+            dist, pred = tree.dist, tree.pred
+            seeds: List[int] = []
+            for (a, b) in ((u, v), (v, u)):
+                # Un costo infinito non migliora mai: gli switch non raggiungibili sono esclusi
+                if dist[a] + cost < dist[b]:
+                    dist[b] = dist[a] + cost
+                    pred[b] = a
+                    seeds.append(b)
+            if seeds:
+                self._propagate(source, tree, seeds)
+                changed.add(self.ids[source])
+
+        return changed
+
+
+    def remove_link(self, src_dpid: int, dst_dpid: int) -> Set[int]:
+        """
+        Metodo che rimuove il collegamento fra due switch.
+        Sono ricalcolati soltanto gli alberi in cui il link era effettivamente usato,
+        e di questi soltanto il sottoalbero rimasto scollegato: i suoi nodi ripartono
+        dal miglior vicino esterno al sottoalbero e i costi vengono poi propagati.
+        Restituisce gli id degli switch sorgente il cui albero è cambiato.
+        """
+        u, v = self.index.get(src_dpid), self.index.get(dst_dpid)
+        if u is None or v is None or self._edge(u, v) is None:
+            return set()
+
+        self.version += 1
+        self._delete_edge(u, v)
+        self._delete_edge(v, u)
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+
+        changed: Set[int] = set()
+        for source, tree in self.shortest_path_trees.items():
+            dist, pred = tree.dist, tree.pred
+            if pred[v] == u:
+                child = v
+            elif pred[u] == v:
+                child = u
+            else: # Link non appartenente all'albero, nulla da fare
+                continue
+
+            subtree: Set[int] = {child}
+            to_visit: List[int] = [child]
+            while to_visit:
+                current = to_visit.pop()
+                for k in range(indptr[current], indptr[current + 1]):
+                    neighbor = indices[k]
+                    if neighbor not in subtree and pred[neighbor] == current:
+                        subtree.add(neighbor)
+                        to_visit.append(neighbor)
+
+            seeds: List[int] = []
+            for current in subtree:
+                dist[current], pred[current], tree.hop[current] = INF, -1, -1
+                for k in range(indptr[current], indptr[current + 1]):
+                    neighbor = indices[k]
+                    if neighbor in subtree:
+                        continue
+                    if dist[neighbor] + weights[k] < dist[current]:
+                        dist[current], pred[current] = dist[neighbor] + weights[k], neighbor
+                if dist[current] < INF:
+                    seeds.append(current)
+
+            self._propagate(source, tree, seeds)
+            changed.add(self.ids[source])
+
+        return changed
+
+
+    def _propagate(self, source: int, tree: ShortestPathTree, seeds: List[int]) -> None:
+        """
+        Metodo helper che, a partire dagli switch `seeds` il cui costo è appena
+        diminuito, propaga i miglioramenti nell'albero `tree` come farebbe Dijkstra.
+        Come in `csr_dijkstra`, il primo hop di ogni switch estratto si ricava da
+        quello del predecessore: ogni switch il cui percorso è cambiato viene estratto.
+        """
+        metrics.inc("dijkstra_incremental_updates_total")
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        dist, pred, hop = tree.dist, tree.pred, tree.hop
+        to_explore: List[Tuple[float, int]] = [(dist[seed], seed) for seed in seeds]
+        heapq.heapify(to_explore)
 
         while to_explore:
-            current_switch = min(filter(to_explore.__contains__, distances), key=lambda d: distances.get(d).cost)
-            to_explore.remove(current_switch)
-            for neighboring_switch in yield_neighbors_of(current_switch):
-                if neighboring_switch.dp.id not in to_explore: # Già visitato!
+            current_cost, current_switch = heapq.heappop(to_explore)
+            if current_cost > dist[current_switch]: # Entry obsoleta
+                continue
+            previous = pred[current_switch]
+            hop[current_switch] = current_switch if previous == source else hop[previous]
+
+            for k in range(indptr[current_switch], indptr[current_switch + 1]):
+                neighboring_switch = indices[k]
+                new_cost = current_cost + weights[k]
+                if new_cost < dist[neighboring_switch]:
+                    dist[neighboring_switch] = new_cost
+                    pred[neighboring_switch] = current_switch
+                    heapq.heappush(to_explore, (new_cost, neighboring_switch))
+
+
+    def next_hops(self, starting_switch_id: int) -> Dict[int, int]:
+        """
+        Metodo che, a partire dall'albero dei cammini minimi, restituisce per ogni
+        switch raggiungibile da `starting_switch_id` il primo switch da attraversare
+        lungo il percorso ottimale (il next-hop).
+        I primi hop sono già calcolati insieme all'albero (vedi `ShortestPathTree`):
+        qui vengono soltanto convertiti in dpid, omettendo gli switch non raggiungibili.
+        """
+        source = self.index.get(starting_switch_id)
+        if source is None:
+            return {}
+        ids = self.ids
+        return { ids[node]: ids[hop] for node, hop in enumerate(self.shortest_path_tree(source).hop) if hop >= 0 }
+
+
+    def multipath_next_hops(self, starting_switch_id: int, stretch: float = 1.0, max_paths: Optional[int] = None) -> Dict[int, List[int]]:
+        """
+        Metodo che restituisce per ogni switch raggiungibile da `starting_switch_id`
+        la lista dei next-hop utilizzabili per raggiungerlo, a partire da quello
+        scelto da `next_hops` e poi in ordine di costo del percorso.
+
+        Con `stretch` pari a 1 si considerano i soli percorsi di costo minimo (ECMP):
+        i predecessori di ciascuno switch sono tutti i vicini che lo raggiungono
+        con lo stesso costo minimo, e i next-hop di uno switch sono l'unione di
+        quelli dei suoi predecessori.
+        Con `stretch` maggiore di 1 un vicino è ammesso se il percorso che lo attraversa
+        costa al più `stretch` volte il minimo e se il vicino è strettamente più vicino
+        alla destinazione (condizione "downstream"), così che i percorsi restino privi di cicli.
+        `max_paths` limita il numero di next-hop per destinazione.
+        """
+        source = self.index.get(starting_switch_id)
+        if source is None:
+            return {}
+
+        if stretch <= 1:
+            multipath = self._equal_cost_next_hops(source)
+        else:
+            multipath = self._bounded_stretch_next_hops(source, stretch)
+
+        ids = self.ids
+        return {
+            ids[node]: [ids[hop] for hop in first_hops[:max_paths]]
+            for node, first_hops in multipath.items()
+        }
+
+
+    def _equal_cost_next_hops(self, source: int) -> Dict[int, List[int]]:
+        """
+        Metodo helper per `multipath_next_hops` con percorsi di costo minimo:
+        gli insiemi dei predecessori si ricavano dalle distanze dell'albero dei cammini
+        minimi e gli switch vengono visitati in ordine di costo crescente.
+        """
+        tree = self.shortest_path_tree(source)
+        dist, pred, hop = tree.dist, tree.pred, tree.hop
+        multipath: Dict[int, List[int]] = {}
+
+        reachable = [node for node in range(len(hop)) if hop[node] >= 0]
+        for node in sorted(reachable, key=lambda node: dist[node]):
+            first_hops: List[int] = [hop[node]]
+            for k in range(self.indptr[node], self.indptr[node + 1]):
+                neighbor = self.indices[k]
+                # Oltre al predecessore dell'albero, sono ammessi soltanto i vicini strettamente
+                # più vicini alla sorgente: con link di costo nullo si formerebbero cicli
+                if neighbor != pred[node] and not dist[neighbor] < dist[node]:
                     continue
+                if not math.isclose(dist[neighbor] + self.weights[k], dist[node], rel_tol=1e-9):
+                    continue
+                if neighbor == source:
+                    candidates = [node]
+                else:
+                    candidates = multipath.get(neighbor, [hop[neighbor]])
+                first_hops.extend(candidate for candidate in candidates if candidate not in first_hops)
+            multipath[node] = first_hops
+
+        return multipath
+
+
+    def _bounded_stretch_next_hops(self, source: int, stretch: float) -> Dict[int, List[int]]:
+        """
+        Metodo helper per `multipath_next_hops` con percorsi di costo limitato:
+        le distanze dei vicini dalle destinazioni si leggono dai loro alberi dei
+        cammini minimi (il grafo non è orientato).
+        """
+        tree = self.shortest_path_tree(source)
+        dist, hop = tree.dist, tree.hop
+        neighbor_trees = {
+            self.indices[k]: (self.weights[k], self.shortest_path_tree(self.indices[k]).dist)
+            for k in range(self.indptr[source], self.indptr[source + 1])
+        }
+        multipath: Dict[int, List[int]] = {}
+
+        for node, primary in enumerate(hop):
+            if primary < 0: # Switch non raggiungibile (o sorgente)
+                continue
+            best = dist[node]
+            candidates: List[Tuple[float, int]] = []
+            for neighbor, (link_cost, neighbor_dist) in neighbor_trees.items():
+                remaining = neighbor_dist[node]
+                if neighbor == primary or not remaining < best:
+                    continue
+                if link_cost + remaining <= stretch * best * (1 + 1e-9):
+                    candidates.append((link_cost + remaining, neighbor))
+            multipath[node] = [primary] + [neighbor for _, neighbor in sorted(candidates)]
+
+        return multipath
+
+
+    def floyd_warshall_next_hops(self, starting_switch_ids: List[int]) -> Dict[int, Dict[int, int]]:
+        """
+        Metodo che calcola i percorsi minimi fra tutte le coppie di switch
+        mediante l'algoritmo di Floyd-Warshall, vettorizzato con NumPy,
+        e restituisce la tabella dei next-hop di ciascuno switch in `starting_switch_ids`.
+        """
+        ids = self.ids
+        n = len(ids)
+
+        # Le matrici si riempiono direttamente dagli array CSR
+        rows = np.repeat(np.arange(n), np.diff(np.array(self.indptr, dtype=np.int64)))
+        cols = np.array(self.indices, dtype=np.int64)
+        dist = np.full((n, n), np.inf)
+        np.fill_diagonal(dist, 0)
+        nxt = np.full((n, n), -1, dtype=np.int64)
+        dist[rows, cols] = np.array(self.weights, dtype=np.float64)
+        nxt[rows, cols] = cols
+
+        for k in range(n):
+            via_k = dist[:, k, None] + dist[None, k, :]
+            better = via_k < dist
+            dist = np.where(better, via_k, dist)
+            nxt = np.where(better, nxt[:, k, None], nxt)
+
+        tables: Dict[int, Dict[int, int]] = {}
+        for switch_id in starting_switch_ids:
+            if switch_id not in self.index:
+                tables[switch_id] = {}
+                continue
+            i = self.index[switch_id]
+            tables[switch_id] = {
+                ids[j]: ids[hop]
+                for j, hop in enumerate(nxt[i].tolist())
+                if hop >= 0 and j != i
+            }
+        return tables
+
+
+    def all_pairs_next_hops(self, starting_switch_ids: List[int], method: str = "auto") -> Dict[int, Dict[int, int]]:
+        """
+        Metodo che calcola in un unico passaggio le tabelle dei next-hop
+        di tutti gli switch in `starting_switch_ids`.
+        Con `method="auto"` si sceglie Floyd-Warshall su grafi piccoli e densi
+        (se NumPy è disponibile), altrimenti Dijkstra ripetuto per ogni sorgente;
+        `method` può anche valere esplicitamente "dijkstra" o "floyd_warshall".
+        Se gli alberi di tutte le sorgenti sono già in memoria, vengono riusati.
+        """
+        if method == "auto" and all(self.index.get(switch_id) in self.shortest_path_trees for switch_id in starting_switch_ids):
+            method = "dijkstra"
+
+        if method == "auto":
+            n = len(self.ids)
+            density = len(self.indices) / (n * (n - 1)) if n > 1 else 0
+            dense = n <= self.FLOYD_WARSHALL_MAX_SWITCHES and density >= self.FLOYD_WARSHALL_MIN_DENSITY
+            method = "floyd_warshall" if np is not None and dense else "dijkstra"
+
+        if method == "floyd_warshall":
+            return self.floyd_warshall_next_hops(starting_switch_ids)
+        self.compute_trees(starting_switch_ids)
+        return {
+            switch_id: self.next_hops(starting_switch_id=switch_id)
+            for switch_id in set(starting_switch_ids)
+        }
+
+
+class _PrefixNode():
+    """
+    Nodo del trie binario dei prefissi usato da `compile_routes`.
+    """
+
+    __slots__ = ("hop", "children", "base")
+
+    def __init__(self, hop: Optional[str] = None):
+        self.hop = hop # gateway della rotta per questo prefisso, se presente
+        self.children: List[Optional["_PrefixNode"]] = [None, None]
+        # Gateway ereditato -> numero minimo di rotte nel sottoalbero, senza una rotta per questo nodo
+        self.base: Dict[Optional[str], float] = {}
+
+
+def compile_routes(routes: Dict[str, str]) -> Dict[str, str]:
+    """
+    Funzione che riduce la tabella di routing di uno switch (mappa subnet di
+    destinazione -> gateway) ad un insieme minimo di prefissi equivalente con
+    la regola del prefisso più lungo: ogni indirizzo viene inoltrato allo stesso
+    gateway di prima e gli indirizzi senza rotta restano senza rotta.
+
+    L'algoritmo segue i tre passaggi di ORTC (Optimal Routing Table Constructor)
+    sul trie binario dei prefissi:
+    1. il trie viene normalizzato, dall'alto verso il basso: ogni nodo interno ha
+       due figli e ogni foglia riceve il gateway (o l'assenza di rotta) che le
+       assegna la tabella originale;
+    2. dal basso verso l'alto si calcola, per ogni nodo e per ogni gateway ereditato
+       dal prefisso più specifico che lo contiene, il numero minimo di rotte nel
+       sottoalbero;
+    3. dall'alto verso il basso si sceglie in quali nodi inserire una rotta, e con
+       quale gateway, seguendo il minimo calcolato.
+    A differenza di ORTC, che tratta l'assenza di rotta come un gateway qualsiasi,
+    qui non si possono inserire rotte "nulle" (un flow non può far ricadere un
+    pacchetto sui flow di priorità inferiore): il secondo passaggio calcola quindi
+    il costo esatto per ciascun gateway ereditato, invece dei soli insiemi di gateway
+    ottimi, e un'area senza rotta resta tale soltanto se nessun prefisso che la
+    contiene riceve una rotta.
+    """
+    compiled: Dict[str, str] = {}
+    if not routes:
+        return compiled
+    networks = [ipaddress.ip_network(destination) for destination in routes.keys()]
+
+    for version in sorted({ network.version for network in networks }):
+        root = _PrefixNode()
+        network_type, bits = (ipaddress.IPv4Network, 32) if version == 4 else (ipaddress.IPv6Network, 128)
+        for network, gateway in zip(networks, routes.values()):
+            if network.version != version:
+                continue
+            node, value = root, int(network.network_address)
+            for depth in range(network.prefixlen):
+                bit = (value >> (bits - 1 - depth)) & 1
+                if node.children[bit] is None:
+                    node.children[bit] = _PrefixNode()
+                node = node.children[bit]
+            node.hop = gateway
+
+        gateways = sorted({ gateway for network, gateway in zip(networks, routes.values()) if network.version == version })
+        hops: List[Optional[str]] = [None] + gateways
+
+        def _normalize(node: _PrefixNode, inherited: Optional[str]) -> None:
+            # Primo passaggio: le foglie ricevono il gateway effettivo (None: nessuna rotta)
+            node.hop = node.hop if node.hop is not None else inherited
+            if node.children == [None, None]:
+                return
+            for bit in (0, 1):
+                if node.children[bit] is None:
+                    node.children[bit] = _PrefixNode()
+                _normalize(node.children[bit], node.hop)
 
-                new_cost = distances[current_switch].cost + self.node_adjacency[current_switch, neighboring_switch.dp.id]
-                if new_cost < distances[neighboring_switch.dp.id].cost:
-                    distances[neighboring_switch.dp.id] = DijkstraDistanceEntry(cost=new_cost, previous_dpid=current_switch)
+        def _cost(node: _PrefixNode) -> Dict[Optional[str], float]:
+            # Secondo passaggio: costo minimo del sottoalbero per ciascun gateway ereditato
+            if node.children == [None, None]:
+                return { hop: 0 if hop == node.hop else (1 if node.hop is not None else math.inf) for hop in hops }
+            left, right = _cost(node.children[0]), _cost(node.children[1])
+            node.base = { hop: left[hop] + right[hop] for hop in hops }
+            with_route = 1 + min(node.base[gateway] for gateway in gateways)
+            return { hop: min(node.base[hop], with_route) for hop in hops }
 
-        return distances
+        def _select(node: _PrefixNode, inherited: Optional[str], value: int, depth: int) -> None:
+            # Terzo passaggio: una rotta viene inserita solo se riduce il numero totale
+            if node.children == [None, None]:
+                hop = node.hop
+            else:
+                best = min(gateways, key=lambda gateway: node.base[gateway])
+                hop = inherited if node.base[inherited] <= 1 + node.base[best] else best
+            if hop != inherited:
+                compiled[str(network_type((value << (bits - depth), depth)))] = hop
+            if node.children != [None, None]:
+                _select(node.children[0], hop, value << 1, depth + 1)
+                _select(node.children[1], hop, (value << 1) | 1, depth + 1)
+
+        _normalize(root, None)
+        _cost(root)
+        _select(root, None, 0, 0)
+
+    return compiled
 
 
 class DijkstraRouter(RestRouterAPI):
@@ -113,40 +903,613 @@ class DijkstraRouter(RestRouterAPI):
     Estende la classe `RestRouterAPI` che implementa le funzionalità del server REST
     incluso insieme al codice di libreria di ryu, introducendo due nuove rotte descritte
     in `DijkstraCommand` per consentire il routing dinamico mediante algoritmo di Dijkstra.
+
+    Dopo la prima richiesta a /dijkstra, il controller mantiene un grafo "vivo"
+    aggiornato tramite gli eventi di ryu.topology: ad ogni cambiamento vengono
+    ricalcolate le rotte dei soli switch coinvolti e installate soltanto le
+    rotte effettivamente cambiate.
     """
 
     _CONTEXTS = { 'wsgi': WSGIApplication }
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
 
+    # Le rotte a percorsi multipli sono flow che rimandano a un gruppo select, con priorità
+    # superiore a quelle installate da rest_router (2 + netmask) per la stessa destinazione
+    # ma inferiore alla gestione dei pacchetti diretti al router stesso (oltre 1000).
+    # La parte alta del cookie è fuori dall'intervallo dei VLAN id che rest_router vi codifica.
+    MULTIPATH_PRIORITY = 100
+    MULTIPATH_COOKIE = 0xECB0 << 32
+
+    # Le rotte compilate (vedi `compile_routes`) sono installate direttamente come flow,
+    # inviando a ciascuno switch i FlowMod seguiti da una barrier.
+    # La loro fascia di priorità (50 + netmask) è distinta da quella delle rotte statiche di
+    # rest_router (2 + netmask, al più 34), così che un FlowMod con lo stesso match non ne
+    # sostituisca mai un flow (che `clear_compiled` rimuoverebbe poi insieme ai propri),
+    # ed inferiore a quella delle rotte a percorsi multipli, che restano prioritarie.
+    # Le rotte compilate non coprono mai le subnet direttamente collegate allo switch
+    # (assenti dalla tabella di routing), gestite da rest_router con priorità 35 e 36.
+    # Il cookie, come quello dei gruppi, è fuori dall'intervallo dei VLAN id di rest_router:
+    # FlowMod di rimozione e `clear_compiled` agiscono soltanto sui flow che lo riportano.
+    COMPILED_PRIORITY = 50
+    COMPILED_COOKIE = 0xC0DE << 32
+    COOKIE_MASK = 0xFFFF << 32
+
+    # Modelli di costo selezionabili con il campo "cost_model" della richiesta a /dijkstra
+    COST_MODELS = { model.name: model for model in (UnitCostModel, StaticCostModel, CongestionCostModel) }
+    # Con il modello "congestion" le statistiche delle porte vengono richieste ogni
+    # PORT_STATS_INTERVAL secondi; le rotte vengono ricalcolate quando il costo di un
+    # collegamento si discosta di oltre COST_CHANGE_THRESHOLD (relativo) da quello in uso
+    PORT_STATS_INTERVAL = 5
+    COST_CHANGE_THRESHOLD = 0.25
+
+    # Processi per il calcolo parallelo degli alberi dei cammini minimi (1: disattivato),
+    # usati soltanto su grafi di almeno PARALLEL_MIN_SWITCHES switch
+    PARALLEL_WORKERS = os.cpu_count() or 1
+    PARALLEL_MIN_SWITCHES = 256
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.net_graph: Optional[NetLinkGraph] = None
+        # Ultimi dati ricevuti da /dijkstra ("networks" e "links"),
+        # necessari per ricostruire le rotte dopo un evento
+        self.route_request: Optional[Dict[str, Any]] = None
+        # Mappa (switch_id, subnet di destinazione) -> gateway
+        self.route_table: Dict[Tuple[int, str], str] = {}
+        # Mappa (switch_id, subnet di destinazione) -> gateway delle rotte a percorsi multipli
+        self.multipath_table: Dict[Tuple[int, str], Tuple[str, ...]] = {}
+        # Mappa (switch_id, subnet di destinazione) -> id del gruppo select installato
+        self.multipath_groups: Dict[Tuple[int, str], int] = {}
+        self.next_group_id = 1
+        # Mappa switch_id -> (prefisso -> gateway) delle rotte compilate installate
+        self.compiled_table: Dict[int, Dict[str, str]] = {}
+        # Mappa (switch_id, xid della barrier) -> istante di invio, per misurare l'installazione
+        self.pending_barriers: Dict[Tuple[int, int], float] = {}
+
+        # Un'istanza per modello di costo: le misure raccolte sopravvivono alla ricostruzione del grafo
+        self.cost_models: Dict[str, CostModel] = { name: model() for name, model in self.COST_MODELS.items() }
+        # Mappa (dpid, porta) -> (istante, byte, pacchetti e pacchetti scartati in uscita) dell'ultima lettura
+        self.port_counters: Dict[Tuple[int, int], Tuple[float, int, int, int]] = {}
+        self.stats_thread = hub.spawn(self._poll_port_stats)
+        self.parallel_paths: Optional[ParallelShortestPaths] = (
+            ParallelShortestPaths(workers=self.PARALLEL_WORKERS, min_switches=self.PARALLEL_MIN_SWITCHES)
+            if self.PARALLEL_WORKERS > 1 else None
+        )
+
         wsgi = kwargs['wsgi']
         wsgi.register(DijkstraCommand, {
             "app": self # Necessario per consentire al controller di
             # ricevere dati sulla topologia tramite l'API ryu.topology
         })
 
+    def live_graph(self, connection_parameters: Dict[Tuple[int, int], Dict[str, Any]], cost_model: Optional[CostModel] = None) -> NetLinkGraph:
+        """
+        Restituisce il grafo della topologia mantenuto dal controller,
+        ricostruendolo da zero soltanto se non esiste ancora o se i
+        parametri di connessione o il modello di costo sono cambiati.
+        """
+        cost_model = cost_model if cost_model is not None else self.cost_models[StaticCostModel.name]
+        if self.net_graph is None or self.net_graph.connection_parameters != connection_parameters or self.net_graph.cost_model is not cost_model:
+            with metrics.timer("graph_build"):
+                self.net_graph = NetLinkGraph(
+                    parent_app=self,
+                    switches=get_all_switch(self),
+                    links=get_all_link(self),
+                    connection_parameters=connection_parameters,
+                    cost_model=cost_model,
+                    parallel=self.parallel_paths,
+                )
+        return self.net_graph
+
+    def close(self):
+        if self.parallel_paths is not None:
+            self.parallel_paths.shutdown()
+        super().close()
+
+    def _poll_port_stats(self):
+        """
+        Thread che richiede periodicamente le statistiche delle porte a tutti gli switch,
+        quando il grafo usa un modello di costo basato sulle misure.
+        """
+        while True:
+            hub.sleep(self.PORT_STATS_INTERVAL)
+            if self.net_graph is None or not isinstance(self.net_graph.cost_model, CongestionCostModel):
+                continue
+            for switch in list(self.net_graph.switch_map.values()):
+                datapath = switch.dp
+                datapath.send_msg(datapath.ofproto_parser.OFPPortStatsRequest(datapath, 0, datapath.ofproto.OFPP_ANY))
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def port_stats_reply_handler(self, ev):
+        """
+        Ricava dai contatori delle porte di uno switch l'utilizzo e la frazione di
+        pacchetti scartati di ciascun collegamento uscente nell'ultimo intervallo,
+        li comunica al modello di costo e aggiorna i costi dei collegamenti.
+        """
+        net_graph = self.net_graph
+        if net_graph is None or not isinstance(net_graph.cost_model, CongestionCostModel):
+            return
+
+        dpid = ev.msg.datapath.id
+        neighbors: Dict[int, int] = { link.src.port_no: link.dst.dpid for link in get_all_link(self).keys() if link.src.dpid == dpid }
+        now = time.monotonic()
+
+        for stat in ev.msg.body:
+            key = (dpid, stat.port_no)
+            previous = self.port_counters.get(key)
+            self.port_counters[key] = (now, stat.tx_bytes, stat.tx_packets, stat.tx_dropped)
+            neighbor = neighbors.get(stat.port_no)
+            if previous is None or neighbor is None:
+                continue
+
+            elapsed = now - previous[0]
+            sent_bytes, sent, dropped = stat.tx_bytes - previous[1], stat.tx_packets - previous[2], stat.tx_dropped - previous[3]
+            if elapsed <= 0 or min(sent_bytes, sent, dropped) < 0: # Contatori azzerati (e.g. switch riconnesso)
+                continue
+
+            params = net_graph.connection_parameters.get((dpid, neighbor))
+            utilization = sent_bytes * 8 / elapsed / (float(params["bw"]) * 10 ** 6) if params else 0.0
+            drop_rate = dropped / (sent + dropped) if sent + dropped > 0 else 0.0
+            net_graph.cost_model.observe(dpid, neighbor, utilization, drop_rate)
+
+        self.refresh_link_costs(dpid)
+
+    def refresh_link_costs(self, dpid: int):
+        """
+        Ricalcola il costo dei collegamenti dello switch `dpid` e, per quelli che si
+        discostano da quello in uso oltre la soglia COST_CHANGE_THRESHOLD, aggiorna il
+        grafo e installa le rotte cambiate. Le variazioni minori vengono ignorate, così
+        che piccole oscillazioni del traffico non provochino continue modifiche delle rotte.
+        """
+        changed: Set[int] = set()
+        updated = False
+        for neighbor, current_cost in self.net_graph.neighbors(dpid).items():
+            cost = self.net_graph.link_cost(dpid, neighbor)
+            if abs(cost - current_cost) > self.COST_CHANGE_THRESHOLD * current_cost:
+                changed |= self.net_graph.set_link(dpid, neighbor)
+                updated = True
+
+        if updated:
+            DijkstraCommand.invalidate_cache()
+            self.update_routes(changed)
+
+    @staticmethod
+    def multipath_routes(routes: List[Dict[str, Any]]) -> Dict[Tuple[int, str], Tuple[str, ...]]:
+        return {
+            (entry["switch_id"], entry["destination"]): tuple(entry["gateways"])
+            for entry in routes
+            if len(entry.get("gateways", ())) > 1
+        }
+
+    def remember_routes(self, networks: List[Dict[str, Any]], links: List[Dict[str, Any]], routes: List[Dict[str, Any]], multipath: Optional[Dict[str, Any]] = None, compile: bool = False):
+        """
+        Memorizza le rotte appena calcolate per /dijkstra, in modo da poter
+        installare in seguito soltanto le differenze.
+        Le rotte con più gateway vengono installate subito come gruppi select;
+        quelle con un solo gateway sono applicate dal client tramite /router/batch
+        oppure, con `compile`, compilate ed installate direttamente dal controller.
+        """
+        self.route_request = { "networks": networks, "links": links, "multipath": multipath, "compile": compile }
+        self.route_table = { (entry["switch_id"], entry["destination"]): entry["gateway"] for entry in routes }
+
+        if compile:
+            self.install_compiled({ switch_id for switch_id, _ in self.route_table.keys() } | set(self.compiled_table.keys()))
+        elif self.compiled_table:
+            self.clear_compiled()
+
+        new_multipath = self.multipath_routes(routes)
+        self.install_multipath(
+            to_add={ key: gateways for key, gateways in new_multipath.items() if self.multipath_table.get(key) != gateways },
+            to_remove=[key for key in self.multipath_table.keys() if key not in new_multipath],
+        )
+        self.multipath_table = new_multipath
+
+        # Gli alberi delle sorgenti devono essere in memoria per poter essere aggiornati
+        self.net_graph.compute_trees([network["switch_id"] for network in networks])
+
+    def update_routes(self, switch_ids: Set[int]):
+        """
+        Ricalcola le rotte dei soli switch in `switch_ids` e installa
+        le differenze rispetto alla tabella precedente.
+        Con le rotte a percorsi multipli si ricalcolano invece quelle di tutti gli switch:
+        un link può essere un percorso alternativo anche senza comparire in alcun albero.
+        """
+        if self.net_graph is None or self.route_request is None:
+            return
+        if self.route_request["multipath"] is not None:
+            switch_ids = { network["switch_id"] for network in self.route_request["networks"] }
+        if not switch_ids:
+            return
+
+        with metrics.timer("shortest_path"):
+            routes = DijkstraCommand.route_entries(
+                net_graph=self.net_graph,
+                networks=self.route_request["networks"],
+                links=self.route_request["links"],
+                switch_ids=switch_ids,
+                multipath=self.route_request["multipath"],
+            )
+
+        new_routes = { (entry["switch_id"], entry["destination"]): entry["gateway"] for entry in routes }
+        old_routes = { key: gateway for key, gateway in self.route_table.items() if key[0] in switch_ids }
+        to_remove = [key for key, gateway in old_routes.items() if new_routes.get(key) != gateway]
+        to_add = { key: gateway for key, gateway in new_routes.items() if old_routes.get(key) != gateway }
+
+        if not self.route_request["compile"]:
+            self.install_routes(to_add=to_add, to_remove=to_remove)
+        for key in to_remove:
+            self.route_table.pop(key, None)
+        self.route_table.update(to_add)
+        if self.route_request["compile"]:
+            self.install_compiled({ switch_id for switch_id, _ in to_remove } | { switch_id for switch_id, _ in to_add.keys() })
+
+        new_multipath = self.multipath_routes(routes)
+        old_multipath = { key: gateways for key, gateways in self.multipath_table.items() if key[0] in switch_ids }
+        to_remove = [key for key in old_multipath.keys() if key not in new_multipath]
+        to_add = { key: gateways for key, gateways in new_multipath.items() if old_multipath.get(key) != gateways }
+
+        self.install_multipath(to_add=to_add, to_remove=to_remove)
+        for key in to_remove:
+            self.multipath_table.pop(key, None)
+        self.multipath_table.update(to_add)
+
+    @metrics.timer("flow_install") # il context manager si usa anche come decoratore
+    def install_routes(self, to_add: Dict[Tuple[int, str], str], to_remove: List[Tuple[int, str]], addresses: Optional[List[Tuple[int, str]]] = None) -> Dict[str, Any]:
+        """
+        Applica direttamente ai router di `RestRouterAPI` le modifiche alle tabelle
+        di routing, senza passare dall'API REST: prima si assegnano gli indirizzi,
+        poi si rimuovono le rotte obsolete (incluse quelle il cui gateway è cambiato),
+        infine si aggiungono le nuove.
+        Restituisce un riepilogo delle operazioni svolte e di quelle fallite.
+        """
+        result: Dict[str, Any] = { "addresses": 0, "removed": 0, "added": 0, "failed": [] }
+
+        def _apply(switch_id: int, param: Dict[str, Any], method: str) -> bool:
+            router = RouterController._ROUTER_LIST.get(switch_id)
+            if router is None:
+                result["failed"].append({ "switch_id": switch_id, **param, "error": "unknown switch" })
+                return False
+            try:
+                response = getattr(router, method)(VLANID_NONE, param, self.waiters)
+            except Exception as e:
+                error = str(e)
+            else:
+                # Molti errori (indirizzo non valido, gateway irraggiungibile, rotta duplicata...)
+                # non sollevano eccezioni: rest_router li riporta come risultato REST_NG
+                errors = [msg.get(REST_DETAILS, "") for msg in response.get(REST_COMMAND_RESULT, []) if msg.get(REST_RESULT) == REST_NG]
+                if not errors:
+                    return True
+                error = "; ".join(errors)
+            self.logger.warning("Operazione %s %s fallita sullo switch %s: %s", method, param, switch_id, error)
+            result["failed"].append({ "switch_id": switch_id, **param, "error": error })
+            return False
+
+        for switch_id, address in addresses or []:
+            result["addresses"] += _apply(switch_id, { "address": address }, "set_data")
+
+        for switch_id, destination in to_remove:
+            router = RouterController._ROUTER_LIST.get(switch_id)
+            if router is None or VLANID_NONE not in router:
+                continue
+            installed = router[VLANID_NONE].routing_tbl.get(destination)
+            if installed is not None:
+                result["removed"] += _apply(switch_id, { "route_id": installed.route_id }, "delete_data")
+
+        for (switch_id, destination), gateway in to_add.items():
+            result["added"] += _apply(switch_id, { "destination": destination, "gateway": gateway }, "set_data")
+
+        metrics.inc("routes_installed_total", result["added"], kind="unicast")
+        metrics.inc("routes_removed_total", result["removed"], kind="unicast")
+        metrics.inc("route_install_failures_total", len(result["failed"]))
+        self.logger.info("Rotte aggiornate: %d aggiunte, %d rimosse", result["added"], result["removed"])
+        return result
+
+    @metrics.timer("flow_install")
+    def install_multipath(self, to_add: Dict[Tuple[int, str], Tuple[str, ...]], to_remove: List[Tuple[int, str]]):
+        """
+        Installa le rotte a percorsi multipli come gruppi OpenFlow 1.3 di tipo select:
+        lo switch sceglie il bucket (cioè il next-hop) in base all'hash dei campi di
+        ciascun flusso, così che i pacchetti di uno stesso flusso seguano sempre lo stesso
+        percorso. Ogni bucket riscrive gli indirizzi MAC come le rotte di rest_router
+        (quelli delle porte del link, noti da ryu.topology) e ne osserva la porta di uscita,
+        venendo escluso se questa non è attiva.
+        Un flow per ciascuna destinazione rimanda al gruppo; rimuovendo la rotta
+        vengono eliminati sia il flow che il gruppo.
+        """
+        if not to_add and not to_remove:
+            return
+
+        gateway_links = self.gateway_links()
+
+        for key in to_remove:
+            group_id = self.multipath_groups.pop(key, None)
+            switch = self.net_graph.switch_map.get(key[0])
+            if group_id is not None and switch is not None:
+                self._delete_multipath(switch.dp, group_id)
+
+        for key, gateways in to_add.items():
+            switch_id, destination = key
+            switch = self.net_graph.switch_map.get(switch_id)
+            if switch is None:
+                continue
+            datapath = switch.dp
+            ofp, parser = datapath.ofproto, datapath.ofproto_parser
+
+            buckets = [
+                parser.OFPBucket(weight=1, watch_port=link.src.port_no, watch_group=ofp.OFPG_ANY, actions=self.next_hop_actions(parser, link))
+                for link in (gateway_links.get((switch_id, gateway)) for gateway in gateways)
+                if link is not None
+            ]
+
+            group_id = self.multipath_groups.get(key)
+            if len(buckets) < 2: # Resta soltanto la rotta di rest_router
+                if group_id is not None:
+                    self._delete_multipath(datapath, self.multipath_groups.pop(key))
+                continue
+
+            if group_id is None:
+                group_id = self.multipath_groups[key] = self.next_group_id
+                self.next_group_id += 1
+                command = ofp.OFPGC_ADD
+            else:
+                command = ofp.OFPGC_MODIFY
+            datapath.send_msg(parser.OFPGroupMod(datapath, command, ofp.OFPGT_SELECT, group_id, buckets))
+
+            network = ipaddress.ip_network(destination)
+            datapath.send_msg(parser.OFPFlowMod(
+                datapath,
+                cookie=self.MULTIPATH_COOKIE | group_id,
+                command=ofp.OFPFC_ADD,
+                priority=self.MULTIPATH_PRIORITY + network.prefixlen,
+                match=parser.OFPMatch(eth_type=0x0800, ipv4_dst=(str(network.network_address), str(network.netmask))),
+                instructions=[parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, [parser.OFPActionGroup(group_id)])],
+            ))
+
+        metrics.inc("routes_installed_total", len(to_add), kind="multipath")
+        metrics.inc("routes_removed_total", len(to_remove), kind="multipath")
+        self.logger.info("Rotte multipath aggiornate: %d installate, %d rimosse", len(to_add), len(to_remove))
+
+    def gateway_links(self) -> Dict[Tuple[int, str], Link]:
+        """
+        Mappa (switch_id, indirizzo del gateway) -> collegamento di ryu.topology
+        verso lo switch vicino raggiunto tramite quel gateway.
+        """
+        topology_links: Dict[Tuple[int, int], Link] = { (link.src.dpid, link.dst.dpid): link for link in get_all_link(self) }
+        gateway_links: Dict[Tuple[int, str], Link] = {}
+        for entry in self.route_request["links"]:
+            link = topology_links.get((int(entry["src_switch"]["id"]), int(entry["dst_switch"]["id"])))
+            if link is not None:
+                gateway_links[int(entry["src_switch"]["id"]), entry["dst_switch"]["ip_addr"]] = link
+        return gateway_links
+
+    @staticmethod
+    def next_hop_actions(parser, link: Link) -> List[Any]:
+        """
+        Azioni che inoltrano un pacchetto IP sul collegamento `link`, riscrivendo gli
+        indirizzi MAC come le rotte di rest_router (quelli delle porte, noti da ryu.topology).
+        """
+        return [
+            parser.OFPActionDecNwTtl(),
+            parser.OFPActionSetField(eth_src=link.src.hw_addr),
+            parser.OFPActionSetField(eth_dst=link.dst.hw_addr),
+            parser.OFPActionOutput(link.src.port_no),
+        ]
+
+    def send_batch(self, datapath, msgs: List[Any]):
+        """
+        Invia i messaggi `msgs` allo switch, in ordine, seguiti da una barrier:
+        la risposta, gestita da `barrier_reply_handler`, conferma che lo switch
+        li ha applicati tutti.
+        """
+        for msg in msgs:
+            datapath.send_msg(msg)
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        # xid assegnato prima dell'invio, così che la risposta trovi sempre la barrier registrata
+        datapath.set_xid(barrier)
+        self.pending_barriers[datapath.id, barrier.xid] = time.perf_counter()
+        datapath.send_msg(barrier)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        sent = self.pending_barriers.pop((ev.msg.datapath.id, ev.msg.xid), None)
+        if sent is not None:
+            metrics.observe("flow_install_barrier", time.perf_counter() - sent)
+
+    @metrics.timer("flow_install")
+    def install_compiled(self, switch_ids: Set[int]):
+        """
+        Compila con `compile_routes` la tabella di routing di ciascuno switch in `switch_ids`
+        e ne installa direttamente le differenze rispetto a quanto già installato:
+        prima i flow nuovi o modificati, dal prefisso più lungo (priorità maggiore) al più corto,
+        così che un prefisso aggregato non catturi mai traffico destinato ad uno più specifico
+        non ancora installato, poi la rimozione di quelli obsoleti; infine una barrier.
+        """
+        if not switch_ids:
+            return
+
+        tables: Dict[int, Dict[str, str]] = { switch_id: {} for switch_id in switch_ids }
+        for (switch_id, destination), gateway in self.route_table.items():
+            if switch_id in tables:
+                tables[switch_id][destination] = gateway
+
+        gateway_links = self.gateway_links()
+        added = removed = 0
+        for switch_id, routes in tables.items():
+            switch = self.net_graph.switch_map.get(switch_id)
+            if switch is None:
+                self.compiled_table.pop(switch_id, None)
+                continue
+            datapath = switch.dp
+            ofp, parser = datapath.ofproto, datapath.ofproto_parser
+
+            current = self.compiled_table.get(switch_id, {})
+            # Le rotte il cui gateway non corrisponde ad alcun collegamento noto non possono essere installate
+            wanted = { prefix: gateway for prefix, gateway in compile_routes(routes).items() if (switch_id, gateway) in gateway_links }
+            to_add = sorted(
+                (ipaddress.ip_network(prefix) for prefix, gateway in wanted.items() if current.get(prefix) != gateway),
+                key=lambda network: -network.prefixlen,
+            )
+            to_remove = [ipaddress.ip_network(prefix) for prefix in current.keys() if prefix not in wanted]
+            if not to_add and not to_remove:
+                continue
+
+            def _match(network):
+                return parser.OFPMatch(eth_type=0x0800, ipv4_dst=(str(network.network_address), str(network.netmask)))
+
+            msgs = [
+                parser.OFPFlowMod(
+                    datapath,
+                    cookie=self.COMPILED_COOKIE,
+                    command=ofp.OFPFC_ADD,
+                    priority=self.COMPILED_PRIORITY + network.prefixlen,
+                    match=_match(network),
+                    instructions=[parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, self.next_hop_actions(parser, gateway_links[switch_id, wanted[str(network)]]))],
+                )
+                for network in to_add
+            ] + [
+                parser.OFPFlowMod(
+                    datapath,
+                    cookie=self.COMPILED_COOKIE,
+                    cookie_mask=self.COOKIE_MASK,
+                    command=ofp.OFPFC_DELETE_STRICT,
+                    priority=self.COMPILED_PRIORITY + network.prefixlen,
+                    match=_match(network),
+                    out_port=ofp.OFPP_ANY,
+                    out_group=ofp.OFPG_ANY,
+                )
+                for network in to_remove
+            ]
+            self.send_batch(datapath, msgs)
+            self.compiled_table[switch_id] = wanted
+            added += len(to_add)
+            removed += len(to_remove)
+
+        metrics.inc("routes_installed_total", added, kind="compiled")
+        metrics.inc("routes_removed_total", removed, kind="compiled")
+        self.logger.info("Rotte compilate aggiornate: %d flow installati, %d rimossi", added, removed)
+
+    def clear_compiled(self):
+        """
+        Rimuove da tutti gli switch i flow delle rotte compilate.
+        """
+        for switch_id in list(self.compiled_table.keys()):
+            switch = self.net_graph.switch_map.get(switch_id) if self.net_graph is not None else None
+            if switch is not None:
+                datapath = switch.dp
+                ofp, parser = datapath.ofproto, datapath.ofproto_parser
+                self.send_batch(datapath, [parser.OFPFlowMod(
+                    datapath,
+                    cookie=self.COMPILED_COOKIE,
+                    cookie_mask=self.COOKIE_MASK,
+                    command=ofp.OFPFC_DELETE,
+                    out_port=ofp.OFPP_ANY,
+                    out_group=ofp.OFPG_ANY,
+                )])
+            del self.compiled_table[switch_id]
+
+    def _delete_multipath(self, datapath, group_id: int):
+        ofp, parser = datapath.ofproto, datapath.ofproto_parser
+        datapath.send_msg(parser.OFPFlowMod(
+            datapath,
+            cookie=self.MULTIPATH_COOKIE | group_id,
+            cookie_mask=0xFFFFFFFFFFFFFFFF,
+            command=ofp.OFPFC_DELETE,
+            out_port=ofp.OFPP_ANY,
+            out_group=ofp.OFPG_ANY,
+        ))
+        datapath.send_msg(parser.OFPGroupMod(datapath, ofp.OFPGC_DELETE, ofp.OFPGT_SELECT, group_id))
+
+    # Ogni cambiamento della topologia invalida anche la cache dei risultati di /dijkstra
+
+    @set_ev_cls(topo_event.EventSwitchEnter)
+    def switch_enter_handler(self, ev):
+        DijkstraCommand.invalidate_cache()
+        metrics.inc("topology_events_total", event="switch_enter")
+        if self.net_graph is not None:
+            self.net_graph.add_switch(ev.switch)
+
+    @set_ev_cls(topo_event.EventSwitchLeave)
+    def switch_leave_handler(self, ev):
+        DijkstraCommand.invalidate_cache()
+        metrics.inc("topology_events_total", event="switch_leave")
+        # I gruppi dello switch uscito non esistono più
+        for key in [key for key in self.multipath_groups.keys() if key[0] == ev.switch.dp.id]:
+            del self.multipath_groups[key]
+            self.multipath_table.pop(key, None)
+        self.compiled_table.pop(ev.switch.dp.id, None)
+        for key in [key for key in self.pending_barriers.keys() if key[0] == ev.switch.dp.id]:
+            del self.pending_barriers[key]
+        if self.net_graph is not None:
+            self.update_routes(self.net_graph.remove_switch(ev.switch.dp.id))
+
+    @set_ev_cls(topo_event.EventLinkAdd)
+    def link_add_handler(self, ev):
+        DijkstraCommand.invalidate_cache()
+        metrics.inc("topology_events_total", event="link_add")
+        if self.net_graph is not None:
+            self.update_routes(self.net_graph.set_link(ev.link.src.dpid, ev.link.dst.dpid))
+
+    @set_ev_cls(topo_event.EventLinkDelete)
+    def link_delete_handler(self, ev):
+        DijkstraCommand.invalidate_cache()
+        metrics.inc("topology_events_total", event="link_delete")
+        if self.net_graph is not None:
+            self.update_routes(self.net_graph.remove_link(ev.link.src.dpid, ev.link.dst.dpid))
+
 
 class DijkstraCommand(ControllerBase):
     """
     Classe che implementa le rotte aggiuntive con cui estendere
     l'API REST offerta dalla classe `RestRouterAPI`.
+
+    I risultati di /dijkstra e /dijkstra_unit sono memorizzati in una cache LRU
+    condivisa fra tutte le istanze (ne viene creata una per ciascuna richiesta),
+    indicizzata dall'impronta della topologia, dal corpo della richiesta e dal
+    modello di costo; la cache viene svuotata ad ogni evento di topologia.
     """
 
+    ROUTE_CACHE_SIZE = 128
+    # Mappa chiave -> (rotte calcolate, rotte già serializzate in JSON)
+    _ROUTE_CACHE: "OrderedDict[str, Tuple[List[Dict[str, Union[int, str]]], str]]" = OrderedDict()
+
     def __init__(self, req, link, data, **config):
         super().__init__(req, link, data, **config)
         self.__app = data["app"] # Recuperiamo l'applicazione per poter
         # fare uso dell'API ryu.topology
 
-    def distance_dict_to_json(self, net_graph: NetLinkGraph, networks: List[Dict[str, Union[int, List[str]]]], links: List[Dict[str, Any]]):
+    @classmethod
+    def invalidate_cache(cls):
+        cls._ROUTE_CACHE.clear()
+
+    @staticmethod
+    def cache_key(switches: List[Switch], links: Dict[Link, float], request: Dict[str, Any], use_params: bool) -> str:
+        """
+        Metodo che calcola la chiave della cache come hash di una rappresentazione
+        canonica (ordinata) della topologia, della richiesta e del modello di costo.
+        """
+        canonical = json.dumps({
+            "switches": sorted(switch.dp.id for switch in switches),
+            "links": sorted((link.src.dpid, link.dst.dpid) for link in links.keys()),
+            "request": request,
+            "use_params": use_params,
+        }, sort_keys=True)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    @staticmethod
+    def route_entries(net_graph: NetLinkGraph, networks: List[Dict[str, Union[int, List[str]]]], links: List[Dict[str, Any]], switch_ids: Optional[Set[int]] = None, multipath: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Metodo che, dato il grafo della topologia della rete ed
         informazioni riguardanti le subnet ed i link al suo interno,
         ricostruisce il percorso ottimale verso ogni subnet per ciascuno
-        switch e restituisce il risultato in formato JSON compatibile con
-        una successiva chiamata alla rotta /router/{switch_id} per applicare
-        la configurazione calcolata.
+        switch (o soltanto per quelli in `switch_ids`, se specificati).
+        Le subnet non raggiungibili, o raggiungibili soltanto attraverso
+        link di cui non si conosce l'indirizzo, vengono omesse (le prime
+        sono elencate nei messaggi di debug).
+
+        Se `multipath` è specificato ({ "stretch": <float>, "max_paths": <int> },
+        campi opzionali), ogni rotta riporta anche in "gateways" tutti i gateway
+        utilizzabili (vedi `NetLinkGraph.multipath_next_hops`), il primo dei quali
+        coincide con "gateway".
         """
 
         response: List[Dict[str, Union[int, str]]] = []
@@ -162,27 +1525,82 @@ class DijkstraCommand(ControllerBase):
             for subnet in network["subnets"]
         }
 
+        if switch_ids is not None:
+            networks = [network for network in networks if network["switch_id"] in switch_ids]
+
+        if multipath is not None:
+            return DijkstraCommand.multipath_route_entries(net_graph, networks, link_map, all_subnets, multipath)
+
+        # Le tabelle dei next-hop di tutti gli switch sono calcolate in un solo passaggio
+        next_hops = net_graph.all_pairs_next_hops([network["switch_id"] for network in networks])
+
         for network in networks:
             switch_id: int = network["switch_id"] 
             subnets: List[str] = network["subnets"]
-
-            results = net_graph.dijkstra(starting_switch_id=switch_id)
-            def _path(to: int, _comes_from: int = None):
-                if to == switch_id:
-                    return _comes_from # Ultimo switch_id non nullo
-                else:
-                    return _path(to=results[to].previous_dpid, _comes_from=to)
+            hops: Dict[int, int] = next_hops[switch_id]
 
             # Per ogni switch, generare percorso ottimale verso TUTTE le subnet
             response.extend({
                     "switch_id": switch_id,
                     "destination": subnet,
-                    "gateway": link_map[switch_id, _path(to=dst_switch_id)]["dst_switch"]["ip_addr"],
+                    "gateway": link_map[switch_id, hops[dst_switch_id]]["dst_switch"]["ip_addr"],
                 } for subnet, dst_switch_id in all_subnets.items()
                 if subnet not in subnets
+                    and dst_switch_id in hops
+                    and (switch_id, hops[dst_switch_id]) in link_map
             )
-        
-        return json.dumps(response) # json.dumps è necessario?
+
+            if LOG.isEnabledFor(logging.DEBUG):
+                unreachable = [subnet for subnet, dst_switch_id in all_subnets.items() if subnet not in subnets and dst_switch_id not in hops]
+                if unreachable:
+                    LOG.debug("Lo switch %s non raggiunge le subnet %s", switch_id, ", ".join(unreachable))
+
+        return response
+
+    @staticmethod
+    def multipath_route_entries(net_graph: NetLinkGraph, networks: List[Dict[str, Union[int, List[str]]]], link_map: Dict[Tuple[int, int], Any], all_subnets: Dict[str, int], multipath: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Metodo helper di `route_entries` per le rotte a percorsi multipli.
+        """
+        response: List[Dict[str, Any]] = []
+        stretch = float(multipath.get("stretch", 1.0))
+        max_paths = multipath.get("max_paths")
+
+        # Con stretch > 1 servono anche gli alberi dei vicini di ciascuna sorgente
+        sources = [network["switch_id"] for network in networks]
+        if stretch > 1:
+            sources += [neighbor for source in sources for neighbor in net_graph.neighbors(source).keys()]
+        net_graph.compute_trees(sources)
+
+        for network in networks:
+            switch_id: int = network["switch_id"]
+            hops = net_graph.multipath_next_hops(starting_switch_id=switch_id, stretch=stretch, max_paths=max_paths)
+
+            for subnet, dst_switch_id in all_subnets.items():
+                if subnet in network["subnets"] or dst_switch_id not in hops:
+                    continue
+                gateways = [
+                    link_map[switch_id, hop]["dst_switch"]["ip_addr"]
+                    for hop in hops[dst_switch_id]
+                    if (switch_id, hop) in link_map
+                ]
+                if gateways:
+                    response.append({
+                        "switch_id": switch_id,
+                        "destination": subnet,
+                        "gateway": gateways[0],
+                        "gateways": gateways,
+                    })
+
+        return response
+
+    def distance_dict_to_json(self, net_graph: NetLinkGraph, networks: List[Dict[str, Union[int, List[str]]]], links: List[Dict[str, Any]]):
+        """
+        Metodo che restituisce le rotte calcolate da `route_entries` in formato
+        JSON compatibile con una successiva chiamata alla rotta /router/{switch_id}
+        per applicare la configurazione calcolata.
+        """
+        return json.dumps(self.route_entries(net_graph=net_graph, networks=networks, links=links))
 
 
     @route(name='calc_dijkstra', path='/dijkstra', methods=['POST'], requirements={})
@@ -190,9 +1608,8 @@ class DijkstraCommand(ControllerBase):
         """
         Rotta che riceve in POST i dati che descrivono le subnet utenti della topologia
         di rete su cui determinare le rotte ottimali mediante algoritmo di Dijkstra.
+        La topologia (switch e link) è quella mantenuta dal controller in `DijkstraRouter.live_graph`.
         """
-        switch_list: List[Switch] = get_all_switch(self.__app)
-        links_dict: Dict[Link, float] = get_all_link(self.__app)
 
         """
         FORMATO RICHIESTA:
@@ -214,7 +1631,19 @@ class DijkstraCommand(ControllerBase):
 
                 { "src_switch": { "id": id_switch_1, "ip_addr": <ip_addr_1> }, "dst_switch": { "id": id_switch_2, "ip_addr": <ip_addr_2> }, "ritardo": ..., "capacità": ... },
                 ...
-            ]
+            ],
+
+            # Opzionale: modello di costo fra quelli in `DijkstraRouter.COST_MODELS`
+            # ("static", predefinito, "unit" oppure "congestion")
+            "cost_model": "static",
+
+            # Opzionale: rotte a percorsi multipli (vedi `route_entries`), installate
+            # dal controller come gruppi OpenFlow di tipo select
+            "multipath": { "stretch": 1.0, "max_paths": 4 },
+
+            # Opzionale: se vero le rotte vengono aggregate (vedi `compile_routes`) ed installate
+            # direttamente dal controller, senza bisogno di inviarle a /router/batch
+            "compile": false
         }
         """
 
@@ -227,13 +1656,20 @@ class DijkstraCommand(ControllerBase):
         FORMATO RISPOSTA:
         [
             { "switch_id": id_switch, "destination": ip_rete_destinazione, "gateway": ip_switch_neighbor },
+            # con "multipath" ogni rotta riporta anche "gateways": [ ip_switch_neighbor, ... ]
             { <gli stessi dati, ma per un'altra rotta su un altro switch> },
             ...
             <ogni switch dovrebbe avere una rotta per ciascuna subnet nota>
         ]
         """
         request = json.loads(req.body)
-        print(request)
+        LOG.debug("Richiesta /dijkstra: %s", request)
+
+        cost_model = self.__app.cost_models.get(request.get("cost_model", StaticCostModel.name) if use_params else UnitCostModel.name)
+        if cost_model is None:
+            return Response(status=400, content_type="application/json", body=json.dumps({
+                "error": "Unknown cost model, available: %s" % ", ".join(self.__app.cost_models.keys())
+            }))
 
         connection_parameters = {
             (int(link["src_switch"]["id"]), int(link["dst_switch"]["id"])): {
@@ -243,8 +1679,34 @@ class DijkstraCommand(ControllerBase):
             for link in request["links"]
         } if use_params else {}
 
-        net_graph = NetLinkGraph(parent_app=self.__app, switches=switch_list, links=links_dict, connection_parameters=connection_parameters)
-        json_response = self.distance_dict_to_json(net_graph=net_graph, networks=request["networks"], links=request["links"])
+        key = self.cache_key(
+            switches=get_all_switch(self.__app),
+            links=get_all_link(self.__app),
+            request=request,
+            use_params=use_params,
+        )
+
+        # Il grafo del controller va comunque allineato alla richiesta, per poter
+        # aggiornare in seguito le rotte restituite; se i parametri non cambiano
+        # viene semplicemente riusato, insieme ai suoi alberi dei cammini minimi
+        net_graph = self.__app.live_graph(connection_parameters=connection_parameters, cost_model=cost_model)
+
+        cached = self._ROUTE_CACHE.get(key)
+        if cached is not None:
+            metrics.inc("route_cache_requests_total", result="hit")
+            self._ROUTE_CACHE.move_to_end(key)
+            routes, json_response = cached
+        else:
+            metrics.inc("route_cache_requests_total", result="miss")
+            with metrics.timer("shortest_path"):
+                routes = self.route_entries(net_graph=net_graph, networks=request["networks"], links=request["links"], multipath=request.get("multipath"))
+            with metrics.timer("serialization"):
+                json_response = json.dumps(routes)
+            self._ROUTE_CACHE[key] = (routes, json_response)
+            if len(self._ROUTE_CACHE) > self.ROUTE_CACHE_SIZE:
+                self._ROUTE_CACHE.popitem(last=False)
+
+        self.__app.remember_routes(networks=request["networks"], links=request["links"], routes=routes, multipath=request.get("multipath"), compile=bool(request.get("compile", False)))
         return Response(status=200, content_type="application/json", body=json_response)
         
 
@@ -255,3 +1717,53 @@ class DijkstraCommand(ControllerBase):
         con costo unitario, senza considerare eventuali parametri di banda e delay.
         """
         return self.calc_dijkstra(req=req, use_params=False)
+
+
+    @route(name='metrics', path='/metrics', methods=['GET'], requirements={})
+    def get_metrics(self, req: Request, **_kwargs) -> Response:
+        """
+        Rotta che espone le metriche del controller (vedi `ControllerMetrics`)
+        nel formato testuale di Prometheus, insieme alle dimensioni attuali
+        del grafo e delle tabelle mantenute dal controller.
+        """
+        net_graph = self.__app.net_graph
+        gauges = {
+            "dijkstra_graph_switches": ("Switch nel grafo della topologia", len(net_graph.switch_map) if net_graph else 0),
+            "dijkstra_graph_links": ("Collegamenti (orientati) nel grafo della topologia", len(net_graph.indices) if net_graph else 0),
+            "dijkstra_shortest_path_trees": ("Alberi dei cammini minimi in memoria", len(net_graph.shortest_path_trees) if net_graph else 0),
+            "dijkstra_route_cache_entries": ("Risultati di /dijkstra nella cache", len(self._ROUTE_CACHE)),
+            "dijkstra_routes": ("Rotte installate dal controller", len(self.__app.route_table)),
+            "dijkstra_multipath_groups": ("Gruppi select installati", len(self.__app.multipath_groups)),
+            "dijkstra_compiled_flows": ("Flow delle rotte compilate installati", sum(len(table) for table in self.__app.compiled_table.values())),
+        }
+        return Response(status=200, content_type=ControllerMetrics.CONTENT_TYPE, body=metrics.render(gauges).encode())
+
+
+    @route(name='router_batch', path='/router/batch', methods=['POST'], requirements={})
+    def router_batch(self, req: Request, **_kwargs) -> Response:
+        """
+        Rotta che applica in un unico passaggio un intero insieme di modifiche
+        alle configurazioni degli switch, evitando una richiesta per ciascuna
+        rotta o indirizzo.
+
+        FORMATO RICHIESTA (ogni campo è opzionale):
+        {
+            "addresses": [ { "switch_id": <id>, "address": <ip_addr/mask> }, ... ],
+            "remove":    [ { "switch_id": <id>, "destination": <ip_net_addr> }, ... ],
+            "routes":    [ { "switch_id": <id>, "destination": <ip_net_addr>, "gateway": <ip_addr> }, ... ]
+        }
+
+        FORMATO RISPOSTA:
+        { "addresses": <n>, "removed": <n>, "added": <n>, "failed": [ <operazioni fallite> ] }
+        """
+        request = json.loads(req.body)
+
+        result = self.__app.install_routes(
+            addresses=[(int(entry["switch_id"]), entry["address"]) for entry in request.get("addresses", [])],
+            to_remove=[(int(entry["switch_id"]), entry["destination"]) for entry in request.get("remove", [])],
+            to_add={
+                (int(entry["switch_id"]), entry["destination"]): entry["gateway"]
+                for entry in request.get("routes", [])
+            },
+        )
+        return Response(status=200, content_type="application/json", body=json.dumps(result))
@@ -0,0 +1,228 @@
+"""
+Calcolo parallelo degli alberi dei cammini minimi su più processi.
+
+Il grafo è in formato CSR (Compressed Sparse Row), lo stesso usato internamente
+da `NetLinkGraph`: gli switch sono numerati 0..n-1 e i vicini dello switch i sono
+`indices[indptr[i]:indptr[i + 1]]`, con i costi nelle stesse posizioni di `weights`.
+I tre array vengono copiati una sola volta in un blocco di memoria condivisa
+(`multiprocessing.shared_memory`), da cui ciascun processo del pool li legge al
+primo task: ai task viene passato soltanto il nome del blocco e le sorgenti.
+Ogni task esegue Dijkstra per un gruppo di sorgenti e restituisce, per ciascuna,
+gli array dei costi, dei predecessori e dei primi hop.
+
+Il modulo non dipende da Ryu, così che i processi del pool (avviati con "spawn",
+più sicuro del fork di un processo che usa eventlet) lo importino rapidamente.
+"""
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Dict, Tuple, Optional, Callable, Any
+import heapq
+import logging
+import math
+import os
+import sys
+import time
+
+LOG = logging.getLogger(__name__)
+
+INF = float("inf")
+
+
+def csr_from_adjacency(adjacency: List[Dict[int, float]]) -> Tuple[array, array, array]:
+    """
+    Converte la lista delle adiacenze (indice -> { indice vicino -> costo }) nei tre
+    array `indptr`, `indices` e `weights` del formato CSR.
+    I vicini mantengono l'ordine della lista delle adiacenze.
+    """
+    indptr, indices, weights = array("q", [0]), array("q"), array("d")
+    for neighbors in adjacency:
+        indices.extend(neighbors.keys())
+        weights.extend(neighbors.values())
+        indptr.append(len(indices))
+    return indptr, indices, weights
+
+
+def csr_dijkstra(indptr, indices, weights, source: int) -> Tuple[array, array, array]:
+    """
+    Dijkstra con heap binario sul grafo in formato CSR, a partire dall'indice `source`.
+    Restituisce i costi (inf se non raggiungibile), i predecessori e il primo hop
+    lungo il percorso ottimale (-1 se assenti). Il primo hop di ciascuno switch si
+    ricava alla sua estrazione da quello del predecessore, estratto in precedenza.
+    """
+    n = len(indptr) - 1
+    dist = array("d", [INF]) * n
+    pred = array("q", [-1]) * n
+    hop = array("q", [-1]) * n
+    visited = bytearray(n)
+    dist[source] = 0.0
+    to_explore: List[Tuple[float, int]] = [(0.0, source)]
+
+    while to_explore:
+        current_cost, current = heapq.heappop(to_explore)
+        if visited[current]:
+            continue
+        visited[current] = 1
+        previous = pred[current]
+        if previous >= 0:
+            hop[current] = current if previous == source else hop[previous]
+        for k in range(indptr[current], indptr[current + 1]):
+            neighbor = indices[k]
+            if visited[neighbor]:
+                continue
+            new_cost = current_cost + weights[k]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                pred[neighbor] = current
+                heapq.heappush(to_explore, (new_cost, neighbor))
+
+    return dist, pred, hop
+
+
+# Cache, in ciascun processo del pool, dell'ultimo grafo letto dalla memoria condivisa
+_worker_graph: Dict[str, Any] = {}
+
+
+def _attached_graph(name: str, n: int, m: int) -> Tuple[List[int], List[int], List[float]]:
+    if _worker_graph.get("name") != name:
+        shm = SharedMemory(name=name)
+        try:
+            buffer = shm.buf
+            # Copia locale come liste: l'accesso per indice è più rapido che sulla memoryview
+            indptr = buffer[:8 * (n + 1)].cast("q").tolist()
+            indices = buffer[8 * (n + 1):8 * (n + 1 + m)].cast("q").tolist()
+            weights = buffer[8 * (n + 1 + m):8 * (n + 1 + 2 * m)].cast("d").tolist()
+            del buffer
+        finally:
+            shm.close()
+        _worker_graph.update(name=name, graph=(indptr, indices, weights))
+    return _worker_graph["graph"]
+
+
+def _trees_task(name: str, n: int, m: int, sources: List[int]) -> List[Tuple[int, array, array, array]]:
+    indptr, indices, weights = _attached_graph(name, n, m)
+    return [(source, *csr_dijkstra(indptr, indices, weights, source)) for source in sources]
+
+
+class ParallelShortestPaths():
+    """
+    Pool di `workers` processi che calcola gli alberi dei cammini minimi di più
+    sorgenti in parallelo. Il pool viene avviato al primo utilizzo.
+    Mentre i task sono in corso, `shortest_path_trees` chiama periodicamente la
+    funzione `idle` (e.g. `hub.sleep` nel controller), così che il chiamante non blocchi
+    il proprio ciclo di eventi; una sola chiamata alla volta usa il pool.
+    Dopo MAX_FAILURES fallimenti consecutivi il pool viene disattivato definitivamente
+    (`disabled`): ogni chiamata successiva restituisce subito None.
+    """
+
+    POLL_INTERVAL = 0.005 # secondi
+    TASKS_PER_WORKER = 4
+    MAX_FAILURES = 3
+
+    def __init__(self, workers: Optional[int] = None, min_switches: int = 256):
+        self.workers = workers or os.cpu_count() or 1
+        # Sotto questa dimensione il costo dell'invio dei risultati supera il guadagno
+        self.min_switches = min_switches
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._shared: Optional[SharedMemory] = None
+        self._shared_key: Optional[Tuple[int, int]] = None
+        self._busy = False
+        self._failures = 0
+        self.disabled = False
+
+    def _publish(self, key: Tuple[int, int], indptr: array, indices: array, weights: array) -> str:
+        """
+        Copia il grafo in un nuovo blocco di memoria condivisa, se `key` è cambiata,
+        liberando quello precedente.
+        """
+        if self._shared_key != key:
+            self._release()
+            size = (len(indptr) + len(indices)) * 8 + len(weights) * 8
+            self._shared = SharedMemory(create=True, size=max(1, size))
+            offset = 0
+            for data in (indptr, indices, weights):
+                raw = data.tobytes()
+                self._shared.buf[offset:offset + len(raw)] = raw
+                offset += len(raw)
+            self._shared_key = key
+        return self._shared.name
+
+    def _release(self):
+        if self._shared is not None:
+            self._shared.close()
+            self._shared.unlink()
+            self._shared = self._shared_key = None
+
+    def shortest_path_trees(
+        self,
+        key: Tuple[int, int],
+        csr: Tuple[array, array, array],
+        sources: List[int],
+        idle: Callable[[float], Any] = time.sleep,
+    ) -> Optional[Dict[int, Tuple[array, array, array]]]:
+        """
+        Calcola costi, predecessori e primi hop degli alberi radicati nelle sorgenti `sources`
+        (indici) del grafo `csr` (vedi `csr_from_adjacency`), identificato da `key`
+        (cambia ad ogni modifica del grafo).
+        Restituisce None se il pool è già occupato, disattivato o se un processo fallisce:
+        il chiamante procede allora in modo sequenziale.
+        """
+        if self._busy or self.disabled:
+            return None
+        self._busy = True
+        try:
+            indptr, indices, weights = csr
+            n = len(indptr) - 1
+            name = self._publish(key, indptr, indices, weights)
+            if self._executor is None:
+                # Con "spawn" i processi importano questo modulo per nome, con il sys.path del
+                # padre al loro avvio: ryu-manager ripristina il proprio dopo aver caricato
+                # l'applicazione, rimuovendo la cartella del modulo
+                module_dir = os.path.dirname(os.path.abspath(__file__))
+                if module_dir not in sys.path:
+                    sys.path.append(module_dir)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+
+            chunk = max(1, math.ceil(len(sources) / (self.workers * self.TASKS_PER_WORKER)))
+            futures = [
+                self._executor.submit(_trees_task, name, n, len(indices), sources[start:start + chunk])
+                for start in range(0, len(sources), chunk)
+            ]
+            while True:
+                done, pending = wait(futures, timeout=0, return_when=FIRST_EXCEPTION)
+                failed = any(future.exception() is not None for future in done)
+                if not pending or failed:
+                    break
+                idle(self.POLL_INTERVAL)
+
+            if failed: # Il pool potrebbe essere inutilizzabile: verrà ricreato alla prossima chiamata
+                error = next(future.exception() for future in done if future.exception() is not None)
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._failures += 1
+                if self._failures >= self.MAX_FAILURES:
+                    # Un errore che si ripete (e.g. il modulo non importabile nei processi)
+                    # farebbe riavviare il pool ad ogni richiesta, soltanto per poi ripiegare
+                    self.disabled = True
+                    self._release()
+                    LOG.warning("Calcolo parallelo disattivato dopo %d fallimenti consecutivi: %r", self._failures, error)
+                else:
+                    LOG.warning("Calcolo parallelo fallito, si procede in modo sequenziale: %r", error)
+                return None
+            self._failures = 0
+
+            trees: Dict[int, Tuple[array, array, array]] = {}
+            for future in futures:
+                for source, dist, pred, hop in future.result():
+                    trees[source] = (dist, pred, hop)
+            return trees
+        finally:
+            self._busy = False
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._release()
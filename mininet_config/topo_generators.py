@@ -0,0 +1,204 @@
+"""
+Generatori di topologie sintetiche parametrizzate (fat-tree, leaf-spine,
+Waxman casuale, anello e griglia), indipendenti da Mininet e da Ryu.
+
+Ciascun generatore restituisce un oggetto `Fabric`, che descrive switch,
+collegamenti (con banda e ritardo) e switch di accesso, ed assegna gli indirizzi
+in modo deterministico:
+- ogni collegamento fra switch riceve una /30 da 100.64.0.0/10
+  (.1 allo switch `src`, .2 allo switch `dst`);
+- ogni switch di accesso riceve una /24 da 10.0.0.0/8, con gateway .254.
+Da un `Fabric` si ottengono direttamente i dati per le rotte /dijkstra
+(`networks`, `links`) e gli indirizzi da assegnare agli switch (`addresses`);
+la classe `GeneratedTopology` di `topology.py` ne costruisce la rete Mininet,
+mentre `benchmark.py` lo usa per misurare il controller senza Mininet.
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Any
+import ipaddress
+import math
+import random
+
+LINK_POOL = ipaddress.ip_network("100.64.0.0/10")
+SUBNET_POOL = ipaddress.ip_network("10.0.0.0/8")
+
+
+@dataclass(frozen=True)
+class FabricLink():
+    src: int # dpid
+    dst: int # dpid
+    bw: int # in Mbps
+    delay: str # formato "<numero decimale>ms"
+
+
+@dataclass
+class Fabric():
+    name: str
+    switches: List[int] = field(default_factory=list)
+    links: List[FabricLink] = field(default_factory=list)
+    # Switch a cui sono collegati gli host, ciascuno con una propria subnet
+    access_switches: List[int] = field(default_factory=list)
+
+    def link_addresses(self, index: int) -> Tuple[str, str]:
+        """
+        Indirizzi (senza prefisso) degli switch `src` e `dst` del collegamento `index`.
+        """
+        base = int(LINK_POOL.network_address) + 4 * index
+        return str(ipaddress.ip_address(base + 1)), str(ipaddress.ip_address(base + 2))
+
+    def subnet(self, index: int) -> ipaddress.IPv4Network:
+        """
+        Subnet degli host dello switch di accesso `index` (posizione in `access_switches`).
+        """
+        return ipaddress.ip_network((int(SUBNET_POOL.network_address) + (index << 8), 24))
+
+    def networks(self) -> List[Dict[str, Any]]:
+        """
+        Campo "networks" della richiesta /dijkstra: tutti gli switch,
+        con le subnet degli host per quelli di accesso.
+        """
+        subnets: Dict[int, List[str]] = { dpid: [] for dpid in self.switches }
+        for index, dpid in enumerate(self.access_switches):
+            subnets[dpid].append(str(self.subnet(index)))
+        return [{ "switch_id": dpid, "subnets": subnets[dpid] } for dpid in self.switches]
+
+    def link_payload(self) -> List[Dict[str, Any]]:
+        """
+        Campo "links" della richiesta /dijkstra, con entrambe le direzioni di ciascun collegamento
+        (lo stesso formato di `LinkWithParameters.to_dict`).
+        """
+        payload: List[Dict[str, Any]] = []
+        for index, link in enumerate(self.links):
+            src_ip, dst_ip = self.link_addresses(index)
+            for (a, a_ip), (b, b_ip) in (((link.src, src_ip), (link.dst, dst_ip)), ((link.dst, dst_ip), (link.src, src_ip))):
+                payload.append({
+                    "src_switch": { "id": a, "ip_addr": a_ip },
+                    "dst_switch": { "id": b, "ip_addr": b_ip },
+                    "bw": link.bw,
+                    "delay": link.delay,
+                })
+        return payload
+
+    def addresses(self) -> Dict[int, List[str]]:
+        """
+        Indirizzi (con prefisso) da assegnare alle interfacce di ciascuno switch.
+        """
+        addresses: Dict[int, List[str]] = { dpid: [] for dpid in self.switches }
+        for index, dpid in enumerate(self.access_switches):
+            addresses[dpid].append("%s/24" % (self.subnet(index).network_address + 254))
+        for index, link in enumerate(self.links):
+            src_ip, dst_ip = self.link_addresses(index)
+            addresses[link.src].append(src_ip + "/30")
+            addresses[link.dst].append(dst_ip + "/30")
+        return addresses
+
+
+def fat_tree(k: int = 4, bw: int = 100, delay: str = "0.05ms") -> Fabric:
+    """
+    Fat-tree con `k` pod (k pari): (k/2)^2 switch di core e, in ciascun pod,
+    k/2 switch di aggregazione e k/2 di accesso, per un totale di 5k^2/4 switch.
+    Gli switch di core hanno dpid 1..(k/2)^2, seguiti pod per pod da aggregazione e accesso.
+    """
+    if k < 2 or k % 2:
+        raise ValueError("k dev'essere un numero pari >= 2")
+    half = k // 2
+    fabric = Fabric(name="fattree-%d" % k)
+    core = list(range(1, half * half + 1))
+    fabric.switches.extend(core)
+
+    next_dpid = len(core) + 1
+    for _ in range(k):
+        aggregation = list(range(next_dpid, next_dpid + half))
+        edge = list(range(next_dpid + half, next_dpid + k))
+        next_dpid += k
+        fabric.switches.extend(aggregation + edge)
+        fabric.access_switches.extend(edge)
+        for a in edge:
+            fabric.links.extend(FabricLink(src=a, dst=b, bw=bw, delay=delay) for b in aggregation)
+        # L'i-esimo switch di aggregazione di ogni pod è collegato all'i-esimo gruppo di switch di core
+        for i, a in enumerate(aggregation):
+            fabric.links.extend(FabricLink(src=a, dst=c, bw=bw, delay=delay) for c in core[i * half:(i + 1) * half])
+    return fabric
+
+
+def leaf_spine(spines: int = 2, leaves: int = 4, bw: int = 100, delay: str = "0.05ms") -> Fabric:
+    """
+    Leaf-spine: ogni leaf (switch di accesso) è collegato a ciascuno spine.
+    Gli spine hanno dpid 1..`spines`, seguiti dai leaf.
+    """
+    fabric = Fabric(name="leafspine-%d-%d" % (spines, leaves))
+    spine_ids = list(range(1, spines + 1))
+    leaf_ids = list(range(spines + 1, spines + leaves + 1))
+    fabric.switches.extend(spine_ids + leaf_ids)
+    fabric.access_switches.extend(leaf_ids)
+    for leaf in leaf_ids:
+        fabric.links.extend(FabricLink(src=leaf, dst=spine, bw=bw, delay=delay) for spine in spine_ids)
+    return fabric
+
+
+def waxman(n: int = 20, alpha: float = 0.4, beta: float = 0.4, seed: int = 0, bw: int = 100, ms_per_unit: float = 10.0) -> Fabric:
+    """
+    Grafo casuale di Waxman: `n` switch disposti a caso nel quadrato unitario,
+    collegati con probabilità beta * exp(-d / (alpha * L)), dove d è la loro distanza
+    e L la massima distanza possibile. Un albero casuale garantisce che il grafo sia connesso.
+    Il ritardo di ciascun collegamento è proporzionale alla lunghezza (`ms_per_unit` ms per unità).
+    Tutti gli switch sono di accesso. Il costo della generazione è O(n^2).
+    """
+    rng = random.Random(seed)
+    position = { dpid: (rng.random(), rng.random()) for dpid in range(1, n + 1) }
+    fabric = Fabric(name="waxman-%d" % n, switches=list(position.keys()), access_switches=list(position.keys()))
+    max_distance = math.sqrt(2)
+    pairs = set()
+
+    order = list(position.keys())
+    rng.shuffle(order)
+    for i in range(1, len(order)):
+        pairs.add(tuple(sorted((order[i], order[rng.randrange(i)]))))
+
+    for a in range(1, n + 1):
+        for b in range(a + 1, n + 1):
+            if rng.random() < beta * math.exp(-math.dist(position[a], position[b]) / (alpha * max_distance)):
+                pairs.add((a, b))
+
+    for a, b in sorted(pairs):
+        delay = max(0.01, round(math.dist(position[a], position[b]) * ms_per_unit, 2))
+        fabric.links.append(FabricLink(src=a, dst=b, bw=bw, delay="%sms" % delay))
+    return fabric
+
+
+def ring(n: int = 8, bw: int = 100, delay: str = "0.05ms") -> Fabric:
+    """
+    Anello di `n` switch, tutti di accesso.
+    """
+    fabric = Fabric(name="ring-%d" % n, switches=list(range(1, n + 1)), access_switches=list(range(1, n + 1)))
+    if n > 1:
+        fabric.links.extend(FabricLink(src=dpid, dst=dpid % n + 1, bw=bw, delay=delay) for dpid in range(1, n + 1 if n > 2 else n))
+    return fabric
+
+
+def grid(rows: int = 3, cols: int = 3, bw: int = 100, delay: str = "0.05ms") -> Fabric:
+    """
+    Griglia `rows` x `cols` di switch, tutti di accesso; lo switch in
+    posizione (r, c) ha dpid r * cols + c + 1.
+    """
+    fabric = Fabric(name="grid-%dx%d" % (rows, cols))
+    for r in range(rows):
+        for c in range(cols):
+            dpid = r * cols + c + 1
+            fabric.switches.append(dpid)
+            if c + 1 < cols:
+                fabric.links.append(FabricLink(src=dpid, dst=dpid + 1, bw=bw, delay=delay))
+            if r + 1 < rows:
+                fabric.links.append(FabricLink(src=dpid, dst=dpid + cols, bw=bw, delay=delay))
+    fabric.access_switches.extend(fabric.switches)
+    return fabric
+
+
+GENERATORS = {
+    "fattree": fat_tree,
+    "leafspine": leaf_spine,
+    "waxman": waxman,
+    "ring": ring,
+    "grid": grid,
+}
@@ -1,15 +1,23 @@
 from dataclasses import dataclass, field
 from typing import List, Dict, Union, Optional, Any
 import json
+import sys
 
 from mininet.net import Mininet
 from mininet.node import RemoteController, OVSSwitch
 from mininet.link import TCLink
 from mininet.topo import Topo
 from mininet.cli import CLI
+from mininet.util import splitArgs
 from mininet import log
 import requests
 
+from topo_generators import Fabric, fat_tree, leaf_spine, waxman, ring, grid
+
+# Sessione HTTP condivisa: riusa le connessioni verso il controller
+# invece di aprirne una nuova per ciascuna richiesta
+http_session = requests.Session()
+
 @dataclass(frozen=True)
 class SwitchData():
     id: int
@@ -117,12 +125,56 @@ class ProjectTopology(Topo):
         _helper_aggiungi_link(sw4, sw5, bw=20, delay='2ms', src_switch=SwitchData(id=4, ip_addr="180.1.2.1"), dst_switch=SwitchData(id=5, ip_addr="180.1.2.2"))
 
 
+class GeneratedTopology(Topo):
+    """
+    Topologia costruita a partire da un `Fabric` di `topo_generators`:
+    uno switch "sw<dpid>" per ciascuno switch del fabric ed un host
+    per ciascuno switch di accesso, con indirizzi e parametri dei
+    collegamenti uguali a quelli inviati al controller.
+    """
+    def __init__(self, fabric: Fabric, *args, **params):
+        self.fabric = fabric
+        self.host_list: List[str] = []
+        self.switch_list: List[str] = []
+        self.link_list: List[LinkWithParameters] = []
+
+        super().__init__(*args, **params)
+
+    def build(self):
+        switches: Dict[int, str] = {}
+        for dpid in self.fabric.switches:
+            switches[dpid] = self.addSwitch(f'sw{dpid}')
+            self.switch_list.append(switches[dpid])
+
+        for index, dpid in enumerate(self.fabric.access_switches):
+            subnet = self.fabric.subnet(index)
+            host = self.addHost(f'h{index + 1}', ip=f'{subnet.network_address + 1}/24', defaultRoute=f'via {subnet.network_address + 254}')
+            self.host_list.append(host)
+            self.addLink(host, switches[dpid], bw=100, delay='0.05ms')
+
+        for index, link in enumerate(self.fabric.links):
+            src_ip, dst_ip = self.fabric.link_addresses(index)
+            src_switch, dst_switch = SwitchData(id=link.src, ip_addr=src_ip), SwitchData(id=link.dst, ip_addr=dst_ip)
+            link_info_key = self.addLink(switches[link.src], switches[link.dst], bw=link.bw, delay=link.delay)
+            self.link_list.extend([
+                LinkWithParameters(link_info_key=link_info_key, bw=link.bw, delay=link.delay, src_switch=src_switch, dst_switch=dst_switch),
+                LinkWithParameters(link_info_key=link_info_key, bw=link.bw, delay=link.delay, src_switch=dst_switch, dst_switch=src_switch),
+            ])
+
+
 # Mininet si aspetta che sia presente un dizionario `topos`
 # nello scope globale del proprio file di configurazione,
 # contenente tutte le topologie custom che si desidera utilizzare.
+# Le topologie generate accettano i parametri del rispettivo generatore,
+# e.g. `mn --custom topology.py --topo fattree,4` oppure `--topo leafspine,4,16`.
 topos: Dict[str, Topo] = {
     "test": TestTopology,
     "project": ProjectTopology,
+    "fattree": lambda *args, **kwargs: GeneratedTopology(fat_tree(*args, **kwargs)),
+    "leafspine": lambda *args, **kwargs: GeneratedTopology(leaf_spine(*args, **kwargs)),
+    "waxman": lambda *args, **kwargs: GeneratedTopology(waxman(*args, **kwargs)),
+    "ring": lambda *args, **kwargs: GeneratedTopology(ring(*args, **kwargs)),
+    "grid": lambda *args, **kwargs: GeneratedTopology(grid(*args, **kwargs)),
 }
 
 
@@ -151,59 +203,163 @@ class SwitchConfig:
     routes: List[StaticRoute] = field(default_factory=list)
 
 
-def post_configs(endpoint: str, configs: List[SwitchConfig]):
+def get_installed_configs(endpoint: str) -> Dict[int, SwitchConfig]:
+    """
+    Questa funzione recupera dall'API REST gli indirizzi e le rotte
+    attualmente installati su ciascuno switch.
+    """
+    response = http_session.get(f"{endpoint}/router/all")
+    if response.status_code != 200: # Nessuno switch ancora registrato
+        return {}
+
+    installed: Dict[int, SwitchConfig] = {}
+    for entry in response.json():
+        # L'API restituisce l'id dello switch come stringa esadecimale di 16 cifre
+        id = int(entry["switch_id"], 16)
+        config = installed.setdefault(id, SwitchConfig(id=id))
+        for network in entry.get("internal_network", []):
+            config.addresses.extend(address["address"] for address in network.get("address", []))
+            config.routes.extend(
+                StaticRoute(destination=route["destination"], gateway=route["gateway"])
+                for route in network.get("route", [])
+            )
+    return installed
+
+# Rotta predefinita di rest_router, mai rimossa dalla potatura delle rotte
+DEFAULT_ROUTE = "0.0.0.0/0"
+
+def config_changes(installed: Dict[int, SwitchConfig], configs: List[SwitchConfig], prune_routes: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Questa funzione confronta le configurazioni `configs` con quelle già
+    installate (`installed`, vedi `get_installed_configs`) e restituisce
+    soltanto le differenze, nel formato della rotta /router/batch.
+
+    Se `prune_routes` è vero, vengono rimosse anche le rotte installate ma
+    assenti dalla nuova configurazione, limitatamente alle destinazioni gestite
+    da `configs` (quelle presenti in almeno una delle sue rotte) e su tutti gli
+    switch, anche quelli assenti da `configs`: le rotte aggiunte da altri, tra cui
+    la rotta predefinita di rest_router, non vengono toccate.
+    """
+    addresses: List[Dict[str, Any]] = []
+    remove: List[Dict[str, Any]] = []
+    routes: List[Dict[str, Any]] = []
+
+    managed = { route.destination for switch in configs for route in switch.routes } - { DEFAULT_ROUTE }
+    wanted_configs = { switch.id: switch for switch in configs }
+    for switch_id in list(wanted_configs.keys()) + [id for id in installed.keys() if id not in wanted_configs]:
+        switch = wanted_configs.get(switch_id, SwitchConfig(id=switch_id))
+        current = installed.get(switch_id, SwitchConfig(id=switch_id))
+        current_routes: Dict[str, str] = { route.destination: route.gateway for route in current.routes }
+        wanted_routes: Dict[str, str] = { route.destination: route.gateway for route in switch.routes }
+
+        addresses.extend(
+            { "switch_id": switch_id, "address": address }
+            for address in switch.addresses
+            if address not in current.addresses
+        )
+
+        # Le rotte con gateway diverso vanno rimosse prima di essere reinstallate
+        remove.extend(
+            { "switch_id": switch_id, "destination": destination }
+            for destination, gateway in current_routes.items()
+            if (destination in wanted_routes and wanted_routes[destination] != gateway)
+                or (prune_routes and destination in managed and destination not in wanted_routes)
+        )
+        routes.extend(
+            { "switch_id": switch_id, "destination": destination, "gateway": gateway }
+            for destination, gateway in wanted_routes.items()
+            if current_routes.get(destination) != gateway
+        )
+
+    return { "addresses": addresses, "remove": remove, "routes": routes }
+
+def post_configs(endpoint: str, configs: List[SwitchConfig], prune_routes: bool = False) -> requests.Response:
     """
     Questa funzione riceve a parametro una lista di configurazioni
     da assegnare agli switch ed effettua le dovute chiamate all'API REST
     presente all'`endpoint` dato per applicarle.
-    """
-    for switch in configs:
-        # Nelle rotte dell'API Rest, l'id dello switch deve essere un
-        # numero intero dal numero fisso di 16 cifre, con padding a 0
-        id = switch.id
-
-        for address in switch.addresses:
-            requests.post(url=f"{endpoint}/router/{id:016}", json={"address": address})
 
-        for route in switch.routes:
-            requests.post(url=f"{endpoint}/router/{id:016}", json={
-                "destination": route.destination,
-                "gateway": route.gateway,
-            })
+    Le configurazioni sono confrontate con quelle già installate, e soltanto
+    le differenze (vedi `config_changes`) vengono inviate con un'unica
+    richiesta alla rotta /router/batch.
+    """
+    changes = config_changes(get_installed_configs(endpoint), configs, prune_routes)
+    return http_session.post(url=f"{endpoint}/router/batch", json=changes)
 
-def post_configs_raw(endpoint: str, configs: List[Dict[str, Any]]):
+def post_configs_raw(endpoint: str, configs: List[Dict[str, Any]]) -> requests.Response:
     """
     Questa funzione svolge lo stesso compito di `post_configs`,
     ma usando una lista di dizionari piuttosto che oggetti di classe
     `SwitchConfig`; questo è utile quando si lavora con dati in formato JSON
     "grezzi" ricevuti in risposta dal server REST.
+    Trattandosi di una tabella di routing completa, le rotte non più
+    presenti vengono rimosse dagli switch (vedi `config_changes`).
     """
 
+    switch_configs: Dict[int, SwitchConfig] = {}
     for entry in configs:
         id = entry["switch_id"]
-        requests.post(url=f"{endpoint}/router/{id:016}", json={
-            "destination": entry["destination"],
-            "gateway": entry["gateway"],
-        })
+        switch_configs.setdefault(id, SwitchConfig(id=id)).routes.append(
+            StaticRoute(destination=entry["destination"], gateway=entry["gateway"])
+        )
+    return post_configs(endpoint=endpoint, configs=list(switch_configs.values()), prune_routes=True)
 
-def post_routes(endpoint: str, networks: List[Any], links: List[LinkWithParameters]) -> requests.Response:
+def post_routes(endpoint: str, networks: List[Any], links: List[LinkWithParameters], multipath: Optional[Dict[str, Any]] = None, cost_model: Optional[str] = None, compile: bool = False) -> requests.Response:
     """
     Questa funzione interagisce con la rotta custom /dijkstra
     dell'API REST il cui compito è calcolare le rotte ottimali utilizzando i parametri
     di rete e link proporzionati (`networks`, `links`) e l'algoritmo di Dijkstra.
+
+    Con `multipath` (e.g. `{ "stretch": 1.0 }` per i soli percorsi di costo minimo)
+    il controller installa direttamente le rotte con più gateway come gruppi select
+    OpenFlow; la risposta contiene comunque per ciascuna rotta il gateway principale.
+    `cost_model` sceglie il modello di costo dei collegamenti ("static", predefinito,
+    "unit" oppure "congestion", che tiene conto del traffico misurato sugli switch).
+    Con `compile` il controller aggrega le rotte ed installa direttamente i flow:
+    non occorre applicare la risposta con `post_configs_raw`.
     """
 
-    return requests.post(f"{endpoint}/dijkstra", json={
+    body: Dict[str, Any] = {
         "networks": networks,
 
         # Invochiamo `to_dict` su ciascun oggetto Link in quanto
         # non sono serializzabili automaticamente in formato JSON 
         "links": [link.to_dict() for link in links],
-    })
-
-
-def create_network():
-    net = Mininet(topo=ProjectTopology(), switch=OVSSwitch, link=TCLink, autoSetMacs=True, controller=RemoteController, waitConnected=True)
+    }
+    if multipath is not None:
+        body["multipath"] = multipath
+    if cost_model is not None:
+        body["cost_model"] = cost_model
+    if compile:
+        body["compile"] = True
+    return http_session.post(f"{endpoint}/dijkstra", json=body)
+
+
+# Indirizzi degli switch e subnet utenti della topologia del progetto
+PROJECT_SWITCHES_CONFIG = [
+    SwitchConfig(id=1, addresses=["10.0.0.254/24", "180.0.0.1/30", "200.0.0.1/30"]),
+    SwitchConfig(id=2, addresses=["11.0.0.254/24", "180.0.0.2/30", "180.1.1.1/30"]),
+    SwitchConfig(id=3, addresses=["192.168.1.254/24", "200.0.0.2/30", "170.0.0.1/30"]),
+    SwitchConfig(id=4, addresses=["10.8.1.254/24", "170.0.0.2/30", "180.1.2.1/30"]),
+    SwitchConfig(id=5, addresses=["180.1.1.2/30", "180.1.2.2/30"]),
+]
+PROJECT_NETWORKS = [
+    { "switch_id": 1, "subnets": ["10.0.0.0/24"] },
+    { "switch_id": 2, "subnets": ["11.0.0.0/24"] },
+    { "switch_id": 3, "subnets": ["192.168.1.0/24"] },
+    { "switch_id": 4, "subnets": ["10.8.1.0/24"]},
+    { "switch_id": 5, "subnets": []},
+]
+
+
+def create_network(topo: Optional[Topo] = None, compile_routes: bool = False):
+    """
+    Avvia la rete (la topologia del progetto, se `topo` non è specificata),
+    ne configura gli switch tramite il controller ed apre la CLI di Mininet.
+    Con `compile_routes` le rotte sono aggregate ed installate dal controller
+    (vedi `post_routes`), invece che una per una tramite rest_router.
+    """
+    net = Mininet(topo=topo if topo is not None else ProjectTopology(), switch=OVSSwitch, link=TCLink, autoSetMacs=True, controller=RemoteController, waitConnected=True)
     net.start()
 
     log.info(net.topo.host_list)
@@ -216,25 +372,17 @@ def create_network():
         log.info(sw.cmd(f'ovs-vsctl set Bridge {switch_name} protocols=OpenFlow13'))
 
     # Indirizzi IP da assegnare a ciascuno switch mediante chiamata API REST
-    switches_config = [
-        SwitchConfig(id=1, addresses=["10.0.0.254/24", "180.0.0.1/30", "200.0.0.1/30"]),
-        SwitchConfig(id=2, addresses=["11.0.0.254/24", "180.0.0.2/30", "180.1.1.1/30"]),
-        SwitchConfig(id=3, addresses=["192.168.1.254/24", "200.0.0.2/30", "170.0.0.1/30"]),
-        SwitchConfig(id=4, addresses=["10.8.1.254/24", "170.0.0.2/30", "180.1.2.1/30"]),
-        SwitchConfig(id=5, addresses=["180.1.1.2/30", "180.1.2.2/30"]),
-    ]
+    if isinstance(net.topo, GeneratedTopology):
+        switches_config = [SwitchConfig(id=dpid, addresses=addresses) for dpid, addresses in net.topo.fabric.addresses().items()]
+        networks = net.topo.fabric.networks()
+    else:
+        switches_config, networks = PROJECT_SWITCHES_CONFIG, PROJECT_NETWORKS
 
     endpoint = "http://localhost:8080"
     post_configs(endpoint=endpoint, configs=switches_config)
     risposta = post_routes(
         endpoint=endpoint,
-        networks=[
-            { "switch_id": 1, "subnets": ["10.0.0.0/24"] },
-            { "switch_id": 2, "subnets": ["11.0.0.0/24"] },
-            { "switch_id": 3, "subnets": ["192.168.1.0/24"] },
-            { "switch_id": 4, "subnets": ["10.8.1.0/24"]},
-            { "switch_id": 5, "subnets": []},
-        ],
+        networks=networks,
         # Escludiamo tutti i link che NON connettono due switch fra di loro
         # e.g. link fra un host ed il suo default gateway
         links=[
@@ -242,14 +390,22 @@ def create_network():
             if link.src_switch is not None
                 and link.dst_switch is not None
         ],
+        compile=compile_routes,
     )
 
     log.debug(risposta.content)
-    post_configs_raw(endpoint=endpoint, configs=json.loads(risposta.content))
+    if not compile_routes:
+        post_configs_raw(endpoint=endpoint, configs=json.loads(risposta.content))
     CLI(net)
     net.stop()
 
 
 if __name__ == '__main__':
+    # Topologia opzionale con la stessa sintassi di `mn --topo`, e.g. `python topology.py fattree,4`
     log.setLogLevel('info')
-    create_network()
+    if len(sys.argv) > 1:
+        name, args, kwargs = splitArgs(sys.argv[1])
+        # Le subnet delle topologie generate sono contigue: aggregate, occupano molti meno flow
+        create_network(topos[name](*args, **kwargs), compile_routes=True)
+    else:
+        create_network()
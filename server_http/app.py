@@ -1,62 +1,313 @@
 #!/usr/bin/python3
 # coding: utf-8
 
-import sqlite3
-import subprocess
+import asyncio
+import json
 import time
-import threading
 import socket
+import math
+import tempfile
+from collections import defaultdict
 from datetime import datetime
-from statistics import mean, stdev
 
-from flask import Flask, render_template, request, jsonify 
-# jsonfy è una funzione di Flask che converte i dati di input in una risposta formattata come JSON
+from quart import Quart, Response, render_template, request, jsonify 
+# Quart è la versione asincrona (ASGI) di Flask, con la stessa interfaccia:
+# richieste HTTP, misurazioni e scritture sul DB condividono un unico event loop.
+# jsonfy è una funzione che converte i dati di input in una risposta formattata come JSON
 
-app = Flask(__name__)
+import bulk
+from database import ConnectionPool, BatchWriter, PoolExhausted
+from prober import make_prober, resolve
+from maintenance import DAY, MINUTE, Maintenance, choose_level, create_rollup_tables, rollup_series, rollup_summary, update_rollups
+from rtt_stats import RttHistogram, RttSummary
+from sessions import DeadlineTimer, SessionScheduler
+
+app = Quart(__name__)
 
 DATABASE = 'rtt_measurements.db'
 PING_INTERVAL = 1
-
-# Variabili globali per gestire lo stato della misurazione
-measurement_thread = None #contiene il riferimento al thread che esegue la funzione di misurazione del RTT
-stop_flag = False # segnale di interruzione per il thread di misurazione
-current_measurements = [] # lista atta a memorizzare i risultati temporanei delle misurazioni RTT
-start_time = None # memorizza il timestamp di inizio della misurazione corrente, serve a determinare la durata della misurazione
-current_ip_dest = None # ip dell'host da pingare
-test_duration = 0 # durata del test in secondi
-measurement_start_dt = None # come start_time, serve però a memorizzare la timestamp sul database
+MIN_PING_INTERVAL = 0.01 # intervallo minimo ammesso fra due campioni (100 Hz)
+PROBE_BACKEND = 'icmp' # 'icmp' (socket ICMP nativi) oppure 'ping' (comando ping)
+PROBE_TIMEOUT = 1 # attesa massima (s) della risposta ad un singolo campione
+WRITE_BATCH_SIZE = 50 # numero massimo di misurazioni scritte con un solo commit
+WRITE_FLUSH_INTERVAL = 0.5 # tempo massimo (s) di attesa di una misurazione prima del commit
+MAX_CONCURRENT_SESSIONS = 4096 # numero massimo di sessioni di misurazione eseguite in parallelo
+SESSION_BUFFER_SIZE = 36000 # campioni tenuti in memoria per sessione (1 ora a 10 Hz, ~560 KB)
+SCHEMA_VERSION = 3 # versione dello schema del database, memorizzata in PRAGMA user_version
+CHART_POINTS = 1000 # numero di punti restituiti di default per i grafici storici
+MAX_CHART_POINTS = 10000
+PAGE_SIZE = 100 # righe per pagina della tabella dello storico
+MAX_PAGE_SIZE = 1000
+STREAM_KEEPALIVE = 15 # secondi senza nuovi campioni dopo cui lo stream invia un keep-alive
+RAW_RETENTION = 7 * DAY # per quanto tempo (ms) si conservano le misurazioni grezze
+MINUTE_RETENTION = 90 * DAY # e i rollup per minuto; quelli per ora si conservano sempre
+MAINTENANCE_INTERVAL = 300 # secondi fra due cicli di scadenza e compattazione
+IMPORT_MAX_BYTES = 4 * 1024 ** 3 # dimensione massima di un file importato con /import_measurements
+IMPORT_SPOOL_BYTES = 1024 ** 2 # dati ricevuti accumulati prima di ogni scrittura su disco
+
+# il corpo delle richieste viene letto a blocchi, il limite serve soltanto per /import_measurements
+app.config["MAX_CONTENT_LENGTH"] = IMPORT_MAX_BYTES
+
+db = ConnectionPool(DATABASE) # connessioni al database condivise fra tutti i thread
 
 def init_db():
     """
-    Inizializza il database SQLite e crea la tabella measurements se non esiste.
-    """
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor() # crea un cursore che funge da intermediario tra python e il db
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS measurements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            ip_dest TEXT NOT NULL,
-            ip_src TEXT NOT NULL,
-            rtt REAL NOT NULL,
-            duration INTEGER NOT NULL
+    Inizializza il database SQLite:
+    - hosts: tabella di lookup degli indirizzi, memorizzati una sola volta;
+    - samples: le misurazioni grezze (timestamp in millisecondi dall'epoch, host per id),
+      indicizzate per host e tempo, con la vista measurements che riporta gli indirizzi per esteso;
+    - host_stats: aggregati e istogramma degli RTT di ciascun host;
+    - rollup_minute e rollup_hour: riassunti per minuto e per ora (vedi maintenance.py).
+    Un database creato con uno schema precedente viene migrato (timestamp testuali,
+    indirizzi ripetuti su ogni riga, nessun istogramma o rollup).
+    """
+    with db.connection() as conn:
+        c = conn.cursor() # crea un cursore che funge da intermediario tra python e il db
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # abilitare l'incremental vacuum richiede un VACUUM, dato che il file è già stato
+        # inizializzato (journal_mode = WAL); su un database nuovo è immediato
+        vacuum = c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if vacuum:
+            c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        old_measurements = "measurements" in existing # tabella delle versioni precedenti (ora è una vista)
+        if old_measurements:
+            c.execute("ALTER TABLE measurements RENAME TO measurements_old")
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS hosts (
+                id INTEGER PRIMARY KEY,
+                address TEXT NOT NULL UNIQUE
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS samples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                dest_id INTEGER NOT NULL REFERENCES hosts (id),
+                src_id INTEGER NOT NULL REFERENCES hosts (id),
+                rtt REAL NOT NULL,
+                duration INTEGER NOT NULL
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_samples_host_time ON samples (dest_id, timestamp)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_samples_time ON samples (timestamp)") # scadenza ed esportazione
+        c.execute('''
+            CREATE VIEW IF NOT EXISTS measurements AS
+            SELECT s.id, s.timestamp, d.address AS ip_dest, r.address AS ip_src, s.rtt, s.duration
+            FROM samples s
+            JOIN hosts d ON d.id = s.dest_id
+            JOIN hosts r ON r.id = s.src_id
+        ''')
+        # aggregati "correnti" per host: media e deviazione standard si ricavano in O(1),
+        # min, max e percentili dall'istogramma (RttHistogram serializzato in JSON)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS host_stats (
+                ip_dest TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                sum_sq REAL NOT NULL,
+                histogram TEXT
+            )
+        ''')
+        if version == 1:
+            c.execute("ALTER TABLE host_stats ADD COLUMN histogram TEXT")
+        create_rollup_tables(c)
+
+        if old_measurements:
+            # fino alla versione 0 i timestamp erano stringhe in ora locale: 'utc' le converte prima dell'epoch
+            timestamp = "CAST(strftime('%s', m.timestamp, 'utc') AS INTEGER) * 1000" if version == 0 else "m.timestamp"
+            c.execute('''
+                INSERT OR IGNORE INTO hosts (address)
+                SELECT ip_dest FROM measurements_old UNION SELECT ip_src FROM measurements_old
+            ''')
+            c.execute('''
+                INSERT INTO samples (id, timestamp, dest_id, src_id, rtt, duration)
+                SELECT m.id, %s, d.id, r.id, m.rtt, m.duration
+                FROM measurements_old m
+                JOIN hosts d ON d.address = m.ip_dest
+                JOIN hosts r ON r.address = m.ip_src
+                ORDER BY m.id
+            ''' % timestamp)
+            c.execute("DROP TABLE measurements_old")
+            c.execute("DROP INDEX IF EXISTS idx_measurements_host_time")
+
+            if version < 2:
+                # un'unica scansione delle misurazioni già presenti, poi gli aggregati si aggiornano ad ogni scrittura
+                c.execute("DELETE FROM host_stats")
+                c.execute('''
+                    INSERT INTO host_stats (ip_dest, count, sum, sum_sq)
+                    SELECT ip_dest, COUNT(*), SUM(rtt), SUM(rtt * rtt)
+                    FROM measurements
+                    GROUP BY ip_dest
+                ''')
+                histograms = defaultdict(RttHistogram)
+                for ip_dest, rtt in c.execute("SELECT ip_dest, rtt FROM measurements"):
+                    histograms[ip_dest].add(rtt)
+                c.executemany(
+                    "UPDATE host_stats SET histogram = ? WHERE ip_dest = ?",
+                    [(histogram.to_json(), ip_dest) for ip_dest, histogram in histograms.items()]
+                )
+            if version < 3:
+                rows = conn.execute("SELECT timestamp, dest_id, rtt FROM samples ORDER BY dest_id, timestamp")
+                for chunk in iter(lambda: rows.fetchmany(50000), []):
+                    update_rollups(conn, chunk)
+
+        c.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+        conn.commit()
+        if vacuum:
+            conn.execute("VACUUM") # una tantum, riscrive il file con auto_vacuum incrementale
+
+def host_ids(conn, addresses):
+    """
+    Restituisce {indirizzo: id} per gli indirizzi dati, aggiungendo alla tabella hosts quelli nuovi.
+    """
+    addresses = list(set(addresses))
+    conn.executemany("INSERT OR IGNORE INTO hosts (address) VALUES (?)", [(a,) for a in addresses])
+    ids = {}
+    for i in range(0, len(addresses), 500): # limite sul numero di parametri di una query
+        part = addresses[i:i + 500]
+        ids.update(conn.execute(
+            "SELECT address, id FROM hosts WHERE address IN (%s)" % ", ".join("?" * len(part)), part
+        ))
+    return ids
+
+def write_measurements(conn, rows):
+    """
+    Scrive un gruppo di misurazioni RTT (timestamp, ip_dest, ip_src, rtt, duration)
+    nel database (invocata da `writer`, all'interno di un'unica transazione),
+    aggiornando anche gli aggregati e gli istogrammi per host e i rollup.
+    """
+    ids = host_ids(conn, [row[1] for row in rows] + [row[2] for row in rows])
+    samples = [(timestamp, ids[ip_dest], ids[ip_src], rtt, duration)
+               for timestamp, ip_dest, ip_src, rtt, duration in rows]
+    conn.executemany('''
+        INSERT INTO samples (timestamp, dest_id, src_id, rtt, duration)
+        VALUES (?, ?, ?, ?, ?)
+    ''', samples)
+
+    totals = defaultdict(lambda: [0, 0.0, 0.0]) # ip_dest -> [count, sum, sum_sq]
+    histograms = defaultdict(RttHistogram)
+    for _, ip_dest, _, rtt, _ in rows:
+        total = totals[ip_dest]
+        total[0] += 1
+        total[1] += rtt
+        total[2] += rtt * rtt
+        histograms[ip_dest].add(rtt)
+    conn.executemany('''
+        INSERT INTO host_stats (ip_dest, count, sum, sum_sq)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (ip_dest) DO UPDATE SET
+            count = count + excluded.count,
+            sum = sum + excluded.sum,
+            sum_sq = sum_sq + excluded.sum_sq
+    ''', [(ip_dest, *total) for ip_dest, total in totals.items()])
+
+    # l'istogramma del gruppo viene fuso con quello già memorizzato per l'host
+    for ip_dest, histogram in histograms.items():
+        stored = conn.execute("SELECT histogram FROM host_stats WHERE ip_dest = ?", (ip_dest,)).fetchone()[0]
+        histogram.merge(RttHistogram.from_json(stored))
+        conn.execute("UPDATE host_stats SET histogram = ? WHERE ip_dest = ?", (histogram.to_json(), ip_dest))
+
+    update_rollups(conn, [(timestamp, dest_id, rtt) for timestamp, dest_id, _, rtt, _ in samples])
+
+def get_host_stats(conn, ip_dest):
+    """
+    Restituisce (media, deviazione standard campionaria) degli RTT verso `ip_dest`
+    a partire dagli aggregati in host_stats, senza rileggere le misurazioni.
+    """
+    row = conn.execute(
+        "SELECT count, sum, sum_sq FROM host_stats WHERE ip_dest = ?", (ip_dest,)
+    ).fetchone()
+    if row is None or row[0] == 0:
+        return 0, 0
+    count, total, total_sq = row
+    avg = total / count
+    if count == 1:
+        return avg, 0
+    variance = (total_sq - total * total / count) / (count - 1)
+    return avg, math.sqrt(max(variance, 0)) # max(): evita valori negativi dovuti agli arrotondamenti
+
+def get_host_percentiles(conn, ip_dest):
+    """
+    Restituisce min, max e percentili degli RTT verso `ip_dest` dall'istogramma
+    memorizzato in host_stats, senza rileggere le misurazioni.
+    """
+    row = conn.execute("SELECT histogram FROM host_stats WHERE ip_dest = ?", (ip_dest,)).fetchone()
+    return RttHistogram.from_json(row[0] if row else None).summary()
+
+# le misurazioni vengono scritte a gruppi da un task dedicato
+writer = BatchWriter(db, write_measurements, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL)
+
+# scadenza dei dati grezzi e dei rollup per minuto, compattazione del file
+maintenance = Maintenance(db, RAW_RETENTION, MINUTE_RETENTION, interval=MAINTENANCE_INTERVAL)
+
+def downsample_host(conn, ip_dest, points, start=0, end=2 ** 62):
+    """
+    Restituisce al più `points` tuple (indice, timestamp, rtt) che riassumono le
+    misurazioni verso `ip_dest` nell'intervallo [start, end), in ordine di tempo.
+    Se le misurazioni sono di più, vengono divise in gruppi consecutivi e di
+    ciascun gruppo si tengono soltanto il minimo e il massimo (nel loro ordine),
+    così da preservare picchi e andamento; il calcolo è svolto interamente da SQLite.
+    """
+    where = "ip_dest = ? AND timestamp >= ? AND timestamp < ?"
+    params = (ip_dest, start, end)
+    count = conn.execute("SELECT COUNT(*) FROM measurements WHERE " + where, params).fetchone()[0]
+    if count <= points:
+        rows = conn.execute(
+            "SELECT timestamp, rtt FROM measurements WHERE %s ORDER BY timestamp, id" % where, params
+        ).fetchall()
+        return [(i, timestamp, rtt) for i, (timestamp, rtt) in enumerate(rows)]
+
+    bucket_size = math.ceil(count / max(1, points // 2))
+    # con un solo MIN() o MAX(), SQLite prende le colonne "libere" (idx, timestamp)
+    # dalla riga in cui si trova il minimo o il massimo
+    query = '''
+        WITH numbered AS (
+            SELECT ROW_NUMBER() OVER (ORDER BY timestamp, id) - 1 AS idx, timestamp, rtt
+            FROM measurements
+            WHERE {where}
         )
-    ''')
-    conn.commit()
-    conn.close()
+        SELECT idx / ? AS bucket, idx, timestamp, {aggregate}(rtt)
+        FROM numbered
+        GROUP BY bucket
+    '''
+    selected = {}
+    for aggregate in ("MIN", "MAX") if points > 1 else ("MAX",): # un solo punto: il picco
+        for _, idx, timestamp, rtt in conn.execute(query.format(where=where, aggregate=aggregate), params + (bucket_size,)):
+            selected[idx] = (timestamp, rtt)
+    return [(idx, timestamp, rtt) for idx, (timestamp, rtt) in sorted(selected.items())]
+
+def parse_int_param(name, default, maximum):
+    """
+    Legge un parametro intero dalla query string, limitandolo a [1, maximum].
+    """
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        value = default
+    return max(1, min(value, maximum))
+
+def parse_time_param(name):
+    """
+    Legge un istante dalla query string, in millisecondi dall'epoch oppure in formato
+    ISO 8601 (es. 2024-05-01T12:00:00, ora locale se senza fuso); None se assente.
+    Solleva ValueError se il valore non è valido.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
 
 def insert_measurement(timestamp, ip_dest, ip_src, rtt, duration):
     """
-    Inserisce una singola misurazione RTT nel database.
+    Accoda una singola misurazione RTT per la scrittura nel database
+    (`timestamp` in millisecondi dall'epoch).
     """
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO measurements (timestamp, ip_dest, ip_src, rtt, duration)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (timestamp, ip_dest, ip_src, rtt, duration))
-    conn.commit()
-    conn.close()
+    writer.submit((timestamp, ip_dest, ip_src, rtt, duration))
 
 def get_ip_src():
     """
@@ -72,245 +323,459 @@ def get_ip_src():
         ip_src = "127.0.0.1" # !!! mettere qui l'indirizzo di default
     return ip_src
 
-def ping_once(ip_dest):
+# backend di misurazione condiviso da tutte le sessioni, creato all'avvio del server
+prober = None
+
+async def measure_rtt(session):
     """
-    Esegue 'ping -c 1 -W 1 ip_dest' e ritorna l'RTT in ms (float),
-    oppure None se non riesce.
+    Coroutine che esegue un ping ogni `session.interval` secondi, su scadenze assolute
+    del clock monotono, salvando i risultati nel DB e nel buffer della sessione.
+    `elapsed` è l'istante di invio del probe rispetto all'avvio della sessione.
+    Termina trascorsa la durata, oppure viene annullata (in qualsiasi attesa)
+    quando la sessione viene fermata.
     """
-    try:
-        result = subprocess.run(
-            ["ping", "-c", "1", "-W", "1", ip_dest],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            for line in result.stdout.split('\n'):
-                if "time=" in line:
-                    rtt_str = line.split("time=")[1].split(" ")[0]
-                    return float(rtt_str)
-    except Exception as e:
-        print("Errore ping:", e)
-    return None
-
-def measure_rtt(ip_dest, duration):
-    """
-    Thread che esegue un ping ogni PING_INTERVAL secondi, salvando i risultati
-    nel DB e in current_measurements. Si interrompe se stop_flag è True
-    o se è trascorsa la durata.
-    """
-    global stop_flag, current_measurements, start_time # specifico che utilizzerò queste variabili globali
     ip_src = get_ip_src() 
-    start_time = time.time()
-    end_time = start_time + duration
-
-    while True:
-        if stop_flag:
-            break
-        if time.time() > end_time:
-            break
-
-        rtt_ms = ping_once(ip_dest)
-        if rtt_ms is not None:
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            elapsed = time.time() - start_time
-            insert_measurement(now, ip_dest, ip_src, rtt_ms, duration)
-            current_measurements.append((elapsed, rtt_ms))
-        time.sleep(PING_INTERVAL)
+    end_ns = session.start_ns + int(session.duration * 1e9)
+    address = await resolve(session.ip_dest)
+    timer = DeadlineTimer(session.interval, time.monotonic_ns())
+
+    while timer.deadline <= end_ns:
+        result = await prober.probe(address)
+        if result is None:
+            session.lost += 1
+        else:
+            offset_ns = result.sent_ns - session.start_ns
+            # timestamp sul DB ricavato dal clock monotono: non risente delle correzioni dell'orologio
+            timestamp = int(session.start_time * 1000) + offset_ns // 1000000
+            insert_measurement(timestamp, session.ip_dest, ip_src, result.rtt_ms, session.duration)
+            session.add_sample(offset_ns / 1e9, result.rtt_ms)
+        await timer.wait_next()
+        session.missed_deadlines = timer.missed
+
+# sessioni di misurazione contemporanee, ciascuna identificata da un id
+scheduler = SessionScheduler(measure_rtt, max_sessions=MAX_CONCURRENT_SESSIONS, buffer_size=SESSION_BUFFER_SIZE)
+
+@app.before_serving
+async def startup():
+    global prober
+    init_db()
+    writer.start()
+    maintenance.start()
+    prober = make_prober(backend=PROBE_BACKEND, timeout=PROBE_TIMEOUT)
+
+@app.after_serving
+async def shutdown():
+    await scheduler.shutdown()
+    await maintenance.stop()
+    await writer.stop() # scrive le misurazioni ancora in coda prima di uscire
+    prober.close()
+
+async def request_param(name, default=None):
+    """
+    Legge un parametro della richiesta dalla query string, dal form o dal corpo JSON.
+    """
+    value = (await request.values).get(name)
+    if value is None and request.is_json:
+        value = ((await request.get_json(silent=True)) or {}).get(name)
+    return default if value is None else value
 
 @app.route('/')
-def index():
+async def index():
     """
     Pagina principale: form per inserire IP/Hostname + durata,
     e pulsante per avviare misurazione o vedere lo storico.
     """
-    return render_template('index.html')
+    return await render_template('index.html')
 
 @app.route('/start_measurement', methods=['POST'])
-def start_measurement():
+async def start_measurement():
     """
-    Avvia una nuova misurazione RTT in un thread separato.
+    Avvia una nuova sessione di misurazione RTT, eseguita in parallelo alle altre.
+    Da form restituisce la pagina dei risultati, da JSON l'id della sessione.
     """
-    global measurement_thread, stop_flag, current_measurements
-    global current_ip_dest, test_duration, start_time, measurement_start_dt
-
-    stop_flag = False
-    current_measurements = []
-
-    current_ip_dest = request.form.get('ip_dest')  # IP o hostname
-    test_duration = int(request.form.get('duration', 10))
-
-    measurement_start_dt = datetime.now()
+    ip_dest = await request_param('ip_dest')  # IP o hostname
+    if not ip_dest:
+        return jsonify({"error": "No host provided"}), 400
+    duration = int(await request_param('duration', 10))
+    interval = max(MIN_PING_INTERVAL, float(await request_param('interval', PING_INTERVAL)))
 
-    measurement_thread = threading.Thread(
-        target=measure_rtt,
-        args=(current_ip_dest, test_duration)
-    )
-    measurement_thread.start()
+    session = scheduler.start(ip_dest, duration, interval)
 
-    return render_template('results.html', ip_dest=current_ip_dest)
+    if request.is_json:
+        return jsonify(session.to_dict())
+    return await render_template('results.html', ip_dest=ip_dest, session_id=session.id)
 
 @app.route('/stop_measurement', methods=['POST'])
-def stop_measurement():
+async def stop_measurement():
+    """
+    Ferma la sessione indicata da `session_id` (o, se assente, l'ultima avviata).
     """
-    Ferma la misurazione corrente impostando stop_flag.
+    session = scheduler.stop(await request_param('session_id'))
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify({"status": "stopped", "session_id": session.id}) 
+
+@app.route('/sessions', methods=['GET'])
+async def list_sessions():
+    """
+    Elenca le sessioni di misurazione in corso, in coda e concluse di recente.
     """
-    global stop_flag
-    stop_flag = True
-    return jsonify({"status": "stopped"}) 
+    return jsonify([session.to_dict() for session in scheduler.sessions()])
 
 @app.route('/get_current_data', methods=['GET'])
-def get_current_data():
+async def get_current_data():
     """
-    Restituisce i dati (elapsed, rtt) della sessione corrente + stat (media, std).
+    Restituisce i dati (elapsed, rtt) della sessione `session_id` (o dell'ultima avviata)
+    + stat (media, std, min, max, percentili e jitter RFC 3550). Con `since=<seq>` vengono restituiti soltanto i campioni successivi
+    ai primi `seq`; `seq` nella risposta è il valore da passare alla richiesta seguente.
+    Vengono conservati in memoria solo gli ultimi SESSION_BUFFER_SIZE campioni.
     Se non ci sono misurazioni, ritorna un array vuoto.
     """
-    global current_measurements
-    if not current_measurements:
+    session = scheduler.get(request.args.get('session_id'))
+    if session is None or not session.measurements.total:
         return jsonify([])
 
-    rtt_vals = [m[1] for m in current_measurements]
-    if len(rtt_vals) > 1:
-        avg_rtt = mean(rtt_vals)
-        std_rtt = stdev(rtt_vals)
-    else:
-        avg_rtt = rtt_vals[0] if rtt_vals else 0
-        std_rtt = 0
-
+    try:
+        since = max(0, int(request.args.get('since', 0)))
+    except ValueError:
+        since = 0
+    current_measurements, seq = session.samples_since(since)
     return jsonify({
         "measurements": current_measurements,
-        "avg_rtt": avg_rtt,
-        "std_rtt": std_rtt
+        "seq": seq,
+        "avg_rtt": session.stats.mean,
+        "std_rtt": session.stats.std,
+        "percentiles": session.histogram.summary(),
+        "jitter": session.jitter.value,
+        "lost": session.lost,
+        "missed_deadlines": session.missed_deadlines
+    })
+
+@app.route('/stream_current_data', methods=['GET'])
+async def stream_current_data():
+    """
+    Stream Server-Sent Events dei dati della sessione `session_id` (o dell'ultima avviata):
+    ogni evento contiene soltanto i nuovi campioni (elapsed, rtt) + stat (media, std,
+    min, max, percentili e jitter) aggiornate incrementalmente. L'id di ogni evento è il numero di campioni già inviati,
+    così che alla riconnessione (header Last-Event-ID) si riparta da dove ci si era fermati.
+    A sessione conclusa viene inviato l'evento `end`.
+    """
+    session = scheduler.get(request.args.get('session_id'))
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    try:
+        start = int(request.headers.get('Last-Event-ID', request.args.get('since', 0)))
+    except ValueError:
+        start = 0
+
+    async def generate():
+        seq = start
+        while True:
+            await session.wait_samples(seq, STREAM_KEEPALIVE)
+            samples, seq = session.samples_since(seq)
+            if samples:
+                yield "id: %d\ndata: %s\n\n" % (seq, json.dumps({
+                    "samples": samples,
+                    "count": session.stats.count,
+                    "avg_rtt": session.stats.mean,
+                    "std_rtt": session.stats.std,
+                    "percentiles": session.histogram.summary(),
+                    "jitter": session.jitter.value,
+                    "lost": session.lost,
+                    "missed_deadlines": session.missed_deadlines,
+                }))
+            elif session.status == "finished":
+                yield "event: end\ndata: {}\n\n"
+                return
+            else:
+                yield ": keep-alive\n\n"
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no", # evita il buffering di eventuali reverse proxy
     })
+    response.timeout = None # lo stream resta aperto per tutta la durata della sessione
+    return response
+
+# Le route che interrogano SQLite (get_history_data, get_host_history_data, get_host_measurements)
+# restano funzioni sincrone, dato che le chiamate a sqlite3 sono bloccanti:
+# Quart le esegue in un thread a parte, senza bloccare l'event loop.
 
 @app.route('/get_history_data', methods=['GET'])
 def get_history_data():
     """
-    Restituisce i dati storici (old_data e new_data) FILTRATI per l'host corrente,
-    in modo che il grafico in results.html mostri solo misure relative a current_ip_dest.
+    Restituisce i dati storici (old_data e new_data) FILTRATI per l'host della sessione,
+    in modo che il grafico in results.html mostri solo misure relative a quell'host;
+    le misure "nuove" sono quelle successive all'avvio della sessione `session_id`.
     """
-    global measurement_start_dt, current_ip_dest
+    session = scheduler.get(request.args.get('session_id'))
+    # inizio della sessione in millisecondi dall'epoch, come i timestamp sul database
+    measurement_start_ms = int(session.start_dt.timestamp() * 1000) if session is not None else None
 
-    # 1) Recupera l'host della misurazione corrente via query param (o fallback a current_ip_dest)
-    host = request.args.get('ip_dest', current_ip_dest)
+    # 1) Recupera l'host della misurazione corrente via query param (o fallback all'host della sessione)
+    host = request.args.get('ip_dest', session.ip_dest if session is not None else None)
     if not host:
         return jsonify({})  # se manca, ritorna vuoto
 
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    # 2) Seleziona TUTTE le misure per quell'host, ordinate per ID
-    c.execute("""
-        SELECT timestamp, rtt
-        FROM measurements
-        WHERE ip_dest = ?
-        ORDER BY id ASC
-    """, (host,))
-    rows = c.fetchall()
-    conn.close()
-
-    # 3) Separa in old_vals/new_vals basandoci su measurement_start_dt
-    old_vals = []
-    new_vals = []
-    for row in rows:
-        ts_str, rtt_val = row
-        dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-        if measurement_start_dt and dt >= measurement_start_dt:
-            new_vals.append(rtt_val)
-        else:
-            old_vals.append(rtt_val)
+    points = parse_int_param('points', CHART_POINTS, MAX_CHART_POINTS)
+
+    with db.connection() as conn:
+        # 2) Riassume le misure per quell'host, ordinate per tempo, in al più `points` punti
+        chart = downsample_host(conn, host, points)
+
+        # 3) Le misure con indice >= base_index sono successive all'avvio della sessione
+        # (senza sessione sono tutte "vecchie")
+        base_index = conn.execute(
+            "SELECT COUNT(*) FROM measurements WHERE ip_dest = ? AND timestamp < ?",
+            (host, measurement_start_ms if measurement_start_ms else 2 ** 62)
+        ).fetchone()[0]
+
+        # 5) Media, std e percentili su tutti i rtts di quell'host, dagli aggregati
+        hist_avg, hist_std = get_host_stats(conn, host)
+        hist_percentiles = get_host_percentiles(conn, host)
 
     # 4) Creiamo (x,y) per old e new
-    old_data = [(i, old_vals[i]) for i in range(len(old_vals))]
-    base_index = len(old_vals)
-    new_data = [(base_index + i, new_vals[i]) for i in range(len(new_vals))]
-
-    # 5) Calcoliamo la media e std su tutti i rtts di quell'host
-    all_rtts = old_vals + new_vals
-    if len(all_rtts) > 1:
-        hist_avg = mean(all_rtts)
-        hist_std = stdev(all_rtts)
-    elif len(all_rtts) == 1:
-        hist_avg = all_rtts[0]
-        hist_std = 0
-    else:
-        hist_avg = 0
-        hist_std = 0
+    old_data = [(i, rtt) for i, _, rtt in chart if i < base_index]
+    new_data = [(i, rtt) for i, _, rtt in chart if i >= base_index]
 
     return jsonify({
         "old_data": old_data,
         "new_data": new_data,
         "hist_avg": hist_avg,
-        "hist_std": hist_std
+        "hist_std": hist_std,
+        "hist_percentiles": hist_percentiles
     })
 
 @app.route('/show_history', methods=['GET'])
-def show_history():
+async def show_history():
     """
     Mostra una pagina di storico dedicata a un singolo host (IP/hostname).
     """
     host = request.args.get('ip_dest', None)
     if not host:
         return "Nessun host specificato", 400
-    return render_template('history.html', ip_dest=host)
+    return await render_template('history.html', ip_dest=host)
 
 @app.route('/get_host_history_data', methods=['GET'])
 def get_host_history_data():
     """
-    Restituisce TUTTE le misurazioni fatte a uno specifico host,
-    + stat (media, std) e la lista per tabella.
+    Restituisce il grafico delle misurazioni fatte a uno specifico host nell'intervallo
+    [`start`, `end`) (di default tutto lo storico), ridotto a circa `points` punti
+    {x: timestamp in ms, y: media, min, max}, + stat (media, std, min, max, percentili)
+    e numero di misurazioni: dell'intervallo se indicato, di tutto lo storico altrimenti.
+    Il grafico è letto dai dati grezzi oppure dal rollup più grossolano che fornisce
+    ancora abbastanza punti (`resolution`: raw, minute o hour).
+    Le singole misurazioni per la tabella si ottengono a pagine da /get_host_measurements.
     """
     host = request.args.get('ip_dest', None)
     if not host:
         return jsonify({"error": "No host provided"}), 400
-
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    c.execute('''
-        SELECT timestamp, ip_dest, ip_src, rtt, duration
-        FROM measurements
-        WHERE ip_dest = ?
-        ORDER BY id ASC
-    ''', (host,))
-    rows = c.fetchall()
-    conn.close()
-
-    rtt_vals = [r[3] for r in rows]
-    if len(rtt_vals) > 1:
-        avg_rtt = mean(rtt_vals)
-        std_rtt = stdev(rtt_vals)
-    elif len(rtt_vals) == 1:
-        avg_rtt = rtt_vals[0]
-        std_rtt = 0
-    else:
-        avg_rtt = 0
-        std_rtt = 0
-
-    # Costruzione dati x,y per il grafico
-    data_for_chart = []
-    for i, r in enumerate(rows):
-        data_for_chart.append({
-            "x": i,
-            "y": r[3]  # rtt
-        })
-
-    # Lista misurazioni integrale per la tabella
-    measurements_list = []
-    for r in rows:
-        measurements_list.append({
-            "timestamp": r[0],
-            "ip_dest":   r[1],
-            "ip_src":    r[2],
-            "rtt":       r[3],
-            "duration":  r[4]
-        })
-    measurements_list.reverse() # inverti la lista per una migliore resa visiva della tabella
+    points = parse_int_param('points', CHART_POINTS, MAX_CHART_POINTS)
+    try:
+        start, end = parse_time_param('start'), parse_time_param('end')
+    except ValueError:
+        return jsonify({"error": "Invalid start/end"}), 400
+    ranged = start is not None or end is not None
+    now = int(time.time() * 1000)
+
+    with db.connection() as conn:
+        dest = conn.execute("SELECT id FROM hosts WHERE address = ?", (host,)).fetchone()
+        if start is None:
+            # inizio dello storico: i rollup per ora si conservano più a lungo dei dati grezzi
+            first = conn.execute(
+                "SELECT MIN(bucket) FROM rollup_hour WHERE dest_id = ?", (dest[0] if dest else None,)
+            ).fetchone()[0]
+            start = first if first is not None else now
+        if end is None:
+            end = now + MINUTE # comprende le misure appena scritte
+
+        level = choose_level(start, end, points, now, RAW_RETENTION, MINUTE_RETENTION)
+        if dest is None:
+            chart = []
+        elif level is None:
+            chart = [{"x": timestamp, "y": rtt, "min": rtt, "max": rtt}
+                     for _, timestamp, rtt in downsample_host(conn, host, points, start, end)]
+        else:
+            chart = [{"x": bucket, "y": avg, "min": low, "max": high}
+                     for bucket, avg, low, high in rollup_series(conn, level, dest[0], start, end, points)]
+
+        if ranged:
+            # gli intervalli interi si leggono dai rollup (per minuto anche per i dati grezzi),
+            # soltanto i minuti a cavallo degli estremi dai campioni grezzi
+            summary = rollup_summary(conn, level or "minute", dest[0], start, end) if dest else RttSummary()
+            avg_rtt, std_rtt = summary.mean, summary.std
+            percentiles = summary.histogram.summary()
+            count = summary.count
+        else:
+            avg_rtt, std_rtt = get_host_stats(conn, host)
+            percentiles = get_host_percentiles(conn, host)
+            row = conn.execute("SELECT count FROM host_stats WHERE ip_dest = ?", (host,)).fetchone()
+            count = row[0] if row else 0
 
     return jsonify({
-        "chart_data": data_for_chart,
+        "chart_data": chart,
+        "resolution": level or "raw",
         "avg_rtt": avg_rtt,
         "std_rtt": std_rtt,
-        "measurements": measurements_list
+        "percentiles": percentiles,
+        "count": count
     })
 
+@app.route('/get_host_measurements', methods=['GET'])
+def get_host_measurements():
+    """
+    Restituisce una pagina di misurazioni verso uno specifico host, dalla più recente.
+    La pagina successiva si ottiene passando come `cursor` il `next_cursor` ricevuto
+    (null quando non ci sono altre misurazioni): la posizione è individuata tramite
+    l'indice (ip_dest, timestamp), senza OFFSET e quindi senza rileggere le pagine precedenti.
+    """
+    host = request.args.get('ip_dest', None)
+    if not host:
+        return jsonify({"error": "No host provided"}), 400
+    limit = parse_int_param('limit', PAGE_SIZE, MAX_PAGE_SIZE)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_ts, cursor_id = (int(part) for part in cursor.split(':'))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    else:
+        cursor_ts, cursor_id = 2 ** 62, 2 ** 62 # nessun cursore: si parte dalla misura più recente
+
+    with db.connection() as conn:
+        rows = conn.execute('''
+            SELECT id, timestamp,
+                   strftime('%Y-%m-%d %H:%M:%S', timestamp / 1000, 'unixepoch', 'localtime'),
+                   ip_dest, ip_src, rtt, duration
+            FROM measurements
+            WHERE ip_dest = ? AND (timestamp, id) < (?, ?)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (host, cursor_ts, cursor_id, limit + 1)).fetchall() # una riga in più: esiste una pagina successiva?
+
+    page = rows[:limit]
+    next_cursor = "%d:%d" % (page[-1][1], page[-1][0]) if len(rows) > limit else None
+
+    return jsonify({
+        "measurements": [{
+            "timestamp": r[2],
+            "ip_dest":   r[3],
+            "ip_src":    r[4],
+            "rtt":       r[5],
+            "duration":  r[6]
+        } for r in page],
+        "next_cursor": next_cursor
+    })
+
+class ExportStream:
+    """
+    Corpo in streaming di /export_measurements: ogni blocco di `chunks` viene letto
+    dal database e codificato in un thread a parte, con la connessione `conn` già
+    prelevata dal pool. La connessione torna al pool con `aclose`, che Quart chiama
+    al termine della risposta anche se l'invio non è mai iniziato (a differenza
+    del blocco finally di un generatore asincrono non ancora avviato).
+    """
+
+    def __init__(self, conn, chunks):
+        self.conn = conn
+        self.chunks = chunks
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await asyncio.get_running_loop().run_in_executor(None, next, self.chunks, None)
+        if data is None:
+            await self.aclose()
+            raise StopAsyncIteration
+        return data
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        def close():
+            try:
+                self.chunks.close()
+            finally:
+                db.release(self.conn)
+
+        await asyncio.get_running_loop().run_in_executor(None, close)
+
+@app.route('/export_measurements', methods=['GET'])
+async def export_measurements():
+    """
+    Esporta le misurazioni in ordine di tempo nel formato `format` (csv, oppure arrow
+    o parquet se pyarrow è installato), filtrate per host (`ip_dest`) e intervallo
+    [`start`, `end`). Le righe vengono lette e codificate a blocchi, in un thread a parte,
+    e inviate man mano: la memoria usata non dipende dal numero di misurazioni.
+    Ogni esportazione occupa una connessione del pool per tutta la sua durata: se sono
+    tutte occupate la richiesta viene rifiutata (503) invece di attenderne una, perché
+    l'attesa bloccherebbe un thread che le altre esportazioni usano per proseguire.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in bulk.available_formats():
+        return jsonify({"error": "Unsupported format", "formats": bulk.available_formats()}), 400
+    try:
+        start, end = parse_time_param('start'), parse_time_param('end')
+    except ValueError:
+        return jsonify({"error": "Invalid time range"}), 400
+    host = request.args.get('ip_dest')
+
+    try:
+        # L'eventuale apertura di una nuova connessione è bloccante: avviene in un thread a parte
+        conn = await asyncio.get_running_loop().run_in_executor(None, db.acquire, 0)
+    except PoolExhausted:
+        return jsonify({"error": "Too many concurrent exports, retry later"}), 503, {"Retry-After": "5"}
+
+    response = Response(ExportStream(conn, bulk.export_chunks(conn, fmt, host, start, end)), mimetype=bulk.MIME_TYPES[fmt], headers={
+        "Content-Disposition": 'attachment; filename="measurements.%s"' % fmt,
+    })
+    response.timeout = None # l'esportazione di molte settimane di dati può richiedere tempo
+    return response
+
+@app.route('/import_measurements', methods=['POST'])
+async def import_measurements():
+    """
+    Importa le misurazioni da un file CSV nel corpo della richiesta, con le stesse
+    colonne prodotte da /export_measurements?format=csv. Il file viene prima salvato
+    su disco, poi validato e scritto sul database a blocchi (vedi `bulk.import_csv`),
+    aggiornando anche aggregati e istogrammi degli host.
+    Le scritture su disco avvengono in un thread a parte, a gruppi di IMPORT_SPOOL_BYTES:
+    il file può essere grande fino a IMPORT_MAX_BYTES, e l'event loop deve continuare
+    a servire le sessioni di misurazione e gli stream SSE.
+    """
+    loop = asyncio.get_running_loop()
+    with tempfile.TemporaryFile() as spool:
+        pending = bytearray()
+        async for data in request.body:
+            pending += data
+            if len(pending) >= IMPORT_SPOOL_BYTES:
+                await loop.run_in_executor(None, spool.write, bytes(pending))
+                pending.clear()
+        if pending:
+            await loop.run_in_executor(None, spool.write, bytes(pending))
+        await loop.run_in_executor(None, spool.seek, 0)
+
+        def load():
+            with db.connection() as conn:
+                return bulk.import_csv(conn, spool, write_measurements)
+
+        try:
+            imported = await loop.run_in_executor(None, load)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"imported": imported})
+
 if __name__ == '__main__':
-    init_db()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Server ASGI Hypercorn (equivalente a `hypercorn app:app --bind 0.0.0.0:5000`):
+    # un solo processo e un solo event loop per HTTP, misurazioni e scritture
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ["0.0.0.0:5000"]
+    asyncio.run(serve(app, config))
\ No newline at end of file
@@ -0,0 +1,218 @@
+# coding: utf-8
+
+"""
+Esportazione e importazione in blocco delle misurazioni.
+
+L'esportazione legge le righe dal database a blocchi di `chunk_size` e le
+codifica man mano (CSV, oppure Arrow IPC / Parquet se pyarrow è installato),
+senza mai caricare in memoria l'intero risultato. L'importazione valida un CSV
+con le stesse colonne e lo scrive a blocchi con `executemany`, una transazione per blocco.
+"""
+
+import csv
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # formati colonnari non disponibili, resta il CSV
+    pa = None
+    pq = None
+
+COLUMNS = ("timestamp", "ip_dest", "ip_src", "rtt", "duration") # timestamp in ms dall'epoch
+CHUNK_SIZE = 5000
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def available_formats():
+    return ["csv", "arrow", "parquet"] if pa is not None else ["csv"]
+
+
+def select_rows(conn, ip_dest=None, start=None, end=None):
+    """
+    Cursore sulle misurazioni in ordine di tempo, filtrate per host e per
+    intervallo [start, end) in millisecondi dall'epoch (filtri facoltativi).
+    """
+    clauses, params = [], []
+    if ip_dest is not None:
+        clauses.append("ip_dest = ?")
+        params.append(ip_dest)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("timestamp < ?")
+        params.append(end)
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    return conn.execute(
+        "SELECT %s FROM measurements %s ORDER BY timestamp, id" % (", ".join(COLUMNS), where), params
+    )
+
+
+class _DrainBuffer:
+    """
+    File in sola scrittura i cui dati vengono prelevati (e liberati) con `drain()`:
+    permette ai writer di pyarrow di produrre l'output un blocco alla volta.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell(): # soltanto l'intestazione: nessuna riga esportata
+        yield buffer.getvalue().encode()
+
+
+def _arrow_schema():
+    return pa.schema([
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("ip_dest", pa.string()),
+        ("ip_src", pa.string()),
+        ("rtt", pa.float64()),
+        ("duration", pa.int64()),
+    ])
+
+
+def _record_batch(schema, rows):
+    columns = zip(*rows)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+    )
+
+
+def _arrow_chunks(chunks):
+    schema = _arrow_schema()
+    sink = _DrainBuffer()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in chunks:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+    yield sink.drain() # marcatore di fine stream
+
+
+def _parquet_chunks(chunks):
+    schema = _arrow_schema()
+    sink = _DrainBuffer()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in chunks:
+            writer.write_batch(_record_batch(schema, rows)) # un row group per blocco
+            yield sink.drain()
+    yield sink.drain() # footer con i metadati
+
+
+ENCODERS = {
+    "csv": _csv_chunks,
+    "arrow": _arrow_chunks,
+    "parquet": _parquet_chunks,
+}
+
+
+def export_chunks(conn, fmt, ip_dest=None, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Generatore dei blocchi di bytes che compongono l'esportazione nel formato `fmt`.
+    Ogni blocco corrisponde ad al più `chunk_size` righe lette dal database.
+    """
+    cursor = select_rows(conn, ip_dest, start, end)
+    chunks = iter(lambda: cursor.fetchmany(chunk_size), [])
+    for data in ENCODERS[fmt](chunks):
+        if data:
+            yield data
+
+
+def _parse_record(record):
+    timestamp, ip_dest, ip_src, rtt, duration = record
+    if not ip_dest:
+        raise ValueError("ip_dest mancante")
+    return int(timestamp), ip_dest, ip_src, float(rtt), int(duration)
+
+
+def _records(stream):
+    """
+    Righe del CSV `stream` già convertite con `_parse_record`; solleva ValueError
+    se l'intestazione o una riga non sono valide.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if header is None or tuple(column.strip() for column in header) != COLUMNS:
+            raise ValueError("Intestazione attesa: %s" % ",".join(COLUMNS))
+        for line, record in enumerate(reader, start=2):
+            if not record:
+                continue
+            try:
+                yield _parse_record(record)
+            except ValueError as e:
+                raise ValueError("Riga %d non valida: %s" % (line, e))
+    finally:
+        text.detach() # altrimenti chiuderebbe anche `stream`
+
+
+def import_csv(conn, stream, write_rows, chunk_size=CHUNK_SIZE):
+    """
+    Importa le misurazioni da `stream` (file binario CSV con intestazione COLUMNS,
+    su cui ci si possa spostare con seek). Il file viene prima validato per intero:
+    se una riga non è valida viene sollevato ValueError e nessuna misurazione viene
+    importata. Le righe vengono poi scritte a blocchi di `chunk_size` con
+    `write_rows(conn, rows)`, ciascuno nella propria transazione: il lock di scrittura
+    di SQLite viene rilasciato fra un blocco e l'altro, così che le misurazioni in corso
+    (vedi `database.BatchWriter`) non restino in attesa per tutta l'importazione.
+    Restituisce il numero di righe.
+    """
+    start = stream.tell()
+    for _ in _records(stream):
+        pass
+    stream.seek(start)
+
+    total = 0
+    rows = []
+    for row in _records(stream):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            with conn: # commit del blocco
+                write_rows(conn, rows)
+            total += len(rows)
+            rows = []
+    if rows:
+        with conn:
+            write_rows(conn, rows)
+        total += len(rows)
+    return total
@@ -0,0 +1,200 @@
+# coding: utf-8
+
+"""
+Gestione condivisa dell'accesso al database SQLite del server RTT:
+un pool di connessioni riutilizzabili da qualsiasi thread e uno scrittore
+in background che raggruppa gli inserimenti in un'unica transazione.
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+LOG = logging.getLogger(__name__)
+
+
+class PoolExhausted(Exception):
+    """
+    Nessuna connessione del pool si è liberata entro il tempo richiesto.
+    """
+
+
+class ConnectionPool:
+    """
+    Pool di connessioni SQLite condivise fra i thread del server.
+    Ogni connessione viene aperta una sola volta, in modalità WAL
+    (le letture non bloccano le scritture e viceversa) e con
+    synchronous=NORMAL (nessun fsync ad ogni commit, soltanto ai checkpoint).
+    """
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue() # connessioni libere, la più recente viene riusata per prima
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # check_same_thread=False: la connessione passa da un thread all'altro,
+        # ma il pool garantisce che sia usata da un solo thread alla volta
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def acquire(self, timeout=None):
+        """
+        Preleva una connessione dal pool, aprendone una nuova solo se tutte sono
+        occupate e il limite non è raggiunto; altrimenti attende che un altro thread
+        ne rilasci una, per al più `timeout` secondi (None: senza limite, 0: nessuna attesa).
+        Solleva PoolExhausted se nessuna connessione si libera in tempo.
+        La connessione va restituita con `release`.
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise PoolExhausted("nessuna connessione libera dopo %s s" % timeout) from None
+
+    def release(self, conn):
+        if conn.in_transaction: # transazione lasciata a metà da un errore
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Fornisce una connessione del pool (vedi `acquire`) per la durata del blocco `with`.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """
+        Chiude tutte le connessioni attualmente libere.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+
+class BatchWriter:
+    """
+    Scrittore in background: le righe ricevute con `submit` vengono accumulate
+    e scritte tutte insieme (group commit) ogni `batch_size` righe oppure
+    trascorsi `flush_interval` secondi dalla prima riga in attesa.
+    La scrittura vera e propria è delegata a `write_rows(conn, rows)`,
+    eseguita all'interno di un'unica transazione.
+
+    Le righe vengono raccolte da un task sull'event loop; soltanto il commit, che
+    con SQLite è bloccante, viene eseguito in un thread a parte, un gruppo alla volta.
+
+    Un gruppo che non si riesce a scrivere non viene scartato per intero: gli errori
+    transitori (database bloccato, disco pieno...) sono ritentati fino a `max_attempts`
+    volte, con attesa crescente; se il gruppo viene rifiutato per i suoi dati (e.g. una
+    riga malformata) le righe sono riscritte una alla volta, così che vadano perse
+    soltanto quelle non valide. Le righe perse sono sempre segnalate nel log.
+    """
+
+    _STOP = object() # sentinella per terminare il task
+
+    def __init__(self, pool, write_rows, batch_size=100, flush_interval=0.5, max_attempts=3, retry_delay=0.5):
+        self.pool = pool
+        self.write_rows = write_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay # secondi, moltiplicati per il numero del tentativo
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """
+        Avvia il task di scrittura sull'event loop corrente.
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.ensure_future(self._run())
+
+    def submit(self, row):
+        self._queue.put_nowait(row)
+
+    async def stop(self):
+        """
+        Scrive le righe ancora in attesa e termina il task.
+        """
+        if self._task is not None:
+            self._queue.put_nowait(self._STOP)
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if not pending else max(0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None # scaduto il tempo massimo di attesa
+
+            if item is self._STOP:
+                await loop.run_in_executor(None, self._flush, pending)
+                return
+            if item is not None:
+                pending.append(item)
+                if len(pending) == 1:
+                    deadline = loop.time() + self.flush_interval
+
+            if pending and (len(pending) >= self.batch_size or loop.time() >= deadline):
+                # nel frattempo le nuove righe continuano ad accumularsi nella coda
+                await loop.run_in_executor(None, self._flush, pending)
+                pending = []
+
+    def _write(self, rows):
+        with self.pool.connection() as conn:
+            with conn: # commit automatico alla fine del blocco, rollback in caso di errore
+                self.write_rows(conn, rows)
+
+    def _flush(self, rows):
+        # eseguita nel thread di scrittura: nessuna eccezione deve arrivare a _run,
+        # altrimenti il task terminerebbe e la coda crescerebbe senza limite
+        if not rows:
+            return
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._write(rows)
+                return
+            except sqlite3.OperationalError as e: # errore del database, non dei dati: si ritenta
+                if attempt == self.max_attempts:
+                    LOG.error("Scrittura di %d misurazioni fallita dopo %d tentativi, misurazioni perse: %s", len(rows), attempt, e)
+                    return
+                LOG.warning("Scrittura di %d misurazioni fallita (tentativo %d di %d): %s", len(rows), attempt, self.max_attempts, e)
+                time.sleep(self.retry_delay * attempt)
+            except Exception as e:
+                if len(rows) == 1:
+                    LOG.error("Misurazione scartata, non valida: %r (%r)", rows[0], e)
+                    return
+                LOG.warning("Gruppo di %d misurazioni rifiutato (%r): scrittura una alla volta", len(rows), e)
+                for row in rows:
+                    self._flush([row])
+                return
@@ -0,0 +1,223 @@
+# coding: utf-8
+
+"""
+Rollup, scadenza e compattazione delle misurazioni.
+
+Le misurazioni vengono riassunte per minuto e per ora (numero di campioni, min,
+max, somma, somma dei quadrati e istogramma) nelle tabelle rollup_minute e
+rollup_hour, aggiornate ad ogni scrittura nella stessa transazione dei dati grezzi.
+Un task periodico (`Maintenance`) elimina i dati grezzi e i rollup per minuto
+più vecchi del rispettivo periodo di conservazione e restituisce al sistema
+le pagine liberate (incremental vacuum): lo spazio occupato dipende dalla durata
+della conservazione e non più da quella dell'intero storico.
+I grafici su intervalli ampi vengono letti dai rollup, senza scorrere i dati grezzi.
+"""
+
+import asyncio
+import math
+import sqlite3
+import time
+from collections import defaultdict
+
+from rtt_stats import RttHistogram, RttSummary
+
+MINUTE = 60 * 1000 # ms
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+LEVELS = (("minute", MINUTE), ("hour", HOUR)) # livelli di rollup: (nome, ampiezza dell'intervallo in ms)
+
+
+def create_rollup_tables(c):
+    for name, _ in LEVELS:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_%s (
+                dest_id INTEGER NOT NULL REFERENCES hosts (id),
+                bucket INTEGER NOT NULL, -- inizio dell'intervallo, in ms dall'epoch
+                count INTEGER NOT NULL,
+                min REAL NOT NULL,
+                max REAL NOT NULL,
+                sum REAL NOT NULL,
+                sum_sq REAL NOT NULL,
+                histogram TEXT NOT NULL,
+                PRIMARY KEY (dest_id, bucket)
+            ) WITHOUT ROWID
+        ''' % name)
+
+
+def update_rollups(conn, samples):
+    """
+    Fonde nei rollup un gruppo di campioni (timestamp, dest_id, rtt):
+    ogni intervallo toccato viene letto, aggiornato e riscritto una sola volta.
+    """
+    minutes = defaultdict(RttSummary)
+    for timestamp, dest_id, rtt in samples:
+        minutes[(dest_id, timestamp - timestamp % MINUTE)].add(rtt)
+    hours = defaultdict(RttSummary)
+    for (dest_id, bucket), summary in minutes.items():
+        hours[(dest_id, bucket - bucket % HOUR)].merge(summary)
+
+    for name, summaries in (("minute", minutes), ("hour", hours)):
+        for (dest_id, bucket), summary in summaries.items():
+            stored = conn.execute(
+                "SELECT count, sum, sum_sq, histogram FROM rollup_%s WHERE dest_id = ? AND bucket = ?" % name,
+                (dest_id, bucket)
+            ).fetchone()
+            if stored is not None:
+                count, total, total_sq, histogram = stored
+                summary.merge(RttSummary(count, total, total_sq, RttHistogram.from_json(histogram)))
+            conn.execute(
+                "INSERT OR REPLACE INTO rollup_%s VALUES (?, ?, ?, ?, ?, ?, ?, ?)" % name,
+                (dest_id, bucket, summary.count, summary.histogram.min, summary.histogram.max,
+                 summary.sum, summary.sum_sq, summary.histogram.to_json())
+            )
+
+
+def choose_level(start, end, points, now, raw_retention, minute_retention):
+    """
+    Sceglie da dove leggere il grafico dell'intervallo [start, end), in modo da
+    ottenere circa `points` punti scorrendo meno righe possibile: i dati grezzi
+    (None) solo se l'intervallo è tanto breve che i rollup per minuto darebbero
+    meno di `points` punti, i rollup per minuto solo se quelli per ora ne darebbero
+    meno; altrimenti i rollup per ora. Un livello è scartato se i suoi dati per
+    l'inizio dell'intervallo sono già scaduti (retention None: conservati per sempre).
+    """
+    span = end - start
+    if start >= now - raw_retention and span <= points * MINUTE:
+        return None
+    if (minute_retention is None or start >= now - minute_retention) and span <= points * HOUR:
+        return "minute"
+    return "hour"
+
+
+def rollup_series(conn, level, dest_id, start, end, points):
+    """
+    Restituisce al più ~`points` tuple (inizio, media, min, max) dai rollup del
+    livello indicato nell'intervallo [start, end), unendo se necessario
+    intervalli consecutivi.
+    """
+    width = dict(LEVELS)[level]
+    group = max(1, math.ceil((end - start) / points / width)) * width
+    return conn.execute('''
+        SELECT bucket - bucket %% ? AS start, SUM(sum) / SUM(count), MIN(min), MAX(max)
+        FROM rollup_%s
+        WHERE dest_id = ? AND bucket >= ? AND bucket < ?
+        GROUP BY start
+        ORDER BY start
+    ''' % level, (group, dest_id, start - start % width, end)).fetchall()
+
+
+def rollup_summary(conn, level, dest_id, start, end):
+    """
+    Riassunto (RttSummary) dei campioni dell'intervallo [start, end). Gli intervalli
+    del livello indicato interamente compresi vengono letti dai rollup; le parti
+    iniziale e finale, che ne coprono soltanto una parte, dal livello più fine
+    (i rollup per minuto e infine i dati grezzi, con `level` None). Dei minuti
+    a cavallo degli estremi si contano quindi soltanto i campioni grezzi ancora
+    conservati (vedi `Maintenance`).
+    """
+    summary = RttSummary()
+    if start >= end:
+        return summary
+    if level is None:
+        rows = conn.execute(
+            "SELECT rtt FROM samples WHERE dest_id = ? AND timestamp >= ? AND timestamp < ?",
+            (dest_id, start, end)
+        )
+        for (rtt,) in rows:
+            summary.add(rtt)
+        return summary
+
+    names = [name for name, _ in LEVELS]
+    finer = names[names.index(level) - 1] if names.index(level) > 0 else None
+    width = dict(LEVELS)[level]
+    first = -(-start // width) * width # inizio del primo intervallo interamente compreso
+    last = end - end % width # fine dell'ultimo
+    if first >= last:
+        return rollup_summary(conn, finer, dest_id, start, end)
+
+    rows = conn.execute('''
+        SELECT count, sum, sum_sq, histogram FROM rollup_%s
+        WHERE dest_id = ? AND bucket >= ? AND bucket < ?
+    ''' % level, (dest_id, first, last))
+    for count, total, total_sq, histogram in rows:
+        summary.merge(RttSummary(count, total, total_sq, RttHistogram.from_json(histogram)))
+    summary.merge(rollup_summary(conn, finer, dest_id, start, first))
+    summary.merge(rollup_summary(conn, finer, dest_id, last, end))
+    return summary
+
+
+class Maintenance:
+    """
+    Task periodico di manutenzione del database, eseguito ogni `interval` secondi:
+    elimina i campioni grezzi più vecchi di `raw_retention` ms e i rollup per minuto
+    più vecchi di `minute_retention` ms (quelli per ora si conservano, se
+    `hour_retention` è None), a blocchi di `chunk_size` righe per transazione così
+    da non bloccare a lungo le scritture, poi libera al più `vacuum_pages` pagine
+    con PRAGMA incremental_vacuum. Il lavoro sul database avviene in un thread a parte.
+    """
+
+    def __init__(self, pool, raw_retention, minute_retention, hour_retention=None,
+                 interval=300, chunk_size=10000, vacuum_pages=5000):
+        self.pool = pool
+        self.retention = {"samples": raw_retention, "rollup_minute": minute_retention, "rollup_hour": hour_retention}
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                removed = await loop.run_in_executor(None, self.run_once)
+                if any(removed.values()):
+                    print("Manutenzione DB, righe eliminate:", removed)
+            except sqlite3.Error as e:
+                print("Errore manutenzione DB:", e)
+            await asyncio.sleep(self.interval)
+
+    def _expire_samples(self, conn, before):
+        removed = 0
+        while True:
+            with conn: # una transazione per blocco: le scritture in corso attendono poco
+                deleted = conn.execute(
+                    "DELETE FROM samples WHERE id IN (SELECT id FROM samples WHERE timestamp < ? LIMIT ?)",
+                    (before, self.chunk_size)
+                ).rowcount
+            removed += deleted
+            if deleted < self.chunk_size:
+                return removed
+
+    def run_once(self, now=None):
+        """
+        Esegue un ciclo di manutenzione e restituisce il numero di righe eliminate per tabella.
+        """
+        now = int(time.time() * 1000) if now is None else now
+        removed = {}
+        with self.pool.connection() as conn:
+            if self.retention["samples"] is not None:
+                removed["samples"] = self._expire_samples(conn, now - self.retention["samples"])
+            for name, _ in LEVELS:
+                retention = self.retention["rollup_" + name]
+                if retention is not None:
+                    with conn: # i rollup sono poche righe per host: basta un'unica transazione
+                        removed["rollup_" + name] = conn.execute(
+                            "DELETE FROM rollup_%s WHERE bucket < ?" % name, (now - retention,)
+                        ).rowcount
+            # il pragma libera una pagina per passo e execute() ne esegue soltanto il primo:
+            # executescript() lo porta a termine
+            conn.executescript("PRAGMA incremental_vacuum(%d)" % self.vacuum_pages)
+        return removed
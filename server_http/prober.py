@@ -0,0 +1,214 @@
+# coding: utf-8
+
+"""
+Backend per la misurazione dell'RTT verso un host, da usare con asyncio.
+
+`IcmpProber` invia direttamente pacchetti ICMP Echo Request dal processo del
+server, senza creare un processo `ping` per ogni campione: un unico socket non
+bloccante, letto dall'event loop, serve tutte le sessioni di misurazione.
+`PingProber` è il backend di riserva basato sul comando `ping`, usato quando i
+socket ICMP non sono disponibili (permessi insufficienti...).
+Entrambi espongono la coroutine `probe(address)`, che restituisce gli istanti di
+invio e ricezione (`ProbeResult`) oppure None se la risposta non arriva.
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import time
+from collections import namedtuple
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+PAYLOAD_SIZE = 56 # stessa dimensione usata di default dal comando ping
+
+
+class ProbeResult(namedtuple("ProbeResult", ["sent_ns", "received_ns"])):
+    """
+    Istanti di invio della richiesta e di ricezione della risposta,
+    in ns sul clock monotono (time.monotonic_ns).
+    """
+
+    __slots__ = ()
+
+    @property
+    def rtt_ms(self):
+        return round((self.received_ns - self.sent_ns) / 1e6, 3) # risoluzione al microsecondo
+
+
+def icmp_checksum(data):
+    """
+    Calcola il checksum Internet (RFC 1071) del pacchetto ICMP.
+    """
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+async def ping_once(ip_dest):
+    """
+    Esegue 'ping -c 1 -W 1 ip_dest' e ritorna l'RTT in ms (float),
+    oppure None se non riesce.
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ping", "-c", "1", "-W", "1", ip_dest,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        if process.returncode == 0:
+            for line in stdout.decode().split('\n'):
+                if "time=" in line:
+                    rtt_str = line.split("time=")[1].split(" ")[0]
+                    return float(rtt_str)
+    except OSError as e:
+        print("Errore ping:", e)
+    return None
+
+
+async def resolve(host):
+    """
+    Risolve l'hostname in un indirizzo IPv4 senza bloccare l'event loop.
+    """
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, family=socket.AF_INET)
+    return infos[0][4][0]
+
+
+class PingProber:
+    """
+    Backend di riserva: un processo `ping` per ciascun campione.
+    L'istante di ricezione è ricavato dall'RTT riportato da `ping`.
+    """
+
+    async def probe(self, address):
+        sent_ns = time.monotonic_ns()
+        rtt_ms = await ping_once(address)
+        if rtt_ms is None:
+            return None
+        return ProbeResult(sent_ns, sent_ns + int(rtt_ms * 1e6))
+
+    def close(self):
+        pass
+
+
+class IcmpProber:
+    """
+    Backend ICMP nativo. Si tenta prima un socket ICMP non privilegiato
+    (SOCK_DGRAM, consentito da Linux se il gruppo dell'utente rientra in
+    net.ipv4.ping_group_range), altrimenti un socket raw (richiede i permessi di root).
+
+    Lo stesso socket è condiviso da tutte le sessioni: ogni richiesta ha un proprio
+    numero di sequenza e i pacchetti ancora in volo sono memorizzati in `in_flight`
+    (sequenza -> (indirizzo, istante di invio in ns, future)). Le risposte vengono
+    lette dall'event loop (`add_reader`) non appena arrivano e risolvono la future
+    della richiesta corrispondente con gli istanti di invio e ricezione;
+    quelle tardive vengono riconosciute e scartate.
+    Va creato all'interno dell'event loop che lo userà.
+    """
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self.sock, self.raw = self._open_socket()
+        self.sock.setblocking(False)
+        # Con SOCK_DGRAM l'identificatore viene sostituito dal kernel,
+        # che consegna al socket soltanto le risposte che gli appartengono
+        self.identifier = os.getpid() & 0xFFFF
+        self.sequence = 0
+        self.in_flight = {}
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    @staticmethod
+    def _open_socket():
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+        except OSError:
+            return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+
+    def _next_sequence(self):
+        for _ in range(0x10000): # salta le sequenze ancora in volo
+            self.sequence = (self.sequence + 1) & 0xFFFF
+            if self.sequence not in self.in_flight:
+                return self.sequence
+        raise OSError("Troppe richieste ICMP in volo")
+
+    def send(self, address):
+        """
+        Invia una Echo Request verso `address` e restituisce la future
+        che verrà risolta con un `ProbeResult` all'arrivo della risposta.
+        """
+        sequence = self._next_sequence()
+        payload = bytes(PAYLOAD_SIZE)
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self.identifier, sequence)
+        checksum = icmp_checksum(header + payload)
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, self.identifier, sequence) + payload
+
+        reply = self._loop.create_future()
+        self.in_flight[sequence] = (address, time.monotonic_ns(), reply)
+        try:
+            self.sock.sendto(packet, (address, 0))
+        except OSError:
+            del self.in_flight[sequence]
+            raise
+        reply.add_done_callback(lambda _: self.in_flight.pop(sequence, None))
+        return reply
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, (source, _) = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            received_ns = time.monotonic_ns()
+
+            if self.raw: # il socket raw riceve anche l'header IP
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, identifier, sequence = struct.unpack("!BBHHH", data[:8])
+            if icmp_type != ICMP_ECHO_REPLY:
+                continue
+            if self.raw and identifier != self.identifier:
+                continue
+
+            entry = self.in_flight.get(sequence)
+            if entry is None or entry[0] != source:
+                continue
+            _, sent_ns, reply = entry
+            if not reply.done():
+                reply.set_result(ProbeResult(sent_ns, received_ns))
+
+    async def probe(self, address):
+        """
+        Invia una Echo Request e ne attende la risposta;
+        ritorna un `ProbeResult`, oppure None.
+        """
+        try:
+            return await asyncio.wait_for(self.send(address), self.timeout)
+        except asyncio.TimeoutError:
+            return None
+        except OSError as e: # ad esempio host non raggiungibile
+            print("Errore ICMP:", e)
+            return None
+
+    def close(self):
+        self._loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+
+def make_prober(backend="icmp", timeout=1.0):
+    """
+    Crea il backend di misurazione richiesto, ripiegando su `PingProber`
+    se i socket ICMP non sono utilizzabili.
+    """
+    if backend == "icmp":
+        try:
+            return IcmpProber(timeout=timeout)
+        except OSError as e:
+            print("ICMP nativo non disponibile, uso ping:", e)
+    return PingProber()
@@ -0,0 +1,213 @@
+# coding: utf-8
+
+"""
+Statistiche sugli RTT calcolate in modo incrementale, campione per campione,
+senza dover ripercorrere le misurazioni già raccolte.
+"""
+
+import json
+import math
+
+
+class RunningStats:
+    """
+    Media e varianza aggiornate ad ogni campione con l'algoritmo di Welford:
+    O(1) per aggiornamento e numericamente stabile.
+    """
+
+    __slots__ = ("count", "mean", "_m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0 # somma dei quadrati degli scarti dalla media
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """
+        Varianza campionaria (come statistics.variance), 0 con meno di due campioni.
+        """
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class InterarrivalJitter:
+    """
+    Jitter secondo RFC 3550 (par. 6.4.1): media mobile, con guadagno 1/16, della
+    differenza in valore assoluto fra i tempi di transito di due campioni consecutivi.
+    Qui il tempo di transito è l'RTT stesso; dipende dall'ordine dei campioni,
+    quindi ha senso soltanto all'interno di una singola sessione.
+    """
+
+    __slots__ = ("value", "_last")
+
+    def __init__(self):
+        self.value = 0.0
+        self._last = None
+
+    def update(self, rtt):
+        if self._last is not None:
+            self.value += (abs(rtt - self._last) - self.value) / 16
+        self._last = rtt
+
+
+class RttHistogram:
+    """
+    Istogramma degli RTT a bucket log-lineari, sul modello degli HDR histogram:
+    gli RTT sono espressi in microsecondi; sotto 2^SUB_BITS µs ogni bucket è largo
+    1 µs, oltre ogni potenza di 2 è divisa in 2^(SUB_BITS-1) bucket di uguale ampiezza,
+    per un errore relativo dei percentili inferiore a 1/2^(SUB_BITS-1) (0.8%).
+    La memoria dipende soltanto dal numero di bucket occupati (qualche centinaio al più),
+    non dal numero di campioni, e due istogrammi si fondono sommando i conteggi:
+    i percentili di un host si ottengono unendo quelli delle sue misurazioni.
+    """
+
+    SUB_BITS = 8
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    __slots__ = ("counts", "count", "min", "max")
+
+    def __init__(self):
+        self.counts = {} # indice del bucket -> numero di campioni
+        self.count = 0
+        self.min = None # estremi esatti, in ms
+        self.max = None
+
+    @classmethod
+    def _index(cls, micros):
+        shift = micros.bit_length() - cls.SUB_BITS
+        if shift <= 0:
+            return micros
+        return (shift << (cls.SUB_BITS - 1)) + (micros >> shift)
+
+    @classmethod
+    def _bounds(cls, index):
+        """
+        Estremi [low, high) in µs dei valori che ricadono nel bucket `index`.
+        """
+        half = 1 << (cls.SUB_BITS - 1)
+        if index < 2 * half:
+            return index, index + 1
+        shift = index // half - 1
+        mantissa = index - shift * half
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def add(self, rtt, n=1):
+        index = self._index(max(0, int(round(rtt * 1000))))
+        self.counts[index] = self.counts.get(index, 0) + n
+        self.count += n
+        self.min = rtt if self.min is None else min(self.min, rtt)
+        self.max = rtt if self.max is None else max(self.max, rtt)
+
+    def merge(self, other):
+        """
+        Aggiunge a questo istogramma i campioni di `other`.
+        """
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        for bound, pick in (("min", min), ("max", max)):
+            value = getattr(other, bound)
+            if value is not None:
+                current = getattr(self, bound)
+                setattr(self, bound, value if current is None else pick(current, value))
+        return self
+
+    def quantiles(self, percentiles=PERCENTILES):
+        """
+        Restituisce {p: valore in ms} per ciascun percentile richiesto (in ordine
+        crescente), con un'unica scansione dei bucket; None se l'istogramma è vuoto.
+        """
+        if not self.count:
+            return {p: None for p in percentiles}
+        result = {}
+        targets = iter(percentiles)
+        p = next(targets)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while p is not None and seen >= p / 100 * self.count:
+                low, high = self._bounds(index)
+                value = (low + high - 1) / 2000 # centro del bucket, in ms
+                result[p] = min(max(value, self.min), self.max)
+                p = next(targets, None)
+            if p is None:
+                break
+        return result
+
+    def summary(self):
+        """
+        Dizionario con minimo, massimo e percentili (p50, p90, p99, p99.9) in ms.
+        """
+        summary = {"min": self.min, "max": self.max}
+        for p, value in self.quantiles().items():
+            summary["p%g" % p] = value
+        return summary
+
+    def to_json(self):
+        return json.dumps({
+            "min": self.min,
+            "max": self.max,
+            "counts": sorted(self.counts.items()),
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        histogram = cls()
+        if text:
+            data = json.loads(text)
+            histogram.counts = {index: n for index, n in data["counts"]}
+            histogram.count = sum(histogram.counts.values())
+            histogram.min = data["min"]
+            histogram.max = data["max"]
+        return histogram
+
+
+class RttSummary:
+    """
+    Riassunto fondibile di un insieme di RTT: numero di campioni, somma, somma dei
+    quadrati e istogramma (che fornisce min, max e percentili). È l'unità dei
+    rollup per minuto e per ora: il riassunto di un intervallo si ottiene
+    fondendo quelli degli intervalli che lo compongono.
+    """
+
+    __slots__ = ("count", "sum", "sum_sq", "histogram")
+
+    def __init__(self, count=0, total=0.0, total_sq=0.0, histogram=None):
+        self.count = count
+        self.sum = total
+        self.sum_sq = total_sq
+        self.histogram = histogram if histogram is not None else RttHistogram()
+
+    def add(self, rtt):
+        self.count += 1
+        self.sum += rtt
+        self.sum_sq += rtt * rtt
+        self.histogram.add(rtt)
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.histogram.merge(other.histogram)
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        variance = (self.sum_sq - self.sum * self.sum / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0)) # max(): evita valori negativi dovuti agli arrotondamenti
@@ -0,0 +1,286 @@
+# coding: utf-8
+
+"""
+Gestione di più sessioni di misurazione RTT contemporanee.
+Ogni sessione è identificata da un id, ha il proprio stato e viene eseguita
+come task asyncio sull'event loop del server: nessun thread per sessione,
+così che migliaia di misurazioni possano procedere in parallelo.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+from rtt_stats import InterarrivalJitter, RttHistogram, RunningStats
+
+
+class DeadlineTimer:
+    """
+    Scandisce le misurazioni su istanti assoluti del clock monotono,
+    start_ns + k * interval: il periodo di campionamento non dipende dalla
+    durata del probe né dalla precisione del singolo risveglio, quindi non deriva.
+    Le scadenze già trascorse quando il probe precedente termina vengono saltate
+    (senza raffiche per recuperare) e contate in `missed`.
+    """
+
+    def __init__(self, interval, start_ns):
+        self.interval_ns = max(1, int(interval * 1e9))
+        self.deadline = start_ns # scadenza corrente, in ns
+        self.missed = 0
+
+    async def wait_next(self):
+        """
+        Attende la scadenza successiva e la restituisce.
+        """
+        self.deadline += self.interval_ns
+        now = time.monotonic_ns()
+        if now > self.deadline:
+            skipped = (now - self.deadline) // self.interval_ns + 1
+            self.missed += skipped
+            self.deadline += skipped * self.interval_ns
+        await asyncio.sleep((self.deadline - now) / 1e9)
+        return self.deadline
+
+
+class SampleBuffer:
+    """
+    Buffer circolare di capacità fissa per i campioni (elapsed, rtt) di una sessione,
+    memorizzati in due colonne `array('d')` (16 byte a campione): le colonne crescono
+    fino alla capacità, poi i campioni più vecchi vengono sovrascritti e la memoria resta costante.
+
+    Ogni campione ha un numero di sequenza crescente (0, 1, 2...): `since(seq)`
+    restituisce soltanto quelli successivi ai primi `seq`, così i lettori possono
+    chiedere i dati in modo incrementale. Scritture e letture sono protette da un lock;
+    `wait(seq)` permette ad una coroutine di attendere l'arrivo di nuovi campioni.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._elapsed = array('d')
+        self._rtt = array('d')
+        self.total = 0 # campioni aggiunti dall'inizio, ovvero la sequenza del prossimo
+        self.closed = False
+        self._lock = threading.Lock()
+        self._changed = None # future risolta all'arrivo del prossimo campione, creata dal primo lettore in attesa
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def _notify(self):
+        # invocata dall'event loop, come le coroutine in attesa
+        if self._changed is not None:
+            if not self._changed.done():
+                self._changed.set_result(None)
+            self._changed = None
+
+    def append(self, elapsed, rtt):
+        with self._lock:
+            if self.total < self.capacity:
+                self._elapsed.append(elapsed)
+                self._rtt.append(rtt)
+            else:
+                i = self.total % self.capacity
+                self._elapsed[i] = elapsed
+                self._rtt[i] = rtt
+            self.total += 1
+        self._notify()
+
+    def close(self):
+        """
+        Segnala che non arriveranno altri campioni, risvegliando i lettori in attesa.
+        """
+        self.closed = True
+        self._notify()
+
+    async def wait(self, seq, timeout):
+        """
+        Attende al più `timeout` secondi che il buffer contenga campioni con
+        sequenza >= `seq` oppure che venga chiuso.
+        """
+        if self.total > seq or self.closed:
+            return
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        try:
+            # shield(): il timeout di un lettore non deve annullare la future condivisa
+            await asyncio.wait_for(asyncio.shield(self._changed), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def since(self, seq=0):
+        """
+        Restituisce la lista dei campioni con sequenza >= `seq` ancora presenti nel buffer
+        e la sequenza da usare nella lettura successiva.
+        """
+        with self._lock:
+            start = max(seq, self.total - self.capacity, 0) # i più vecchi potrebbero essere stati sovrascritti
+            end = self.total
+            if start >= end:
+                return [], end
+            i, j = start % self.capacity, end % self.capacity
+            if i < j:
+                elapsed, rtt = self._elapsed[i:j], self._rtt[i:j]
+            else: # l'intervallo richiesto passa per la fine del buffer
+                elapsed = self._elapsed[i:] + self._elapsed[:j]
+                rtt = self._rtt[i:] + self._rtt[:j]
+        return list(zip(elapsed, rtt)), end
+
+
+class MeasurementSession:
+    """
+    Stato di una singola sessione di misurazione verso `ip_dest`.
+    """
+
+    def __init__(self, session_id, ip_dest, duration, interval, capacity):
+        self.id = session_id
+        self.ip_dest = ip_dest
+        self.duration = duration # durata del test in secondi
+        self.interval = interval # intervallo fra due campioni in secondi
+        self.start_dt = datetime.now() # serve a separare sul database le misure nuove da quelle vecchie
+        self.start_time = None # timestamp di avvio effettivo della misurazione
+        self.start_ns = None # lo stesso istante sul clock monotono (time.monotonic_ns)
+        self.missed_deadlines = 0 # campioni saltati perché il probe precedente era ancora in corso
+        self.lost = 0 # probe rimasti senza risposta
+        self.measurements = SampleBuffer(capacity) # ultimi `capacity` campioni (elapsed, rtt)
+        self.stats = RunningStats() # media e std aggiornate ad ogni campione, anche quelli usciti dal buffer
+        self.histogram = RttHistogram() # min, max e percentili di tutti i campioni
+        self.jitter = InterarrivalJitter()
+        self.status = "queued" # queued -> running -> finished
+        self.task = None # task asyncio che esegue la misurazione
+        self._stopped = False
+
+    def stop(self):
+        """
+        Interrompe la sessione annullandone il task: l'attesa in corso
+        (probe o intervallo fra due campioni) termina immediatamente.
+        """
+        self._stopped = True
+        if self.task is not None:
+            self.task.cancel()
+
+    def finish(self):
+        self.status = "finished"
+        self.measurements.close()
+
+    def add_sample(self, elapsed, rtt):
+        """
+        Registra un nuovo campione e aggiorna le statistiche.
+        """
+        self.stats.update(rtt)
+        self.histogram.add(rtt)
+        self.jitter.update(rtt)
+        self.measurements.append(elapsed, rtt)
+
+    def samples_since(self, seq=0):
+        """
+        Campioni con sequenza >= `seq` e sequenza successiva (vedi `SampleBuffer.since`).
+        """
+        return self.measurements.since(seq)
+
+    async def wait_samples(self, seq, timeout):
+        await self.measurements.wait(seq, timeout)
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def to_dict(self):
+        return {
+            "session_id": self.id,
+            "ip_dest": self.ip_dest,
+            "duration": self.duration,
+            "interval": self.interval,
+            "status": self.status,
+            "start": self.start_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "samples": self.measurements.total,
+            "lost": self.lost,
+            "missed_deadlines": self.missed_deadlines,
+        }
+
+
+class SessionScheduler:
+    """
+    Esegue le sessioni di misurazione come task sull'event loop corrente, al più
+    `max_sessions` alla volta: le sessioni in eccesso restano in coda ("queued")
+    finché una di quelle in corso non termina.
+    `run(session)` è la coroutine che svolge la misurazione vera e propria: termina
+    quando la durata è trascorsa, oppure viene annullata da `session.stop()`.
+    Delle sessioni concluse vengono conservate soltanto le `max_finished` più recenti;
+    ogni sessione tiene in memoria al più `buffer_size` campioni.
+    """
+
+    def __init__(self, run, max_sessions=4096, max_finished=100, buffer_size=36000):
+        self._run = run
+        self.max_sessions = max_sessions
+        self.buffer_size = buffer_size
+        self._slots = None # semaforo creato al primo avvio, quando l'event loop è in esecuzione
+        self._sessions = OrderedDict() # id -> MeasurementSession, in ordine di avvio
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    def start(self, ip_dest, duration, interval):
+        """
+        Crea e accoda una nuova sessione, restituendola (da invocare nell'event loop).
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_sessions)
+        session = MeasurementSession(uuid.uuid4().hex[:12], ip_dest, duration, interval, self.buffer_size)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._prune()
+        session.task = asyncio.ensure_future(self._execute(session))
+        return session
+
+    async def _execute(self, session):
+        try:
+            async with self._slots:
+                session.status = "running"
+                session.start_time = time.time()
+                session.start_ns = time.monotonic_ns()
+                await self._run(session)
+        except asyncio.CancelledError:
+            pass # sessione fermata
+        except Exception as e:
+            print("Errore nella sessione %s:" % session.id, e)
+        finally:
+            session.finish()
+
+    def _prune(self):
+        finished = [sid for sid, s in self._sessions.items() if s.status == "finished"]
+        for sid in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._sessions[sid]
+
+    def get(self, session_id=None):
+        """
+        Restituisce la sessione con l'id dato oppure, se non specificato,
+        l'ultima sessione avviata; None se non esiste.
+        """
+        with self._lock:
+            if session_id is None:
+                return next(reversed(self._sessions.values()), None)
+            return self._sessions.get(session_id)
+
+    def stop(self, session_id):
+        session = self.get(session_id)
+        if session is not None:
+            session.stop()
+        return session
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    async def shutdown(self):
+        """
+        Interrompe tutte le sessioni e ne attende la conclusione.
+        """
+        sessions = self.sessions()
+        for session in sessions:
+            session.stop()
+        tasks = [session.task for session in sessions if session.task is not None]
+        if tasks:
+            await asyncio.wait(tasks)
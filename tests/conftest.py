@@ -0,0 +1,15 @@
+# coding: utf-8
+
+"""
+I moduli del controller e del server HTTP non sono pacchetti: vengono importati
+direttamente dalle rispettive cartelle, come avviene eseguendoli.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("mininet_config", "server_http"):
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
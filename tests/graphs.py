@@ -0,0 +1,62 @@
+# coding: utf-8
+
+"""
+Topologie casuali per i test del controller, costruite con gli oggetti fittizi
+di `benchmark` e costi interi (le somme sono esatte e si confrontano per uguaglianza).
+"""
+
+import random
+
+from benchmark import StubDatapath, StubLink, StubPort, StubSwitch
+from our_dijkstra import CostModel, NetLinkGraph
+
+
+class TableCostModel(CostModel):
+    """
+    Costi letti dal campo "cost" dei parametri di connessione (1 se assenti).
+    """
+
+    def link_cost(self, src_dpid, dst_dpid, params):
+        return params["cost"] if params is not None else 1
+
+
+def build_graph(ids, costs, cost_model=None):
+    """
+    Grafo con gli switch `ids` e un link per ciascuna coppia (a, b) in `costs`,
+    di costo costs[a, b] (i parametri di connessione sono condivisi con il grafo).
+    """
+    params = {}
+    for (a, b), cost in costs.items():
+        params[a, b] = params[b, a] = { "cost": cost }
+    switches = [StubSwitch(StubDatapath(dpid)) for dpid in ids]
+    links = { StubLink(StubPort(a), StubPort(b)): 0 for a, b in costs }
+    return NetLinkGraph(None, switches, links, params, cost_model or TableCostModel())
+
+
+def random_costs(rng: random.Random, ids, max_cost=5, density=2):
+    """
+    Link casuali (in media `density` per switch) con costo intero in 1..max_cost.
+    """
+    costs = {}
+    for _ in range(rng.randint(0, density * len(ids))):
+        a, b = rng.sample(ids, 2)
+        if (b, a) not in costs:
+            costs[a, b] = rng.randint(1, max_cost)
+    return costs
+
+
+def reference_distances(ids, costs):
+    """
+    Costi minimi fra tutte le coppie con Bellman-Ford, indipendente da `NetLinkGraph`.
+    """
+    edges = [(a, b, cost) for (a, b), cost in costs.items()] + [(b, a, cost) for (a, b), cost in costs.items()]
+    distances = {}
+    for source in ids:
+        dist = { dpid: float("inf") for dpid in ids }
+        dist[source] = 0
+        for _ in range(len(ids)):
+            for a, b, cost in edges:
+                if dist[a] + cost < dist[b]:
+                    dist[b] = dist[a] + cost
+        distances[source] = dist
+    return distances
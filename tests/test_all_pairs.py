@@ -0,0 +1,67 @@
+# coding: utf-8
+
+"""
+Tabelle dei next-hop di tutti gli switch (`all_pairs_next_hops`): Floyd-Warshall e
+Dijkstra ripetuto possono scegliere next-hop diversi a parità di costo, ma ciascuno
+deve trovarsi su un cammino minimo e gli switch raggiungibili devono coincidere.
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("ryu")
+pytest.importorskip("numpy")
+
+from graphs import build_graph, random_costs, reference_distances
+
+
+def check_tables(graph, tables, reference):
+    for source, table in tables.items():
+        reachable = { dpid for dpid, cost in reference[source].items() if cost < float("inf") and dpid != source }
+        assert set(table) == reachable
+        for destination, hop in table.items():
+            cost = graph.neighbors(source)[hop] # il next-hop è un vicino della sorgente
+            assert cost + reference[hop][destination] == reference[source][destination]
+
+
+@pytest.mark.parametrize("seed", range(25))
+@pytest.mark.parametrize("method", ["dijkstra", "floyd_warshall", "auto"])
+def test_next_hops_lie_on_shortest_paths(seed, method):
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 1000), rng.randint(1, 20))
+    # pochi costi distinti: molti percorsi di costo uguale
+    costs = random_costs(rng, ids, max_cost=2, density=rng.choice([1, 3]))
+    graph = build_graph(ids, costs)
+
+    tables = graph.all_pairs_next_hops(ids, method=method)
+    assert set(tables) == set(ids)
+    check_tables(graph, tables, reference_distances(ids, costs))
+
+
+def test_methods_agree_with_per_source_next_hops():
+    rng = random.Random(7)
+    ids = list(range(1, 16))
+    costs = random_costs(rng, ids, max_cost=9, density=4)
+    graph = build_graph(ids, costs)
+    floyd = graph.floyd_warshall_next_hops(ids + [99])
+    assert floyd[99] == {} # switch sconosciuto
+
+    # i due metodi raggiungono gli stessi switch e scelgono next-hop su cammini minimi
+    reference = reference_distances(ids, costs)
+    for source in ids:
+        per_source = graph.next_hops(source)
+        assert set(per_source) == set(floyd[source])
+        for destination in per_source:
+            for hop in (per_source[destination], floyd[source][destination]):
+                assert graph.neighbors(source)[hop] + reference[hop][destination] == reference[source][destination]
+
+
+def test_auto_reuses_cached_trees():
+    ids = list(range(1, 6))
+    graph = build_graph(ids, { (1, 2): 1, (2, 3): 1, (3, 4): 1, (4, 5): 1, (5, 1): 1, (1, 3): 1 })
+    graph.compute_trees(ids)
+    trees = dict(graph.shortest_path_trees)
+    tables = graph.all_pairs_next_hops(ids)
+    assert graph.shortest_path_trees == trees # nessun ricalcolo
+    assert tables == { dpid: graph.next_hops(dpid) for dpid in ids }
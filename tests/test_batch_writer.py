@@ -0,0 +1,83 @@
+# coding: utf-8
+
+"""
+Scrittore in background `BatchWriter`: un gruppo che non si riesce a scrivere
+non deve fermare il task né far perdere le righe valide.
+"""
+
+import asyncio
+import logging
+import sqlite3
+
+import pytest
+
+from database import BatchWriter, ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), size=2)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE samples (timestamp INTEGER NOT NULL, rtt REAL NOT NULL)")
+        conn.commit()
+    yield pool
+    pool.close_all()
+
+
+def stored(pool):
+    with pool.connection() as conn:
+        return [row for row in conn.execute("SELECT timestamp, rtt FROM samples ORDER BY timestamp")]
+
+
+def write_rows(conn, rows):
+    conn.executemany("INSERT INTO samples VALUES (?, ?)", [(timestamp, rtt + 0) for timestamp, rtt in rows])
+
+
+def run(writer, batches):
+    async def scenario():
+        writer.start()
+        for rows in batches:
+            for row in rows:
+                writer.submit(row)
+            await asyncio.sleep(0.05) # scaduto flush_interval: un gruppo per lista
+        assert not writer._task.done()
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+
+def test_malformed_rows_only_lose_themselves(pool, caplog):
+    writer = BatchWriter(pool, write_rows, batch_size=100, flush_interval=0.01)
+    with caplog.at_level(logging.WARNING, logger="database"):
+        # "x" + 0 solleva TypeError; None viola NOT NULL (IntegrityError)
+        run(writer, [[(1, 1.0), (2, "x"), (3, 3.0)], [(4, None), (5, 5.0)], [(6, 6.0)]])
+
+    assert stored(pool) == [(1, 1.0), (3, 3.0), (5, 5.0), (6, 6.0)]
+    dropped = [record for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(dropped) == 2
+
+
+def test_transient_errors_are_retried(pool, caplog):
+    failures = [sqlite3.OperationalError("database is locked")] * 2
+
+    def flaky_write_rows(conn, rows):
+        if failures:
+            raise failures.pop()
+        write_rows(conn, rows)
+
+    writer = BatchWriter(pool, flaky_write_rows, flush_interval=0.01, max_attempts=3, retry_delay=0.001)
+    with caplog.at_level(logging.WARNING, logger="database"):
+        run(writer, [[(1, 1.0), (2, 2.0)]])
+    assert stored(pool) == [(1, 1.0), (2, 2.0)]
+    assert [record.levelno for record in caplog.records] == [logging.WARNING, logging.WARNING]
+
+
+def test_persistent_errors_are_logged(pool, caplog):
+    def broken_write_rows(conn, rows):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    writer = BatchWriter(pool, broken_write_rows, flush_interval=0.01, max_attempts=2, retry_delay=0.001)
+    with caplog.at_level(logging.WARNING, logger="database"):
+        run(writer, [[(1, 1.0)], [(2, 2.0)]])
+    errors = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 2 and all("perse" in message for message in errors)
@@ -0,0 +1,53 @@
+# coding: utf-8
+
+"""
+Importazione CSV (`bulk.import_csv`): il file viene validato per intero prima di
+scrivere, poi scritto a blocchi, ciascuno nella propria transazione.
+"""
+
+import io
+import sqlite3
+
+import pytest
+
+import bulk
+
+
+def csv_file(lines):
+    return io.BytesIO(("\n".join([",".join(bulk.COLUMNS)] + lines) + "\n").encode())
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE samples (timestamp INTEGER, ip_dest TEXT, ip_src TEXT, rtt REAL, duration REAL)")
+    yield conn
+    conn.close()
+
+
+def write_rows(conn, rows):
+    conn.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def test_rows_are_committed_in_chunks(conn):
+    lines = ["%d,10.0.0.1,10.0.0.2,%d.5,1" % (1000 + i, i) for i in range(7)]
+    commits = []
+    conn.set_trace_callback(lambda statement: commits.append(statement) if statement == "COMMIT" else None)
+
+    stream = csv_file(lines)
+    assert bulk.import_csv(conn, stream, write_rows, chunk_size=3) == 7
+    assert len(commits) == 3 # blocchi di 3, 3 e 1 righe
+    assert not stream.closed
+    assert conn.execute("SELECT COUNT(*), MIN(timestamp), MAX(rtt) FROM samples").fetchone() == (7, 1000, 6.5)
+
+
+def test_invalid_row_imports_nothing(conn):
+    lines = ["%d,10.0.0.1,10.0.0.2,1.0,1" % i for i in range(10)] + ["x,10.0.0.1,10.0.0.2,1.0,1"]
+    with pytest.raises(ValueError, match="Riga 12"):
+        bulk.import_csv(conn, csv_file(lines), write_rows, chunk_size=3)
+    assert conn.execute("SELECT COUNT(*) FROM samples").fetchone() == (0,)
+
+
+def test_wrong_header(conn):
+    with pytest.raises(ValueError, match="Intestazione"):
+        bulk.import_csv(conn, io.BytesIO(b"a,b,c\n1,2,3\n"), write_rows)
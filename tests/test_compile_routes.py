@@ -0,0 +1,98 @@
+# coding: utf-8
+
+"""
+Compilazione delle tabelle di routing (`compile_routes`): la tabella compilata
+deve inoltrare ogni indirizzo allo stesso gateway della tabella originale con la
+regola del prefisso più lungo, lasciare senza rotta gli indirizzi che non ne avevano
+ed essere minima fra le tabelle equivalenti.
+"""
+
+import ipaddress
+import itertools
+import random
+
+import pytest
+
+pytest.importorskip("ryu")
+
+from our_dijkstra import compile_routes
+
+
+def forwarding(routes, addresses):
+    """
+    Gateway scelto per ciascuno degli `addresses` (interi IPv4) dalla regola
+    del prefisso più lungo (None: nessuna rotta).
+    """
+    networks = [ipaddress.ip_network(destination) for destination in routes]
+    # dal prefisso più lungo al più corto: vale il primo che contiene l'indirizzo
+    table = sorted(((network.prefixlen, int(network.network_address), int(network.netmask), hop)
+                    for network, hop in zip(networks, routes.values())), reverse=True)
+    result = []
+    for address in addresses:
+        result.append(next((hop for _, value, mask, hop in table if address & mask == value), None))
+    return result
+
+
+def test_merges_sibling_prefixes():
+    routes = {
+        "10.0.0.0/24": "10.0.100.1",
+        "10.0.1.0/24": "10.0.100.1",
+        "10.0.2.0/24": "10.0.100.2",
+        "10.0.3.0/24": "10.0.100.1",
+    }
+    assert compile_routes(routes) == { "10.0.0.0/22": "10.0.100.1", "10.0.2.0/24": "10.0.100.2" }
+
+
+def test_empty_and_mixed_versions():
+    assert compile_routes({}) == {}
+    routes = {
+        "10.0.0.0/25": "10.0.100.1",
+        "10.0.0.128/25": "10.0.100.1",
+        "2001:db8::/33": "fe80::1",
+        "2001:db8:8000::/33": "fe80::1",
+    }
+    assert compile_routes(routes) == { "10.0.0.0/24": "10.0.100.1", "2001:db8::/32": "fe80::1" }
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_preserves_longest_prefix_match(seed):
+    rng = random.Random(seed)
+    gateways = ["10.255.0.%d" % i for i in range(1, rng.randint(2, 4))]
+    routes = {}
+    for _ in range(rng.randint(1, 25)):
+        prefixlen = rng.randint(18, 30)
+        address = int(ipaddress.ip_address("10.0.0.0")) + rng.randrange(1 << 12)
+        network = ipaddress.ip_network((address, prefixlen), strict=False)
+        routes[str(network)] = rng.choice(gateways)
+
+    compiled = compile_routes(routes)
+    assert len(compiled) <= len(routes)
+    # tutti gli indirizzi dei prefissi più specifici e un campione di quelli circostanti
+    base = int(ipaddress.ip_address("10.0.0.0"))
+    addresses = [base + offset for offset in range(1 << 12)]
+    addresses += [base + rng.randrange(-(1 << 16), 1 << 16) for _ in range(500)]
+    assert forwarding(compiled, addresses) == forwarding(routes, addresses)
+    # la tabella compilata è già minima
+    assert len(compile_routes(compiled)) == len(compiled)
+
+
+def test_minimal_on_every_small_table():
+    # Tutte le tabelle con prefissi contenuti in 10.0.0.0/30 (dal /30 ai singoli indirizzi)
+    # e due gateway: la dimensione della tabella compilata deve coincidere con quella
+    # della più piccola tabella equivalente, trovata per enumerazione
+    prefixes = [str(network) for prefixlen in (30, 31, 32) for network in ipaddress.ip_network("10.0.0.0/30").subnets(new_prefix=prefixlen)]
+    addresses = [int(address) for address in ipaddress.ip_network("10.0.0.0/30")]
+    tables = []
+    for choice in itertools.product((None, "10.255.0.1", "10.255.0.2"), repeat=len(prefixes)):
+        tables.append({ prefix: hop for prefix, hop in zip(prefixes, choice) if hop is not None })
+
+    smallest = {}
+    for routes in tables:
+        behaviour = tuple(forwarding(routes, addresses))
+        smallest[behaviour] = min(smallest.get(behaviour, len(routes)), len(routes))
+
+    for routes in tables:
+        compiled = compile_routes(routes)
+        behaviour = tuple(forwarding(compiled, addresses))
+        assert behaviour == tuple(forwarding(routes, addresses))
+        assert len(compiled) == smallest[behaviour]
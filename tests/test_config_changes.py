@@ -0,0 +1,68 @@
+# coding: utf-8
+
+"""
+Differenze fra la configurazione degli switch richiesta dal client e quella già
+installata (`config_changes`), inviate alla rotta /router/batch.
+"""
+
+import pytest
+
+pytest.importorskip("mininet")
+
+from topology import DEFAULT_ROUTE, StaticRoute, SwitchConfig, config_changes
+
+
+def switch(id, addresses=(), routes=()):
+    return SwitchConfig(id=id, addresses=list(addresses), routes=[StaticRoute(destination, gateway) for destination, gateway in routes])
+
+
+def test_only_differences_are_sent():
+    installed = {
+        1: switch(1, ["10.0.0.254/24"], [("11.0.0.0/24", "180.0.0.2"), ("12.0.0.0/24", "180.0.0.2")]),
+    }
+    configs = [
+        switch(1, ["10.0.0.254/24", "180.0.0.1/30"], [("11.0.0.0/24", "180.0.0.2"), ("12.0.0.0/24", "200.0.0.2"), ("13.0.0.0/24", "180.0.0.2")]),
+        switch(2, ["11.0.0.254/24"], [("10.0.0.0/24", "180.0.0.1")]),
+    ]
+    assert config_changes(installed, configs) == {
+        "addresses": [
+            { "switch_id": 1, "address": "180.0.0.1/30" },
+            { "switch_id": 2, "address": "11.0.0.254/24" },
+        ],
+        # il gateway è cambiato: la rotta viene rimossa e reinstallata
+        "remove": [{ "switch_id": 1, "destination": "12.0.0.0/24" }],
+        "routes": [
+            { "switch_id": 1, "destination": "12.0.0.0/24", "gateway": "200.0.0.2" },
+            { "switch_id": 1, "destination": "13.0.0.0/24", "gateway": "180.0.0.2" },
+            { "switch_id": 2, "destination": "10.0.0.0/24", "gateway": "180.0.0.1" },
+        ],
+    }
+
+
+def test_unchanged_configuration_sends_nothing():
+    configs = [switch(1, ["10.0.0.254/24"], [("11.0.0.0/24", "180.0.0.2")])]
+    installed = { config.id: config for config in configs }
+    assert config_changes(installed, configs, prune_routes=True) == { "addresses": [], "remove": [], "routes": [] }
+
+
+def test_prune_only_managed_destinations():
+    installed = {
+        1: switch(1, routes=[("11.0.0.0/24", "180.0.0.2"), ("12.0.0.0/24", "180.0.0.2"), (DEFAULT_ROUTE, "180.0.0.2"), ("99.0.0.0/8", "180.0.0.2")]),
+        # switch senza più rotte nella nuova tabella
+        3: switch(3, routes=[("11.0.0.0/24", "200.0.0.1"), (DEFAULT_ROUTE, "200.0.0.1")]),
+    }
+    configs = [
+        switch(1, routes=[("11.0.0.0/24", "180.0.0.2")]),
+        switch(2, routes=[("12.0.0.0/24", "180.1.1.2")]),
+    ]
+
+    changes = config_changes(installed, configs, prune_routes=True)
+    # la rotta predefinita e 99.0.0.0/8 non sono state inviate da questo client: restano installate
+    assert changes["remove"] == [
+        { "switch_id": 1, "destination": "12.0.0.0/24" },
+        { "switch_id": 3, "destination": "11.0.0.0/24" },
+    ]
+    assert changes["routes"] == [{ "switch_id": 2, "destination": "12.0.0.0/24", "gateway": "180.1.1.2" }]
+
+    # senza prune_routes nessuna rotta assente dalla configurazione viene rimossa
+    assert config_changes(installed, configs)["remove"] == []
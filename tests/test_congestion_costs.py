@@ -0,0 +1,152 @@
+# coding: utf-8
+
+"""
+Costi dei collegamenti basati sulle misure (`CongestionCostModel`) e loro
+aggiornamento dalle statistiche delle porte (`DijkstraRouter.port_stats_reply_handler`):
+le variazioni sotto la soglia vengono ignorate, quelle oltre aggiornano il grafo,
+la cache di /dijkstra e le rotte degli switch coinvolti.
+"""
+
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ryu")
+
+import our_dijkstra
+from benchmark import StubDatapath, StubLink, StubPort, StubSwitch
+from our_dijkstra import CongestionCostModel, DijkstraCommand, DijkstraRouter, NetLinkGraph
+
+PARAMS = { "bw": "10", "delay": "1ms" } # 10 Mbps
+NOMINAL = NetLinkGraph.weight_function(PARAMS)
+
+Port = namedtuple("Port", ["dpid", "port_no"])
+Link = namedtuple("Link", ["src", "dst"])
+PortStats = namedtuple("PortStats", ["port_no", "tx_bytes", "tx_packets", "tx_dropped"])
+
+
+def test_first_observation_then_moving_average():
+    model = CongestionCostModel(smoothing=0.25)
+    model.observe(1, 2, 0.4, 0.1)
+    assert (model.utilization[1, 2], model.drop_rate[1, 2]) == (0.4, 0.1)
+    model.observe(1, 2, 0.8, 0.0)
+    assert model.utilization[1, 2] == pytest.approx(0.5)
+    assert model.drop_rate[1, 2] == pytest.approx(0.075)
+
+
+def test_cost_formula():
+    model = CongestionCostModel(drop_weight=10)
+    assert model.link_cost(1, 2, PARAMS) == NOMINAL # nessuna misura
+    model.observe(1, 2, 0.5, 0.0)
+    assert model.link_cost(1, 2, PARAMS) == pytest.approx(2 * NOMINAL)
+    # conta la direzione più carica, in entrambi i versi
+    model.observe(2, 1, 0.75, 0.05)
+    assert model.link_cost(1, 2, PARAMS) == model.link_cost(2, 1, PARAMS) == pytest.approx(4 * NOMINAL * 1.5)
+    assert model.link_cost(1, 3, None) == 1
+
+
+def test_utilization_is_clamped():
+    model = CongestionCostModel(max_utilization=0.9)
+    model.observe(1, 2, 3.0, 0.0) # misura spuria oltre la capacità
+    assert model.link_cost(1, 2, PARAMS) == pytest.approx(10 * NOMINAL)
+    model.observe(3, 4, -1.0, 0.0)
+    assert model.link_cost(3, 4, PARAMS) == NOMINAL
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """
+    Triangolo 1-2-3 con link uguali: da 1 lo switch 2 si raggiunge direttamente
+    (porta 1), oppure passando da 3 (porta 2) al doppio del costo.
+    """
+    ids = [1, 2, 3]
+    pairs = [(1, 2), (2, 3), (1, 3)]
+    params = {}
+    for a, b in pairs:
+        params[a, b] = params[b, a] = dict(PARAMS)
+    model = CongestionCostModel(smoothing=1.0)
+    graph = NetLinkGraph(None, [StubSwitch(StubDatapath(dpid)) for dpid in ids], { StubLink(StubPort(a), StubPort(b)): 0 for a, b in pairs }, params, model)
+    graph.compute_trees(ids) # come dopo una richiesta a /dijkstra
+
+    ports = { (1, 2): 1, (1, 3): 2, (2, 1): 1, (2, 3): 2, (3, 1): 1, (3, 2): 2 }
+    links = { Link(Port(a, ports[a, b]), Port(b, ports[b, a])): 0 for a, b in ports }
+    monkeypatch.setattr(our_dijkstra, "get_all_link", lambda _app: links)
+    clock = Clock()
+    monkeypatch.setattr(our_dijkstra, "time", SimpleNamespace(monotonic=clock.monotonic, perf_counter=time.perf_counter))
+
+    router = DijkstraRouter.__new__(DijkstraRouter) # senza avviare i thread del controller
+    router.net_graph = graph
+    router.port_counters = {}
+    router.updated = []
+    router.update_routes = router.updated.append
+    router.clock = clock
+    router.counters = { 1: [0, 0, 0], 2: [0, 0, 0] } # porta -> byte, pacchetti, scartati
+    return router
+
+
+def report(router, elapsed, traffic):
+    """
+    Fa trascorrere `elapsed` secondi e invia le statistiche delle porte dello switch 1,
+    con `traffic` {porta: (utilizzo, frazione scartata)} nell'intervallo.
+    """
+    router.clock.now += elapsed
+    bps = float(PARAMS["bw"]) * 10 ** 6
+    for port, (utilization, drop_rate) in traffic.items():
+        counters = router.counters[port]
+        sent = 1000
+        counters[0] += int(utilization * bps * elapsed / 8)
+        counters[1] += sent
+        counters[2] += round(sent * drop_rate / (1 - drop_rate))
+    body = [PortStats(port, *counters) for port, counters in router.counters.items()]
+    router.port_stats_reply_handler(SimpleNamespace(msg=SimpleNamespace(datapath=SimpleNamespace(id=1), body=body)))
+
+
+def test_port_stats_update_costs_and_routes(router):
+    graph = router.net_graph
+    DijkstraCommand._ROUTE_CACHE["key"] = ([], "[]")
+    report(router, 0, {}) # prima lettura: nessun intervallo da misurare
+    assert graph.cost_model.utilization == {}
+
+    report(router, 5, { 1: (0.1, 0.0), 2: (0.0, 0.0) })
+    assert graph.cost_model.utilization[1, 2] == pytest.approx(0.1, rel=1e-3)
+    # costo +11%: sotto la soglia COST_CHANGE_THRESHOLD, grafo e rotte invariati
+    assert graph.neighbors(1)[2] == pytest.approx(NOMINAL)
+    assert router.updated == [] and "key" in DijkstraCommand._ROUTE_CACHE
+
+    report(router, 5, { 1: (0.6, 0.0), 2: (0.0, 0.0) })
+    assert graph.neighbors(1)[2] == pytest.approx(NOMINAL / 0.4, rel=1e-3)
+    assert graph.neighbors(2)[1] == graph.neighbors(1)[2] # il grafo non è orientato
+    assert DijkstraCommand._ROUTE_CACHE == {}
+    assert len(router.updated) == 1 and { 1, 2 } <= router.updated[0] # switch i cui alberi cambiano
+    # il percorso diretto costa ora più di quello attraverso 3
+    assert graph.next_hops(1)[2] == 3
+
+    report(router, 5, { 1: (0.0, 0.0), 2: (0.0, 0.5) })
+    assert graph.neighbors(1)[2] == pytest.approx(NOMINAL)
+    assert graph.neighbors(1)[3] == pytest.approx(NOMINAL * 6, rel=1e-3) # 1 + 10 * 0.5
+    assert graph.next_hops(1)[2] == 2
+
+
+def test_counter_reset_is_ignored(router):
+    report(router, 0, {})
+    report(router, 5, { 1: (0.5, 0.0) })
+    before = dict(router.net_graph.cost_model.utilization)
+    router.counters[1] = [0, 0, 0] # switch riconnesso: contatori azzerati
+    report(router, 5, {})
+    assert router.net_graph.cost_model.utilization == before
+
+
+def test_ignored_without_congestion_model(router):
+    router.net_graph.cost_model = our_dijkstra.StaticCostModel()
+    report(router, 0, {})
+    assert router.port_counters == {}
@@ -0,0 +1,108 @@
+# coding: utf-8
+
+"""
+Scadenze assolute di `DeadlineTimer`: i risvegli in ritardo non si accumulano
+(nessuna deriva) e le scadenze già trascorse vengono saltate e contate in `missed`,
+senza raffiche per recuperarle. Il clock monotono è simulato.
+"""
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import sessions
+from sessions import DeadlineTimer
+
+MS = 1000000
+
+
+class FakeClock():
+    """
+    Clock monotono simulato: `sleep` lo fa avanzare della durata richiesta più un
+    ritardo di risveglio casuale, `work` simula la durata di un probe.
+    """
+
+    def __init__(self, start_ns, oversleep_ns=0, seed=0):
+        self.now = start_ns
+        self.oversleep_ns = oversleep_ns
+        self.rng = random.Random(seed)
+        self.sleeps = []
+
+    def monotonic_ns(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += max(0, int(seconds * 1e9)) + self.rng.randint(0, self.oversleep_ns)
+
+    def work(self, ns):
+        self.now += ns
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock(10 ** 12, oversleep_ns=3 * MS)
+    monkeypatch.setattr(sessions, "time", SimpleNamespace(monotonic_ns=clock.monotonic_ns))
+    monkeypatch.setattr(sessions, "asyncio", SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+
+def ticks(timer, clock, count, work=lambda i: 0):
+    async def main():
+        deadlines = []
+        for i in range(count):
+            clock.work(work(i))
+            deadlines.append(await timer.wait_next())
+        return deadlines
+    return asyncio.run(main())
+
+
+def test_late_wakeups_do_not_drift(clock):
+    start = clock.now
+    timer = DeadlineTimer(0.01, start)
+    deadlines = ticks(timer, clock, 1000, work=lambda i: clock.rng.randint(0, 5 * MS))
+    # ritardi di risveglio fino a 3 ms e probe fino a 5 ms: sempre entro i 10 ms dell'intervallo
+    assert deadlines == [start + (k + 1) * 10 * MS for k in range(1000)]
+    assert timer.missed == 0
+    assert clock.now - deadlines[-1] <= 3 * MS # dopo 1000 campioni l'errore è quello del solo ultimo risveglio
+
+
+def test_slow_probe_skips_missed_deadlines(clock):
+    clock.oversleep_ns = 0
+    start = clock.now
+    timer = DeadlineTimer(0.01, start)
+    # il terzo probe dura 35 ms: le scadenze a 30, 40 e 50 ms sono già passate
+    deadlines = ticks(timer, clock, 5, work=lambda i: 35 * MS if i == 2 else MS)
+    assert [(deadline - start) // MS for deadline in deadlines] == [10, 20, 60, 70, 80]
+    assert timer.missed == 3
+    assert all(seconds > 0 for seconds in clock.sleeps) # nessuna raffica di risvegli immediati
+
+
+def test_deadline_exactly_now_is_not_missed(clock):
+    clock.oversleep_ns = 0
+    start = clock.now
+    timer = DeadlineTimer(0.01, start)
+    deadlines = ticks(timer, clock, 2, work=lambda i: 10 * MS if i == 1 else 0)
+    assert [(deadline - start) // MS for deadline in deadlines] == [10, 20]
+    assert timer.missed == 0
+
+
+def test_interval_resolution(clock):
+    assert DeadlineTimer(0.001, 0).interval_ns == MS
+    assert DeadlineTimer(1e-12, 0).interval_ns == 1 # mai nullo
+
+
+def test_real_clock_period():
+    # Con il clock reale il periodo medio resta quello richiesto
+    async def main():
+        loop_start = sessions.time.monotonic_ns()
+        timer = DeadlineTimer(0.005, loop_start)
+        for _ in range(40):
+            await timer.wait_next()
+        return loop_start, timer, sessions.time.monotonic_ns()
+
+    start, timer, end = asyncio.run(main())
+    assert timer.deadline == start + (40 + timer.missed) * 5 * MS # sulla griglia, anche se il sistema è carico
+    assert end >= timer.deadline
@@ -0,0 +1,60 @@
+# coding: utf-8
+
+"""
+Dijkstra con heap binario (`NetLinkGraph.dijkstra`): costi e predecessori devono
+coincidere con i cammini minimi calcolati da Bellman-Ford sulle stesse topologie.
+"""
+
+import random
+import sys
+
+import pytest
+
+pytest.importorskip("ryu")
+
+from benchmark import synthetic_parameters, synthetic_topology
+from graphs import build_graph, random_costs, reference_distances
+from our_dijkstra import NetLinkGraph
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_dijkstra_matches_bellman_ford(seed):
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 1000), rng.randint(1, 25))
+    costs = random_costs(rng, ids)
+    graph = build_graph(ids, costs)
+    reference = reference_distances(ids, costs)
+
+    for source in ids:
+        result = graph.dijkstra(source)
+        assert set(result) == set(ids)
+        for dpid, entry in result.items():
+            expected = reference[source][dpid]
+            if expected == float("inf"):
+                assert (entry.cost, entry.previous_dpid) == (sys.maxsize, None)
+                continue
+            assert entry.cost == expected
+            if dpid == source:
+                assert entry.previous_dpid is None
+            else:
+                # il predecessore è un vicino lungo un cammino minimo
+                previous = entry.previous_dpid
+                assert reference[source][previous] + graph.neighbors(previous)[dpid] == expected
+
+
+def test_unknown_source_reaches_nothing():
+    graph = build_graph([1, 2], { (1, 2): 3 })
+    assert { dpid: entry.cost for dpid, entry in graph.dijkstra(99).items() } == { 1: sys.maxsize, 2: sys.maxsize }
+
+
+def test_static_costs_from_link_parameters():
+    # anello con corde del benchmark: i costi derivano da ritardo e banda di ciascun link
+    switches, links = synthetic_topology(40, 20, seed=5)
+    params = synthetic_parameters(links, seed=5)
+    graph = NetLinkGraph(None, switches, links, params)
+    for link in links:
+        expected = NetLinkGraph.weight_function(params[link.src.dpid, link.dst.dpid])
+        assert graph.neighbors(link.src.dpid)[link.dst.dpid] == expected
+        assert graph.neighbors(link.dst.dpid)[link.src.dpid] == expected
+    result = graph.dijkstra(switches[0].dp.id)
+    assert all(entry.cost < sys.maxsize for entry in result.values()) # l'anello è connesso
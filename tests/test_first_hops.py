@@ -0,0 +1,96 @@
+# coding: utf-8
+
+"""
+Primi hop precalcolati negli alberi dei cammini minimi (`ShortestPathTree.hop`):
+devono coincidere con quelli che si ottengono risalendo la catena dei predecessori,
+sia per gli alberi calcolati da zero (anche dal pool di processi) sia dopo
+gli aggiornamenti incrementali della topologia.
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("ryu")
+
+from benchmark import StubDatapath, StubLink, StubPort, StubSwitch, synthetic_parameters, synthetic_topology
+from our_dijkstra import NetLinkGraph
+from parallel_paths import ParallelShortestPaths, csr_dijkstra
+
+
+def walk_first_hops(pred, source):
+    """
+    Primo hop di ogni nodo ricavato risalendo i predecessori fino alla sorgente (-1 se assente).
+    """
+    hops = []
+    for node in range(len(pred)):
+        current, first = node, -1
+        while pred[current] >= 0:
+            first, current = current, pred[current]
+        hops.append(first if current == source and node != source else -1)
+    return hops
+
+
+def check_first_hops(graph):
+    for source, tree in graph.shortest_path_trees.items():
+        assert list(tree.hop) == walk_first_hops(tree.pred, source)
+        expected = { graph.ids[node]: graph.ids[hop] for node, hop in enumerate(tree.hop) if hop >= 0 }
+        assert graph.next_hops(graph.ids[source]) == expected
+        # il primo hop è sempre un vicino della sorgente
+        assert set(expected.values()) <= set(graph.neighbors(graph.ids[source]))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_first_hops_after_incremental_updates(seed):
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 500), rng.randint(2, 30))
+    params = {}
+
+    def connect(a, b):
+        value = { "bw": rng.choice([1, 10, 100]), "delay": rng.choice(["0ms", "1ms", "%.4fms" % rng.uniform(0, 3)]) }
+        params[a, b] = params[b, a] = value
+
+    pairs = { tuple(rng.sample(ids, 2)) for _ in range(rng.randint(0, 3 * len(ids))) }
+    for a, b in pairs:
+        connect(a, b)
+    switches = [StubSwitch(StubDatapath(dpid)) for dpid in ids]
+    graph = NetLinkGraph(None, switches, { StubLink(StubPort(a), StubPort(b)): 0 for a, b in pairs }, params)
+    graph.compute_trees(ids)
+    check_first_hops(graph)
+
+    for _ in range(30):
+        event = rng.random()
+        current = list(graph.ids)
+        if event < 0.35 and len(current) >= 2:
+            a, b = rng.sample(current, 2)
+            connect(a, b)
+            graph.set_link(a, b)
+        elif event < 0.65:
+            existing = [(a, b) for a in current for b in graph.neighbors(a)]
+            if existing:
+                graph.remove_link(*rng.choice(existing))
+        elif event < 0.8:
+            dpid = rng.randint(500, 600)
+            graph.add_switch(StubSwitch(StubDatapath(dpid)))
+            graph.compute_trees([dpid])
+        elif current:
+            graph.remove_switch(rng.choice(current))
+        check_first_hops(graph)
+
+
+def test_parallel_trees_match_sequential():
+    switches, links = synthetic_topology(40, 40, seed=3)
+    graph = NetLinkGraph(None, switches, links, synthetic_parameters(links, seed=3))
+    csr = (graph.indptr, graph.indices, graph.weights)
+    sources = list(range(len(graph.ids)))
+
+    pool = ParallelShortestPaths(workers=2, min_switches=2)
+    try:
+        trees = pool.shortest_path_trees((graph.generation, graph.version), csr, sources)
+    finally:
+        pool.shutdown()
+
+    assert trees is not None and set(trees) == set(sources)
+    for source, (dist, pred, hop) in trees.items():
+        assert (dist, pred, hop) == csr_dijkstra(*csr, source)
+        assert list(hop) == walk_first_hops(pred, source)
@@ -0,0 +1,129 @@
+# coding: utf-8
+
+"""
+Storico di un host: pagine della tabella con cursore `timestamp:id`
+(/get_host_measurements) e grafico ridotto a gruppi min/max (`app.downsample_host`).
+"""
+
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip("quart")
+
+import app
+from database import ConnectionPool
+
+HOST = "10.0.0.1"
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    pool = ConnectionPool(str(tmp_path / "rtt.db"), size=2)
+    monkeypatch.setattr(app, "db", pool)
+    app.init_db()
+    yield pool
+    pool.close_all()
+
+
+def store(pool, rows):
+    with pool.connection() as conn:
+        with conn:
+            app.write_measurements(conn, rows)
+
+
+def get(path, **params):
+    async def main():
+        response = await app.app.test_client().get(path, query_string=params)
+        return response.status_code, await response.get_json()
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def history(database):
+    # Molte misure con lo stesso timestamp: il cursore deve distinguerle per id.
+    # Gli RTT sono distinti e identificano le misure nelle risposte.
+    rng = random.Random(0)
+    rows = [(1700000000000 + rng.randrange(20) * 1000, HOST, "10.0.0.100", float(i), 60) for i in range(157)]
+    store(database, rows + [(1700000000000, "10.0.0.2", "10.0.0.100", -1.0, 60)])
+    # dalla più recente: timestamp decrescente, poi ordine di scrittura (id) decrescente
+    expected = [rtt for _, rtt in sorted(((row[0], row[3]) for row in rows), reverse=True)]
+    return expected
+
+
+@pytest.mark.parametrize("limit", [1, 10, 50, 157, 200])
+def test_pages_cover_history_once(history, limit):
+    seen = []
+    cursor = None
+    for _ in range(len(history) + 1):
+        params = { "ip_dest": HOST, "limit": limit }
+        if cursor is not None:
+            params["cursor"] = cursor
+        status, page = get("/get_host_measurements", **params)
+        assert status == 200
+        assert 0 < len(page["measurements"]) <= limit
+        seen.extend(measurement["rtt"] for measurement in page["measurements"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == history
+
+
+def test_cursor_at_page_boundary(history, database):
+    status, page = get("/get_host_measurements", ip_dest=HOST, limit=5)
+    timestamp, id = (int(part) for part in page["next_cursor"].split(":"))
+    with database.connection() as conn:
+        # il cursore indica l'ultima misura della pagina
+        assert conn.execute("SELECT rtt FROM measurements WHERE id = ? AND timestamp = ?", (id, timestamp)).fetchone()[0] == history[4]
+    status, following = get("/get_host_measurements", ip_dest=HOST, limit=5, cursor=page["next_cursor"])
+    assert [measurement["rtt"] for measurement in following["measurements"]] == history[5:10]
+
+
+@pytest.mark.parametrize("cursor", ["abc", "12", "1:2:3", "1:x"])
+def test_invalid_cursor(history, cursor):
+    status, body = get("/get_host_measurements", ip_dest=HOST, cursor=cursor)
+    assert status == 400 and "error" in body
+
+
+def test_unknown_host(database):
+    status, page = get("/get_host_measurements", ip_dest="10.9.9.9")
+    assert status == 200 and page == { "measurements": [], "next_cursor": None }
+
+
+def expected_downsample(rtts, points):
+    """
+    Riferimento di `downsample_host` su RTT distinti, in ordine di tempo.
+    """
+    if len(rtts) <= points:
+        return list(enumerate(rtts))
+    size = -(-len(rtts) // max(1, points // 2))
+    selected = {}
+    for start in range(0, len(rtts), size):
+        bucket = rtts[start:start + size]
+        for value in ((min(bucket), max(bucket)) if points > 1 else (max(bucket),)):
+            selected[start + bucket.index(value)] = value
+    return sorted(selected.items())
+
+
+@pytest.mark.parametrize("count, points", [
+    (10, 10), (11, 10), (100, 10), (101, 10), (99, 7), (1000, 1), (1000, 2), (1000, 3), (37, 36), (500, 999),
+])
+def test_downsample_buckets(database, count, points):
+    rng = random.Random(count * 1000 + points)
+    rtts = rng.sample(range(100000), count)
+    store(database, [(1000 * i, HOST, "10.0.0.100", float(rtt), 60) for i, rtt in enumerate(rtts)])
+
+    with database.connection() as conn:
+        result = app.downsample_host(conn, HOST, points)
+    assert len(result) <= points
+    assert [(idx, rtt) for idx, _, rtt in result] == expected_downsample([float(rtt) for rtt in rtts], points)
+    assert all(timestamp == 1000 * idx for idx, timestamp, _ in result)
+
+
+def test_downsample_range(database):
+    store(database, [(1000 * i, HOST, "10.0.0.100", float(i), 60) for i in range(100)])
+    with database.connection() as conn:
+        # gli estremi [start, end) selezionano le misure 10..19, riassunte in 2 gruppi
+        result = app.downsample_host(conn, HOST, 4, start=10000, end=20000)
+    assert [(idx, rtt) for idx, _, rtt in result] == [(0, 10.0), (4, 14.0), (5, 15.0), (9, 19.0)]
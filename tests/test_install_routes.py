@@ -0,0 +1,95 @@
+# coding: utf-8
+
+"""
+Applicazione diretta delle rotte ai router di rest_router (`DijkstraRouter.install_routes`):
+le operazioni che rest_router rifiuta, con un'eccezione o con un risultato REST_NG,
+devono finire fra quelle fallite e non fra quelle svolte.
+"""
+
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ryu")
+
+from ryu.app.rest_router import REST_COMMAND_RESULT, REST_DETAILS, REST_NG, REST_OK, REST_RESULT, RouterController, VLANID_NONE
+from our_dijkstra import DijkstraRouter
+
+
+class FakeRouter(dict):
+    """
+    Router di rest_router ridotto all'essenziale: le risposte hanno lo stesso formato
+    di `Router.set_data` e `Router.delete_data`.
+    """
+
+    def __init__(self, switch_id):
+        super().__init__()
+        self.switch_id = switch_id
+        self[VLANID_NONE] = SimpleNamespace(routing_tbl={})
+        self.next_id = 1
+
+    def _response(self, result, details):
+        return { "switch_id": "%016x" % self.switch_id, REST_COMMAND_RESULT: [{ REST_RESULT: result, REST_DETAILS: details }] }
+
+    def set_data(self, vlan_id, param, waiters):
+        if "address" in param:
+            if "/" not in param["address"]:
+                raise ValueError("Invalid parameter.")
+            return self._response(REST_OK, "Add address [address_id=1]")
+        table = self[vlan_id].routing_tbl
+        if param["destination"] in table:
+            return self._response(REST_NG, "Destination overlaps [route_id=%d]" % table[param["destination"]].route_id)
+        if param["gateway"].startswith("99."):
+            return self._response(REST_NG, "Gateway=%s's address is not registered." % param["gateway"])
+        table[param["destination"]] = SimpleNamespace(route_id=self.next_id, gateway=param["gateway"])
+        self.next_id += 1
+        return self._response(REST_OK, "Add route [route_id=%d]" % (self.next_id - 1))
+
+    def delete_data(self, vlan_id, param, waiters):
+        table = self[vlan_id].routing_tbl
+        for destination, route in list(table.items()):
+            if route.route_id == param["route_id"]:
+                del table[destination]
+                return self._response(REST_OK, "Delete route [route_id=%d]" % route.route_id)
+        return { "switch_id": "%016x" % self.switch_id, REST_COMMAND_RESULT: [{ REST_RESULT: REST_NG, REST_DETAILS: "Data is nothing." }] }
+
+
+@pytest.fixture
+def routers(monkeypatch):
+    routers = { 1: FakeRouter(1) }
+    monkeypatch.setattr(RouterController, "_ROUTER_LIST", routers, raising=False)
+    return routers
+
+
+def install(**kwargs):
+    app = SimpleNamespace(logger=logging.getLogger("test"), waiters={})
+    return DijkstraRouter.install_routes(app, **kwargs)
+
+
+def test_rest_ng_results_are_failures(routers):
+    result = install(
+        to_add={ (1, "11.0.0.0/24"): "180.0.0.2", (1, "12.0.0.0/24"): "99.0.0.1", (2, "13.0.0.0/24"): "180.0.0.2" },
+        to_remove=[],
+        addresses=[(1, "10.0.0.254/24"), (1, "10.0.0.254")],
+    )
+    assert (result["addresses"], result["added"], result["removed"]) == (1, 1, 0)
+    failed = { (entry["switch_id"], entry.get("destination", entry.get("address"))): entry["error"] for entry in result["failed"] }
+    assert failed == {
+        (1, "10.0.0.254"): "Invalid parameter.", # eccezione
+        (1, "12.0.0.0/24"): "Gateway=99.0.0.1's address is not registered.", # REST_NG
+        (2, "13.0.0.0/24"): "unknown switch",
+    }
+
+    # una rotta già presente con la stessa destinazione viene rifiutata con REST_NG
+    result = install(to_add={ (1, "11.0.0.0/24"): "180.0.0.3" }, to_remove=[])
+    assert result["added"] == 0
+    assert result["failed"][0]["error"] == "Destination overlaps [route_id=1]"
+
+
+def test_remove_then_add(routers):
+    install(to_add={ (1, "11.0.0.0/24"): "180.0.0.2" }, to_remove=[])
+    result = install(to_add={ (1, "11.0.0.0/24"): "180.0.0.3" }, to_remove=[(1, "11.0.0.0/24"), (1, "12.0.0.0/24")])
+    # la rotta 12.0.0.0/24 non è installata: nessuna operazione
+    assert (result["removed"], result["added"], result["failed"]) == (1, 1, [])
+    assert routers[1][VLANID_NONE].routing_tbl["11.0.0.0/24"].gateway == "180.0.0.3"
@@ -0,0 +1,122 @@
+# coding: utf-8
+
+"""
+Stream Server-Sent Events dei risultati in corso (/stream_current_data): ogni evento
+porta soltanto i nuovi campioni, le statistiche incrementali (Welford) coincidono con
+quelle calcolate su tutti i campioni e la riconnessione con Last-Event-ID riprende
+dal punto in cui ci si era fermati.
+"""
+
+import asyncio
+import json
+import random
+import statistics
+
+import pytest
+
+pytest.importorskip("quart")
+
+import app
+from rtt_stats import RunningStats
+from sessions import SessionScheduler
+
+RTTS = [round(random.Random(0).uniform(1, 50) + i % 7, 3) for i in range(40)]
+
+
+def parse_events(body):
+    events = []
+    for block in body.split("\n\n"):
+        fields = {}
+        for line in block.splitlines():
+            if line.startswith(":"): # commento (keep-alive)
+                fields.setdefault("comment", True)
+                continue
+            name, _, value = line.partition(": ")
+            fields[name] = value
+        if fields:
+            events.append(fields)
+    return events
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    async def run(session):
+        for i, rtt in enumerate(RTTS):
+            session.add_sample(i * session.interval, rtt)
+            if i % 10 == 9: # i campioni arrivano a gruppi
+                await asyncio.sleep(0.01)
+
+    scheduler = SessionScheduler(run)
+    monkeypatch.setattr(app, "scheduler", scheduler)
+    return scheduler
+
+
+def stream(scheduler, headers=None, received=0, **params):
+    """
+    Avvia una sessione e ne legge lo stream fino all'evento `end`, collegandosi
+    quando la sessione ha già prodotto almeno `received` campioni.
+    """
+    async def main():
+        session = scheduler.start("10.0.0.1", 1, 0.01)
+        while session.measurements.total < received:
+            await asyncio.sleep(0.001)
+        response = await app.app.test_client().get(
+            "/stream_current_data", query_string=dict(params, session_id=session.id), headers=headers or {}
+        )
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        return parse_events((await response.get_data()).decode())
+    return asyncio.run(main())
+
+
+def test_stream_pushes_new_samples_and_ends(scheduler):
+    events = stream(scheduler)
+    assert events[-1] == { "event": "end", "data": "{}" }
+    data_events = [event for event in events if "id" in event]
+    assert len(data_events) >= 2 # più eventi, non un'unica risposta finale
+
+    received, previous = [], 0
+    for event in data_events:
+        data = json.loads(event["data"])
+        received.extend(rtt for _, rtt in data["samples"])
+        # l'id è il numero di campioni inviati finora, e coincide con il conteggio delle statistiche
+        assert int(event["id"]) == len(received) == data["count"] > previous
+        previous = int(event["id"])
+    assert received == RTTS
+
+    last = json.loads(data_events[-1]["data"])
+    assert last["avg_rtt"] == pytest.approx(statistics.mean(RTTS))
+    assert last["std_rtt"] == pytest.approx(statistics.stdev(RTTS))
+    assert (last["percentiles"]["min"], last["percentiles"]["max"]) == (min(RTTS), max(RTTS))
+
+
+@pytest.mark.parametrize("resume", [0, 1, 17, 40])
+def test_reconnect_resumes_after_last_event(scheduler, resume):
+    # il client si riconnette dopo aver ricevuto i primi `resume` campioni
+    events = stream(scheduler, headers={ "Last-Event-ID": str(resume) }, received=resume)
+    received = [rtt for event in events if "id" in event for _, rtt in json.loads(event["data"])["samples"]]
+    assert received == RTTS[resume:]
+    assert events[-1]["event"] == "end"
+
+
+def test_unknown_session(scheduler):
+    async def main():
+        response = await app.app.test_client().get("/stream_current_data", query_string={ "session_id": "missing" })
+        return response.status_code
+    assert asyncio.run(main()) == 404
+
+
+def test_running_stats_welford():
+    rng = random.Random(1)
+    # valori grandi con piccola varianza: la formula della somma dei quadrati perderebbe precisione
+    values = [1e9 + rng.uniform(0, 1) for _ in range(10000)]
+    stats = RunningStats()
+    for value in values:
+        stats.update(value)
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(statistics.mean(values), rel=1e-12)
+    assert stats.variance == pytest.approx(statistics.variance(values), rel=1e-6)
+
+    single = RunningStats()
+    single.update(3.0)
+    assert (single.mean, single.variance, single.std) == (3.0, 0.0, 0.0)
@@ -0,0 +1,118 @@
+# coding: utf-8
+
+"""
+Metriche del controller (`ControllerMetrics`) nel formato testuale di Prometheus
+0.0.4: ogni riga deve essere un commento HELP/TYPE o un campione valido, gli
+istogrammi cumulativi e coerenti con conteggio e somma.
+"""
+
+import math
+import re
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ryu")
+
+import our_dijkstra
+from our_dijkstra import ControllerMetrics, DijkstraCommand
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{((?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*",?)*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"')
+
+
+def unescape(value):
+    return re.sub(r'\\(.)', lambda match: { "n": "\n" }.get(match.group(1), match.group(1)), value)
+
+
+def parse(text):
+    """
+    Analizza l'esposizione: restituisce {famiglia: tipo} e la lista dei campioni
+    (nome, etichette, valore), verificando che ogni campione segua il TYPE della sua famiglia.
+    """
+    assert text.endswith("\n")
+    types, samples = {}, []
+    for line in text[:-1].split("\n"):
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name not in types # un solo TYPE per famiglia
+            assert kind in ("counter", "gauge", "histogram")
+            types[name] = kind
+            continue
+        if line.startswith("# HELP "):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        family = name
+        if name not in types:
+            family = re.sub(r"_(bucket|sum|count)$", "", name)
+            assert types.get(family) == "histogram", line
+        samples.append((name, { key: unescape(value) for key, value in LABEL.findall(labels or "") }, float(value)))
+    return types, samples
+
+
+def test_render_histograms_and_counters():
+    metrics = ControllerMetrics()
+    durations = [0.00005, 0.0001, 0.0003, 0.002, 0.002, 0.7, 30]
+    for seconds in durations:
+        metrics.observe("shortest_path", seconds)
+    metrics.observe("serialization", 0.01)
+    metrics.inc("routes_installed_total", 3, kind="unicast")
+    metrics.inc("routes_installed_total", 2, kind="compiled")
+    metrics.inc("routes_installed_total", kind="unicast")
+    metrics.inc("dijkstra_runs_total")
+
+    types, samples = parse(metrics.render({ "dijkstra_routes": ("Rotte installate", 12) }))
+    assert types == {
+        "dijkstra_stage_duration_seconds": "histogram",
+        "routes_installed_total": "counter",
+        "dijkstra_runs_total": "counter",
+        "dijkstra_routes": "gauge",
+    }
+
+    buckets = [(labels["le"], value) for name, labels, value in samples
+               if name == "dijkstra_stage_duration_seconds_bucket" and labels["stage"] == "shortest_path"]
+    assert [bound for bound, _ in buckets] == [str(bound) for bound in ControllerMetrics.BUCKETS] + ["+Inf"]
+    for bound, value in buckets:
+        # "le": i valori uguali all'estremo ricadono nel bucket
+        assert value == sum(1 for seconds in durations if seconds <= float(bound))
+    values = { (name, tuple(sorted(labels.items()))): value for name, labels, value in samples }
+    assert values["dijkstra_stage_duration_seconds_count", (("stage", "shortest_path"),)] == len(durations)
+    assert values["dijkstra_stage_duration_seconds_sum", (("stage", "shortest_path"),)] == pytest.approx(sum(durations))
+    assert values["dijkstra_stage_duration_seconds_count", (("stage", "serialization"),)] == 1
+    assert values["routes_installed_total", (("kind", "unicast"),)] == 4
+    assert values["routes_installed_total", (("kind", "compiled"),)] == 2
+    assert values["dijkstra_runs_total", ()] == 1
+    assert values["dijkstra_routes", ()] == 12
+
+
+def test_empty_render():
+    types, samples = parse(ControllerMetrics().render({}))
+    assert types == { "dijkstra_stage_duration_seconds": "histogram" } and samples == []
+
+
+def test_label_values_are_escaped():
+    metrics = ControllerMetrics()
+    value = 'a "b" \\ c\nd'
+    metrics.inc("topology_events_total", event=value)
+    metrics.observe(value, 1)
+    _, samples = parse(metrics.render({}))
+    assert { labels.get("event", labels.get("stage")) for _, labels, _ in samples } == { value }
+
+
+def test_metrics_route(monkeypatch):
+    metrics = ControllerMetrics()
+    metrics.inc("dijkstra_runs_total", 5)
+    monkeypatch.setattr(our_dijkstra, "metrics", metrics)
+    app = SimpleNamespace(net_graph=None, route_table={ (1, "10.0.0.0/24"): "10.0.1.1" }, multipath_groups={}, compiled_table={ 1: { "10.0.0.0/8": "10.0.1.1" } })
+    response = DijkstraCommand(None, None, { "app": app }).get_metrics(None)
+
+    assert response.status_int == 200
+    assert response.headers["Content-Type"] == ControllerMetrics.CONTENT_TYPE
+    types, samples = parse(response.body.decode())
+    values = { name: value for name, _, value in samples }
+    assert values["dijkstra_runs_total"] == 5
+    assert values["dijkstra_routes"] == 1 and values["dijkstra_compiled_flows"] == 1
+    assert values["dijkstra_graph_switches"] == 0
+    assert all(not math.isnan(value) for _, _, value in samples)
@@ -0,0 +1,86 @@
+# coding: utf-8
+
+"""
+Next-hop multipli (`NetLinkGraph.multipath_next_hops`): con stretch 1 sono tutti e
+soli i primi hop dei cammini minimi (ECMP); con stretch maggiore i vicini più vicini
+alla destinazione il cui percorso costa al più stretch volte il minimo. In entrambi
+i casi l'inoltro hop-by-hop non forma cicli.
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("ryu")
+
+from graphs import build_graph, random_costs, reference_distances
+
+
+def admissible(graph, reference, source, destination, stretch):
+    """
+    Vicini ammessi secondo la definizione, calcolati con le distanze di riferimento.
+    """
+    best = reference[source][destination]
+    hops = set()
+    for neighbor, cost in graph.neighbors(source).items():
+        through = cost + reference[neighbor][destination]
+        if stretch <= 1:
+            if through == best:
+                hops.add(neighbor)
+        elif reference[neighbor][destination] < best and through <= stretch * best:
+            hops.add(neighbor)
+    return hops
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("stretch", [1.0, 1.25, 1.5, 2.0, 4.0])
+def test_next_hops_respect_stretch_bound(seed, stretch):
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 500), rng.randint(2, 18))
+    costs = random_costs(rng, ids, max_cost=3, density=3)
+    graph = build_graph(ids, costs)
+    reference = reference_distances(ids, costs)
+
+    for source in ids:
+        multipath = graph.multipath_next_hops(source, stretch=stretch)
+        primary = graph.next_hops(source)
+        assert set(multipath) == set(primary)
+        for destination, hops in multipath.items():
+            best = reference[source][destination]
+            assert hops[0] == primary[destination]
+            assert len(hops) == len(set(hops))
+            assert set(hops) == admissible(graph, reference, source, destination, stretch) | { hops[0] }
+            through = [graph.neighbors(source)[hop] + reference[hop][destination] for hop in hops]
+            assert max(through) <= stretch * best
+            if stretch > 1:
+                assert through[1:] == sorted(through[1:]) # in ordine di costo del percorso
+            # ogni next-hop è strettamente più vicino alla destinazione: niente cicli
+            assert all(reference[hop][destination] < best for hop in hops)
+
+
+def test_ecmp_diamond():
+    #   2
+    #  / \
+    # 1   4 - 5
+    #  \ /
+    #   3
+    graph = build_graph([1, 2, 3, 4, 5], { (1, 2): 1, (2, 4): 1, (1, 3): 1, (3, 4): 1, (4, 5): 1 })
+    multipath = graph.multipath_next_hops(1)
+    assert sorted(multipath[4]) == sorted(multipath[5]) == [2, 3]
+    assert multipath[2] == [2] and multipath[3] == [3]
+    assert [len(hops) for hops in graph.multipath_next_hops(1, max_paths=1).values()] == [1] * 4
+
+
+def test_stretch_admits_longer_paths():
+    # 1 -> 4 costa 2 via 2 e 3 via 3 (che dista 1 da 4, quindi è più vicino di 1)
+    graph = build_graph([1, 2, 3, 4], { (1, 2): 1, (2, 4): 1, (1, 3): 2, (3, 4): 1 })
+    assert graph.multipath_next_hops(1, stretch=1.0)[4] == [2]
+    assert graph.multipath_next_hops(1, stretch=1.4)[4] == [2]
+    assert graph.multipath_next_hops(1, stretch=1.5)[4] == [2, 3]
+    # 3 dista 2 da 2, più di 1: escluso qualunque sia lo stretch
+    assert graph.multipath_next_hops(1, stretch=10)[2] == [2]
+
+
+def test_unknown_switch():
+    graph = build_graph([1, 2], { (1, 2): 1 })
+    assert graph.multipath_next_hops(99) == {}
@@ -0,0 +1,59 @@
+# coding: utf-8
+
+"""
+Pool di processi di `ParallelShortestPaths`: i processi sono avviati davvero
+(con "spawn"), anche quando la cartella del modulo non è più in `sys.path`,
+come avviene sotto ryu-manager dopo il caricamento dell'applicazione.
+"""
+
+import os
+import random
+import sys
+from array import array
+
+import parallel_paths
+from parallel_paths import ParallelShortestPaths, csr_dijkstra, csr_from_adjacency
+
+MODULE_DIR = os.path.dirname(os.path.abspath(parallel_paths.__file__))
+
+
+def random_csr(n, seed):
+    rng = random.Random(seed)
+    adjacency = [{} for _ in range(n)]
+    for _ in range(3 * n):
+        u, v = rng.sample(range(n), 2)
+        adjacency[u][v] = adjacency[v][u] = rng.uniform(0.1, 10)
+    return csr_from_adjacency(adjacency)
+
+
+def test_spawned_pool_without_module_directory_in_sys_path(monkeypatch):
+    monkeypatch.setattr(sys, "path", [path for path in sys.path if os.path.abspath(path or ".") != MODULE_DIR])
+    csr = random_csr(30, seed=1)
+    sources = list(range(30))
+
+    pool = ParallelShortestPaths(workers=2, min_switches=2)
+    try:
+        trees = pool.shortest_path_trees((0, 0), csr, sources)
+    finally:
+        pool.shutdown()
+
+    assert trees is not None and set(trees) == set(sources)
+    for source, tree in trees.items():
+        assert tree == csr_dijkstra(*csr, source)
+
+
+def test_pool_disabled_after_repeated_failures():
+    # Il vicino 5 non esiste: Dijkstra fallisce nei processi del pool
+    broken = (array("q", [0, 1]), array("q", [5]), array("d", [1.0]))
+    pool = ParallelShortestPaths(workers=1, min_switches=2)
+    try:
+        for attempt in range(pool.MAX_FAILURES):
+            assert not pool.disabled
+            assert pool.shortest_path_trees((0, attempt), broken, [0]) is None
+        assert pool.disabled
+
+        # Da qui in poi il chiamante procede in modo sequenziale, senza avviare altri processi
+        assert pool.shortest_path_trees((1, 0), random_csr(10, seed=2), [0, 1]) is None
+        assert pool._executor is None
+    finally:
+        pool.shutdown()
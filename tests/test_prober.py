@@ -0,0 +1,183 @@
+# coding: utf-8
+
+"""
+Backend ICMP nativo (`prober`): checksum RFC 1071 e abbinamento delle Echo Reply
+alle richieste in volo tramite numero di sequenza, indirizzo e identificatore.
+Il socket ICMP è sostituito da un socket UDP locale, su cui vengono iniettate le risposte.
+"""
+
+import asyncio
+import socket
+import struct
+
+import pytest
+
+import prober
+from prober import ICMP_ECHO_REPLY, ICMP_ECHO_REQUEST, IcmpProber, icmp_checksum
+
+
+def test_checksum_rfc1071_example():
+    # Esempio della sezione 3 di RFC 1071: somma 0xddf2, checksum il suo complemento
+    data = bytes([0x00, 0x01, 0xf2, 0x03, 0xf4, 0xf5, 0xf6, 0xf7])
+    assert icmp_checksum(data) == ~0xddf2 & 0xFFFF
+
+
+@pytest.mark.parametrize("data", [b"", b"\x45", b"\xff\xff", b"\xff\xff\xff\xff\x00\x01", bytes(range(256)) * 3 + b"\x07"])
+def test_checksum_verifies(data):
+    checksum = icmp_checksum(data)
+    padded = data + b"\x00" * (len(data) % 2)
+    # Con il checksum inserito il pacchetto somma a 0xFFFF, quindi il nuovo checksum è nullo
+    assert icmp_checksum(padded + struct.pack("!H", checksum)) == 0
+
+
+class FakeIcmpSocket():
+    """
+    Socket UDP legato a 127.0.0.1 che registra i pacchetti inviati invece di spedirli.
+    """
+
+    def __init__(self):
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("127.0.0.1", 0))
+        self.sent = []
+
+    def sendto(self, packet, address):
+        self.sent.append((packet, address))
+
+    def __getattr__(self, name):
+        return getattr(self.udp, name)
+
+
+@pytest.fixture(params=[False, True], ids=["dgram", "raw"])
+def raw(request):
+    return request.param
+
+
+@pytest.fixture
+def fake_socket(monkeypatch, raw):
+    sock = FakeIcmpSocket()
+    monkeypatch.setattr(IcmpProber, "_open_socket", staticmethod(lambda: (sock, raw)))
+    yield sock
+    sock.udp.close()
+
+
+def reply_packet(sequence, identifier, icmp_type=ICMP_ECHO_REPLY, raw=False):
+    packet = struct.pack("!BBHHH", icmp_type, 0, 0, identifier, sequence) + bytes(prober.PAYLOAD_SIZE)
+    if raw:
+        packet = b"\x45" + bytes(19) + packet # header IPv4 di 20 byte
+    return packet
+
+
+def inject(sock, packet):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        sender.sendto(packet, sock.udp.getsockname())
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_request_format(fake_socket):
+    async def main():
+        icmp = IcmpProber()
+        icmp.send("10.0.0.1")
+        icmp.send("10.0.0.2")
+        icmp.close()
+        return icmp
+
+    icmp = run(main())
+    sequences = []
+    for packet, address in fake_socket.sent:
+        icmp_type, code, _, identifier, sequence = struct.unpack("!BBHHH", packet[:8])
+        assert (icmp_type, code, identifier) == (ICMP_ECHO_REQUEST, 0, icmp.identifier)
+        assert len(packet) == 8 + prober.PAYLOAD_SIZE
+        assert icmp_checksum(packet) == 0
+        sequences.append(sequence)
+    assert [address for _, address in fake_socket.sent] == [("10.0.0.1", 0), ("10.0.0.2", 0)]
+    assert sequences == [1, 2]
+
+
+def test_replies_resolve_matching_requests(fake_socket, raw):
+    async def main():
+        icmp = IcmpProber(timeout=1.0)
+        first = icmp.send("127.0.0.1")
+        second = icmp.send("127.0.0.1")
+        # Risposte in ordine inverso: ciascuna risolve la propria richiesta
+        inject(fake_socket, reply_packet(2, icmp.identifier, raw=raw))
+        result = await asyncio.wait_for(second, 1.0)
+        assert not first.done()
+        inject(fake_socket, reply_packet(1, icmp.identifier, raw=raw))
+        await asyncio.wait_for(first, 1.0)
+        assert icmp.in_flight == {} # le richieste risolte non sono più in volo
+        icmp.close()
+        return first.result(), result
+
+    first, second = run(main())
+    assert first.sent_ns < second.sent_ns <= second.received_ns <= first.received_ns
+    assert first.rtt_ms >= 0
+
+
+def test_unrelated_replies_are_ignored(fake_socket, raw):
+    async def main():
+        icmp = IcmpProber(timeout=0.2)
+        pending = icmp.send("127.0.0.1")
+        other = icmp.send("10.9.9.9") # risponderebbe un altro indirizzo
+        inject(fake_socket, reply_packet(1, icmp.identifier, icmp_type=ICMP_ECHO_REQUEST, raw=raw))
+        inject(fake_socket, reply_packet(7, icmp.identifier, raw=raw)) # sequenza sconosciuta
+        inject(fake_socket, reply_packet(2, icmp.identifier, raw=raw)) # sequenza di `other`, indirizzo sbagliato
+        inject(fake_socket, b"\x00\x00") # troncato
+        if raw: # identificatore di un altro processo
+            inject(fake_socket, reply_packet(1, icmp.identifier ^ 0xFFFF, raw=raw))
+        await asyncio.sleep(0.05)
+        assert not pending.done() and not other.done()
+        inject(fake_socket, reply_packet(1, icmp.identifier, raw=raw))
+        await asyncio.wait_for(pending, 1.0)
+        icmp.close()
+
+    run(main())
+
+
+def test_timeout_and_late_reply(fake_socket, raw):
+    async def main():
+        icmp = IcmpProber(timeout=0.05)
+        assert await icmp.probe("127.0.0.1") is None
+        assert icmp.in_flight == {}
+        # La risposta tardiva alla sequenza 1 non deve risolvere la richiesta successiva
+        probe = asyncio.ensure_future(icmp.probe("127.0.0.1"))
+        await asyncio.sleep(0)
+        inject(fake_socket, reply_packet(1, icmp.identifier, raw=raw))
+        await asyncio.sleep(0.01)
+        assert not probe.done()
+        inject(fake_socket, reply_packet(2, icmp.identifier, raw=raw))
+        result = await probe
+        icmp.close()
+        return result
+
+    assert run(main()) is not None
+
+
+def test_sequence_skips_in_flight(fake_socket):
+    async def main():
+        icmp = IcmpProber()
+        icmp.sequence = 0xFFFE
+        icmp.in_flight[0] = icmp.in_flight[1] = ("10.0.0.1", 0, None)
+        icmp.send("10.0.0.2")
+        icmp.send("10.0.0.2")
+        icmp.close()
+        return [struct.unpack("!H", packet[6:8])[0] for packet, _ in fake_socket.sent]
+
+    assert run(main()) == [0xFFFF, 2]
+
+
+def test_loopback_probe():
+    async def main():
+        try:
+            icmp = IcmpProber(timeout=1.0)
+        except OSError as e:
+            pytest.skip("socket ICMP non disponibili: %s" % e)
+        try:
+            return await icmp.probe("127.0.0.1")
+        finally:
+            icmp.close()
+
+    result = run(main())
+    assert result is not None and result.received_ns >= result.sent_ns
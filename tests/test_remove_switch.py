@@ -0,0 +1,116 @@
+# coding: utf-8
+
+"""
+Rimozione di uno switch da `NetLinkGraph` (`remove_switch`): gli array CSR
+restano densi e coerenti (gli indici successivi scalano di uno) e descrivono
+esattamente lo stesso grafo di uno costruito da zero, su cui Dijkstra dà gli
+stessi risultati; gli switch restituiti comprendono quelli le cui rotte cambiano.
+"""
+
+import random
+from array import array
+
+import pytest
+
+pytest.importorskip("ryu")
+
+from benchmark import StubDatapath, StubSwitch
+from graphs import build_graph, random_costs, reference_distances
+from parallel_paths import INF, csr_dijkstra
+
+
+def check_csr(graph):
+    n = len(graph.ids)
+    assert graph.index == { dpid: i for i, dpid in enumerate(graph.ids) }
+    assert set(graph.switch_map) == set(graph.ids)
+    assert isinstance(graph.indices, array) and graph.indices.typecode == "q"
+    assert len(graph.indptr) == n + 1 and graph.indptr[0] == 0
+    assert all(graph.indptr[i] <= graph.indptr[i + 1] for i in range(n))
+    assert graph.indptr[-1] == len(graph.indices) == len(graph.weights)
+    for u in range(n):
+        row = graph.indices[graph.indptr[u]:graph.indptr[u + 1]]
+        assert len(set(row)) == len(row) and u not in row
+        for k in range(graph.indptr[u], graph.indptr[u + 1]):
+            v = graph.indices[k]
+            assert 0 <= v < n
+            assert graph.neighbors(graph.ids[v])[graph.ids[u]] == graph.weights[k] # simmetria
+
+
+def current_costs(graph):
+    return { (a, b): cost for a in graph.ids for b, cost in graph.neighbors(a).items() if a < b }
+
+
+def normalized(costs):
+    return { (min(a, b), max(a, b)): cost for (a, b), cost in costs.items() }
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_csr_after_removals(seed):
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 200), rng.randint(2, 16))
+    costs = normalized(random_costs(rng, ids, max_cost=4, density=3))
+    graph = build_graph(ids, costs)
+    graph.compute_trees(ids)
+
+    while graph.ids:
+        before = { dpid: graph.next_hops(dpid) for dpid in graph.ids }
+        version = graph.version
+        dpid = rng.choice(graph.ids)
+        changed = graph.remove_switch(dpid)
+        assert graph.version > version
+        assert dpid not in graph.index and dpid not in changed
+        check_csr(graph)
+
+        # stesso grafo di uno costruito da zero con gli switch e i link rimasti
+        remaining = current_costs(graph)
+        assert remaining == { pair: cost for pair, cost in costs.items() if dpid not in pair }
+        reference = reference_distances(graph.ids, remaining)
+        for source in graph.ids:
+            dist, _, hop = csr_dijkstra(graph.indptr, graph.indices, graph.weights, graph.index[source])
+            for node, target in enumerate(graph.ids):
+                assert dist[node] == reference[source][target]
+                assert (hop[node] >= 0) == (dist[node] < INF and node != graph.index[source])
+            after = graph.next_hops(source)
+            # chi ha perso o cambiato una rotta deve comparire fra gli switch restituiti
+            lost = { target: hop for target, hop in before[source].items() if target != dpid and after.get(target) != hop }
+            assert not lost or source in changed
+        costs = remaining
+
+
+def test_remove_first_middle_last():
+    ids = [10, 20, 30, 40, 50]
+    costs = { (10, 20): 1, (20, 30): 1, (30, 40): 1, (40, 50): 1, (50, 10): 3 }
+    graph = build_graph(ids, costs)
+    graph.compute_trees(ids)
+
+    assert graph.remove_switch(30) >= { 20, 40 }
+    assert graph.ids == [10, 20, 40, 50]
+    check_csr(graph)
+    assert graph.next_hops(20) == { 10: 10, 50: 10, 40: 10 }
+
+    graph.remove_switch(50) # ultimo indice
+    graph.remove_switch(10) # primo indice
+    check_csr(graph)
+    assert graph.ids == [20, 40] and graph.neighbors(20) == {} and graph.next_hops(40) == {}
+
+    assert graph.remove_switch(99) == set() # switch sconosciuto
+    graph.remove_switch(20)
+    graph.remove_switch(40)
+    check_csr(graph)
+    assert list(graph.indptr) == [0] and graph.shortest_path_trees == {}
+
+
+def test_trees_follow_shifted_indices():
+    ids = [1, 2, 3, 4]
+    graph = build_graph(ids, { (1, 2): 1, (2, 3): 1, (3, 4): 1 })
+    graph.compute_trees(ids)
+    graph.remove_switch(2)
+    # gli alberi rimasti sono indicizzati con i nuovi indici densi
+    assert sorted(graph.shortest_path_trees) == [0, 1, 2]
+    tree = graph.shortest_path_trees[graph.index[4]]
+    assert list(tree.dist) == [INF, 1, 0]
+    assert graph.next_hops(4) == { 3: 3 }
+    # un nuovo switch riceve l'indice successivo all'ultimo
+    graph.add_switch(StubSwitch(StubDatapath(7)))
+    check_csr(graph)
+    assert graph.index[7] == 3 and all(len(tree.dist) == 4 for tree in graph.shortest_path_trees.values())
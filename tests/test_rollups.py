@@ -0,0 +1,64 @@
+# coding: utf-8
+
+"""
+Rollup per minuto e per ora (`maintenance`): il riassunto di un intervallo qualsiasi
+deve coincidere con quello calcolato dai soli campioni grezzi dell'intervallo.
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+from maintenance import HOUR, MINUTE, create_rollup_tables, rollup_summary, update_rollups
+from rtt_stats import RttSummary
+
+
+@pytest.fixture(scope="module")
+def database():
+    rng = random.Random(0)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE samples (id INTEGER PRIMARY KEY, timestamp INTEGER, dest_id INTEGER, rtt REAL)")
+    create_rollup_tables(conn)
+    origin = 1700000000000 - 1700000000000 % HOUR
+    samples = [(origin + rng.randrange(4 * HOUR), rng.choice((1, 2)), rng.uniform(0.1, 80)) for _ in range(5000)]
+    conn.executemany("INSERT INTO samples (timestamp, dest_id, rtt) VALUES (?, ?, ?)", samples)
+    for start in range(0, len(samples), 700): # più scritture sugli stessi intervalli
+        update_rollups(conn, samples[start:start + 700])
+    yield conn, origin, samples
+    conn.close()
+
+
+def expected_summary(samples, dest_id, start, end):
+    summary = RttSummary()
+    for timestamp, dest, rtt in samples:
+        if dest == dest_id and start <= timestamp < end:
+            summary.add(rtt)
+    return summary
+
+
+@pytest.mark.parametrize("level", [None, "minute", "hour"])
+def test_summary_matches_raw_samples(database, level):
+    conn, origin, samples = database
+    rng = random.Random(level)
+    ranges = [(origin, origin + 4 * HOUR), (origin + HOUR, origin + 2 * HOUR), (origin + 10, origin + 20)]
+    ranges += [sorted(rng.randrange(origin - MINUTE, origin + 4 * HOUR + MINUTE) for _ in range(2)) for _ in range(30)]
+    for start, end in ranges:
+        summary = rollup_summary(conn, level, 1, start, end)
+        expected = expected_summary(samples, 1, start, end)
+        assert summary.count == expected.count
+        assert summary.sum == pytest.approx(expected.sum)
+        assert summary.sum_sq == pytest.approx(expected.sum_sq)
+        # gli istogrammi si fondono sommando i conteggi: il risultato è esatto
+        assert summary.histogram.counts == expected.histogram.counts
+        assert (summary.histogram.min, summary.histogram.max) == (expected.histogram.min, expected.histogram.max)
+
+
+def test_partial_buckets_exclude_samples_outside_range(database):
+    conn, origin, samples = database
+    # mezz'ora a cavallo di due ore: nessun intervallo per ora è interamente compreso
+    start, end = origin + HOUR - 15 * MINUTE - 1234, origin + HOUR + 15 * MINUTE + 567
+    outside = expected_summary(samples, 1, origin, origin + 2 * HOUR).count
+    summary = rollup_summary(conn, "hour", 1, start, end)
+    assert summary.count == expected_summary(samples, 1, start, end).count < outside
+    assert rollup_summary(conn, "hour", 1, end, start).count == 0
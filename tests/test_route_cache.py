@@ -0,0 +1,137 @@
+# coding: utf-8
+
+"""
+Cache dei risultati di /dijkstra (`DijkstraCommand._ROUTE_CACHE`): la chiave non
+dipende dall'ordine di switch e link, una richiesta ripetuta non ricalcola le rotte
+e ogni evento di topologia svuota la cache.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ryu")
+
+import our_dijkstra
+from benchmark import StubDatapath, StubLink, StubPort, StubSwitch
+from our_dijkstra import DijkstraCommand, DijkstraRouter, NetLinkGraph, StaticCostModel, UnitCostModel
+
+SWITCHES = [StubSwitch(StubDatapath(dpid)) for dpid in (1, 2, 3)]
+LINKS = { StubLink(StubPort(a), StubPort(b)): 0 for a, b in [(1, 2), (2, 1), (2, 3), (3, 2)] }
+
+REQUEST = {
+    "networks": [
+        { "switch_id": 1, "subnets": ["10.0.1.0/24"] },
+        { "switch_id": 3, "subnets": ["10.0.3.0/24"] },
+    ],
+    "links": [
+        { "src_switch": { "id": a, "ip_addr": "200.0.%d.%d" % (min(a, b), b) }, "dst_switch": { "id": b, "ip_addr": "200.0.%d.%d" % (min(a, b), b) }, "bw": 10, "delay": "1ms" }
+        for a, b in [(1, 2), (2, 1), (2, 3), (3, 2)]
+    ],
+}
+
+
+class FakeApp():
+    """
+    Applicazione ridotta a ciò che serve a `calc_dijkstra`.
+    """
+
+    def __init__(self):
+        self.cost_models = { model.name: model for model in (StaticCostModel(), UnitCostModel()) }
+        self.switches = list(SWITCHES)
+        self.links = dict(LINKS)
+
+    def live_graph(self, connection_parameters, cost_model=None):
+        return NetLinkGraph(self, self.switches, self.links, connection_parameters, cost_model)
+
+    def remember_routes(self, **_kwargs):
+        pass
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = FakeApp()
+    monkeypatch.setattr(our_dijkstra, "get_all_switch", lambda _app: app.switches)
+    monkeypatch.setattr(our_dijkstra, "get_all_link", lambda _app: app.links)
+    DijkstraCommand.invalidate_cache()
+    yield app
+    DijkstraCommand.invalidate_cache()
+
+
+@pytest.fixture
+def route_entries(monkeypatch):
+    calls = []
+    original = DijkstraCommand.route_entries
+
+    def counting(*args, **kwargs):
+        calls.append(kwargs)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(DijkstraCommand, "route_entries", staticmethod(counting))
+    return calls
+
+
+def post(app, request, use_params=True):
+    command = DijkstraCommand(None, None, { "app": app })
+    response = command.calc_dijkstra(SimpleNamespace(body=json.dumps(request).encode()), use_params=use_params)
+    assert response.status_code == 200
+    return json.loads(response.body)
+
+
+def test_cache_key_is_canonical():
+    key = DijkstraCommand.cache_key(SWITCHES, LINKS, REQUEST, True)
+    assert key == DijkstraCommand.cache_key(SWITCHES[::-1], dict(reversed(list(LINKS.items()))), REQUEST, True)
+    assert key != DijkstraCommand.cache_key(SWITCHES, LINKS, REQUEST, False)
+    assert key != DijkstraCommand.cache_key(SWITCHES[:2], LINKS, REQUEST, True)
+    assert key != DijkstraCommand.cache_key(SWITCHES, dict(list(LINKS.items())[:2]), REQUEST, True)
+    assert key != DijkstraCommand.cache_key(SWITCHES, LINKS, dict(REQUEST, cost_model="unit"), True)
+
+
+def test_repeated_request_hits_cache(app, route_entries):
+    first = post(app, REQUEST)
+    assert post(app, REQUEST) == first
+    assert len(route_entries) == 1
+    assert { (route["switch_id"], route["destination"]) for route in first } == { (1, "10.0.3.0/24"), (3, "10.0.1.0/24") }
+
+    post(app, REQUEST, use_params=False) # chiave diversa
+    assert len(route_entries) == 2
+
+
+@pytest.mark.parametrize("handler, event", [
+    (DijkstraRouter.switch_enter_handler, SimpleNamespace(switch=SWITCHES[0])),
+    (DijkstraRouter.switch_leave_handler, SimpleNamespace(switch=SWITCHES[0])),
+    (DijkstraRouter.link_add_handler, SimpleNamespace(link=next(iter(LINKS)))),
+    (DijkstraRouter.link_delete_handler, SimpleNamespace(link=next(iter(LINKS)))),
+])
+def test_topology_events_invalidate_cache(app, route_entries, handler, event):
+    post(app, REQUEST)
+    assert DijkstraCommand._ROUTE_CACHE
+
+    router = SimpleNamespace(net_graph=None, multipath_groups={}, multipath_table={}, compiled_table={}, pending_barriers={})
+    handler(router, event)
+    assert not DijkstraCommand._ROUTE_CACHE
+
+    post(app, REQUEST) # stessa topologia, ma le rotte vengono ricalcolate
+    assert len(route_entries) == 2
+
+
+def test_topology_change_changes_key(app, route_entries):
+    before = post(app, REQUEST)
+    # Lo switch 2 esce senza che la cache venga svuotata: la chiave cambia comunque
+    app.switches = [switch for switch in SWITCHES if switch.dp.id != 2]
+    app.links = {}
+    after = post(app, REQUEST)
+    assert len(route_entries) == 2
+    assert before and after == []
+
+
+def test_cache_is_bounded(app, monkeypatch):
+    monkeypatch.setattr(DijkstraCommand, "ROUTE_CACHE_SIZE", 3)
+    requests = [dict(REQUEST, networks=REQUEST["networks"][:1] + [{ "switch_id": 3, "subnets": ["10.0.%d.0/24" % i] }]) for i in range(5)]
+    for request in requests:
+        post(app, request)
+    assert len(DijkstraCommand._ROUTE_CACHE) == 3
+    # Restano le ultime tre richieste (LRU)
+    keys = [DijkstraCommand.cache_key(SWITCHES, LINKS, request, True) for request in requests]
+    assert list(DijkstraCommand._ROUTE_CACHE) == keys[2:]
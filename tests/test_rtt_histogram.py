@@ -0,0 +1,87 @@
+# coding: utf-8
+
+"""
+Percentili di `RttHistogram`: confronto con i percentili esatti (nearest-rank)
+calcolati sui campioni ordinati, entro l'errore relativo dichiarato dai bucket.
+"""
+
+import math
+import random
+
+import pytest
+
+from rtt_stats import RttHistogram
+
+
+def exact_percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def tolerance(value):
+    # mezzo bucket (errore relativo 1/2^SUB_BITS) più l'arrotondamento al µs
+    return value / (1 << RttHistogram.SUB_BITS) + 0.0005
+
+
+def test_bucket_bounds_contain_values():
+    for micros in list(range(2048)) + random.Random(0).sample(range(2048, 10 ** 9), 2000):
+        low, high = RttHistogram._bounds(RttHistogram._index(micros))
+        assert low <= micros < high
+        # ampiezza del bucket entro l'errore relativo dichiarato
+        assert high - low <= max(1, low / (1 << (RttHistogram.SUB_BITS - 1)))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_quantiles_match_exact_percentiles(seed):
+    rng = random.Random(seed)
+    samples = [rng.lognormvariate(math.log(20), 1.2) for _ in range(rng.randint(1, 5000))]
+    histogram = RttHistogram()
+    for rtt in samples:
+        histogram.add(rtt)
+
+    percentiles = (0.1, 1, 25, 50, 90, 99, 99.9, 100)
+    quantiles = histogram.quantiles(percentiles)
+    assert list(quantiles) == list(percentiles)
+    for p, value in quantiles.items():
+        expected = exact_percentile(samples, p)
+        assert abs(value - expected) <= tolerance(expected)
+        assert min(samples) <= value <= max(samples)
+    assert histogram.min == min(samples)
+    assert histogram.max == max(samples)
+
+
+def test_merge_equals_single_histogram():
+    rng = random.Random(1)
+    parts = [[rng.uniform(0.01, 500) for _ in range(rng.randint(0, 300))] for _ in range(5)]
+    merged, single = RttHistogram(), RttHistogram()
+    for part in parts:
+        histogram = RttHistogram()
+        for rtt in part:
+            histogram.add(rtt)
+            single.add(rtt)
+        merged.merge(histogram)
+
+    assert merged.counts == single.counts
+    assert merged.count == single.count
+    assert (merged.min, merged.max) == (single.min, single.max)
+    assert merged.summary() == single.summary()
+
+
+def test_json_round_trip():
+    histogram = RttHistogram()
+    for rtt in (0.2, 1.5, 1.5, 38.0, 1200.0):
+        histogram.add(rtt)
+    restored = RttHistogram.from_json(histogram.to_json())
+    assert restored.counts == histogram.counts
+    assert restored.count == histogram.count
+    assert restored.summary() == histogram.summary()
+
+
+def test_empty_and_single_sample():
+    assert RttHistogram().quantiles() == { p: None for p in RttHistogram.PERCENTILES }
+    assert RttHistogram.from_json(None).count == 0
+
+    histogram = RttHistogram()
+    histogram.add(12.345)
+    # un solo campione: ogni percentile coincide con esso (il centro del bucket è limitato a min e max)
+    assert set(histogram.quantiles().values()) == {12.345}
@@ -0,0 +1,65 @@
+# coding: utf-8
+
+"""
+Buffer circolare `SampleBuffer`: dopo che la capacità è stata superata
+(anche più volte) `since` deve restituire gli ultimi campioni, in ordine,
+come una semplice lista da cui vengono scartati i più vecchi.
+"""
+
+import asyncio
+
+import pytest
+
+from sessions import SampleBuffer
+
+
+@pytest.mark.parametrize("capacity", [1, 2, 3, 7, 16])
+def test_since_after_wrap_around(capacity):
+    buffer = SampleBuffer(capacity)
+    appended = []
+    for n in range(1, 5 * capacity + 2):
+        sample = (n * 0.5, float(n))
+        buffer.append(*sample)
+        appended.append(sample)
+
+        assert buffer.total == n
+        assert len(buffer) == min(n, capacity)
+        for seq in range(n + 2):
+            # i campioni sovrascritti non sono più disponibili
+            expected = appended[max(seq, n - capacity):]
+            assert buffer.since(seq) == (expected, n)
+
+
+def test_incremental_reader_skips_overwritten_samples():
+    buffer = SampleBuffer(4)
+    seq, read = 0, []
+    for n in range(30):
+        buffer.append(n * 0.5, float(n))
+        if n in (2, 3, 15, 16, 29):
+            samples, seq = buffer.since(seq)
+            read.extend(int(rtt) for _, rtt in samples)
+
+    # fra la terza e la quarta lettura il lettore resta indietro
+    # di più della capacità: i campioni 4..11 sono andati persi
+    assert seq == 30
+    assert read == [0, 1, 2, 3, 12, 13, 14, 15, 16, 26, 27, 28, 29]
+
+
+def test_wait_wakes_up_on_append_and_close():
+    async def scenario():
+        buffer = SampleBuffer(2)
+        loop = asyncio.get_running_loop()
+
+        # nessun nuovo campione: l'attesa termina per timeout
+        await buffer.wait(0, 0.01)
+        assert buffer.since(0) == ([], 0)
+
+        loop.call_later(0.01, buffer.append, 1.0, 2.0)
+        await asyncio.wait_for(buffer.wait(0, 5), 1)
+        assert buffer.since(0) == ([(1.0, 2.0)], 1)
+
+        loop.call_later(0.01, buffer.close)
+        await asyncio.wait_for(buffer.wait(1, 5), 1)
+        assert buffer.closed
+
+    asyncio.run(scenario())
@@ -0,0 +1,171 @@
+# coding: utf-8
+
+"""
+Migrazione dello schema del database (`app.init_db`): un database delle versioni
+precedenti deve arrivare alla versione corrente con le stesse misurazioni, gli
+indirizzi normalizzati nella tabella hosts, gli aggregati per host e i rollup.
+"""
+
+import random
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("quart")
+
+import app
+from database import ConnectionPool
+from maintenance import HOUR, MINUTE, rollup_summary
+from rtt_stats import RttHistogram
+
+ADDRESSES = ["10.0.0.%d" % i for i in range(1, 6)]
+SOURCE = "10.0.0.100"
+
+# Schema della versione 1: indirizzi ripetuti su ogni riga, aggregati senza istogramma
+SCHEMA_V1 = '''
+    CREATE TABLE measurements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        ip_dest TEXT NOT NULL,
+        ip_src TEXT NOT NULL,
+        rtt REAL NOT NULL,
+        duration INTEGER NOT NULL
+    );
+    CREATE INDEX idx_measurements_host_time ON measurements (ip_dest, timestamp);
+    CREATE TABLE host_stats (
+        ip_dest TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        sum_sq REAL NOT NULL
+    );
+    PRAGMA user_version = 1;
+'''
+
+# Schema della versione 0: timestamp testuali in ora locale
+SCHEMA_V0 = '''
+    CREATE TABLE measurements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        ip_dest TEXT NOT NULL,
+        ip_src TEXT NOT NULL,
+        rtt REAL NOT NULL,
+        duration INTEGER NOT NULL
+    );
+'''
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / "rtt.db")
+    pool = ConnectionPool(path, size=1)
+    monkeypatch.setattr(app, "db", pool)
+    yield path
+    pool.close_all()
+
+
+def legacy_rows(count=3000, seed=0):
+    rng = random.Random(seed)
+    origin = 1700000000000 - 1700000000000 % HOUR
+    return [
+        (i + 1, origin + rng.randrange(3 * HOUR), rng.choice(ADDRESSES), SOURCE, round(rng.uniform(0.1, 50), 3), 60)
+        for i in range(count)
+    ]
+
+
+def create_legacy(path, schema, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?)", rows)
+    if "host_stats" in schema:
+        conn.execute('''
+            INSERT INTO host_stats SELECT ip_dest, COUNT(*), SUM(rtt), SUM(rtt * rtt) FROM measurements GROUP BY ip_dest
+        ''')
+    conn.commit()
+    conn.close()
+
+
+def check_migrated(path, rows):
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == app.SCHEMA_VERSION
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "measurements_old" not in tables and "measurements" not in tables
+        assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'measurements'").fetchone() == ("view",)
+
+        # Ogni indirizzo compare una sola volta in hosts e la vista ricostruisce le righe originali
+        hosts = conn.execute("SELECT address FROM hosts").fetchall()
+        assert sorted(address for address, in hosts) == sorted({row[2] for row in rows} | {row[3] for row in rows})
+        assert conn.execute("SELECT * FROM measurements ORDER BY id").fetchall() == sorted(rows)
+
+        by_host = {}
+        for _, _, ip_dest, _, rtt, _ in rows:
+            by_host.setdefault(ip_dest, []).append(rtt)
+        for ip_dest, count, total, total_sq, histogram in conn.execute("SELECT * FROM host_stats"):
+            rtts = by_host.pop(ip_dest)
+            assert count == len(rtts)
+            assert total == pytest.approx(sum(rtts))
+            assert total_sq == pytest.approx(sum(rtt * rtt for rtt in rtts))
+            histogram = RttHistogram.from_json(histogram)
+            assert (histogram.count, histogram.min, histogram.max) == (len(rtts), min(rtts), max(rtts))
+        assert by_host == {}
+
+        # Rollup ricostruiti dai campioni migrati
+        ids = dict(conn.execute("SELECT address, id FROM hosts"))
+        start = min((row[1] for row in rows), default=0) - MINUTE
+        end = max((row[1] for row in rows), default=0) + HOUR
+        for ip_dest in {row[2] for row in rows}:
+            expected = sum(1 for row in rows if row[2] == ip_dest)
+            for level in ("minute", "hour"):
+                assert rollup_summary(conn, level, ids[ip_dest], start, end).count == expected
+    finally:
+        conn.close()
+
+
+def test_fresh_database(database):
+    app.init_db()
+    check_migrated(database, [])
+
+
+def test_migrate_v1(database):
+    rows = legacy_rows()
+    create_legacy(database, SCHEMA_V1, rows)
+    app.init_db()
+    check_migrated(database, rows)
+
+    app.init_db() # nessun effetto su un database già aggiornato
+    check_migrated(database, rows)
+
+
+def test_migrate_v0(database, monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("fuso orario non impostabile")
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    try:
+        rows = legacy_rows(500, seed=1)
+        text_rows = [
+            (id, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp // 1000)), ip_dest, ip_src, rtt, duration)
+            for id, timestamp, ip_dest, ip_src, rtt, duration in rows
+        ]
+        create_legacy(database, SCHEMA_V0, text_rows)
+        app.init_db()
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    # i timestamp testuali avevano risoluzione al secondo
+    check_migrated(database, [(id, timestamp - timestamp % 1000, *rest) for id, timestamp, *rest in rows])
+
+
+def test_writes_reuse_host_ids(database):
+    app.init_db()
+    with app.db.connection() as conn:
+        with conn:
+            app.write_measurements(conn, [(1000, ADDRESSES[0], SOURCE, 1.5, 60), (2000, ADDRESSES[1], SOURCE, 2.5, 60)])
+        with conn:
+            app.write_measurements(conn, [(3000, ADDRESSES[0], SOURCE, 3.5, 60)])
+        assert conn.execute("SELECT COUNT(*) FROM hosts").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(DISTINCT dest_id) FROM samples").fetchone()[0] == 2
+        assert conn.execute("SELECT ip_dest, count, sum FROM host_stats ORDER BY ip_dest").fetchall() == [
+            (ADDRESSES[0], 2, 5.0), (ADDRESSES[1], 1, 2.5),
+        ]
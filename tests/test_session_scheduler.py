@@ -0,0 +1,111 @@
+# coding: utf-8
+
+"""
+Sessioni di misurazione eseguite come task sull'event loop (`SessionScheduler`):
+nessun thread per sessione, al più `max_sessions` in corso alla volta, arresto
+immediato con `stop` e conservazione soltanto delle sessioni concluse più recenti.
+"""
+
+import asyncio
+import threading
+
+from sessions import SessionScheduler
+
+
+def test_sessions_share_the_event_loop():
+    loops, threads = set(), set()
+
+    async def run(session):
+        loops.add(asyncio.get_running_loop())
+        threads.add(threading.get_ident())
+        await asyncio.sleep(0.05)
+        session.add_sample(0.0, 1.0)
+
+    async def main():
+        scheduler = SessionScheduler(run)
+        before = threading.active_count()
+        sessions = [scheduler.start("10.0.0.%d" % (i % 250), 1, 1) for i in range(2000)]
+        await asyncio.sleep(0.01)
+        assert all(session.status == "running" for session in sessions)
+        assert threading.active_count() == before # nessun thread per sessione
+        await asyncio.wait([session.task for session in sessions])
+        return sessions
+
+    sessions = asyncio.run(main())
+    assert len(loops) == 1 and threads == { threading.get_ident() }
+    assert all(session.status == "finished" and session.measurements.total == 1 for session in sessions)
+
+
+def test_max_sessions_queues_the_rest():
+    running, peak = 0, 0
+
+    async def run(session):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def main():
+        scheduler = SessionScheduler(run, max_sessions=3)
+        sessions = [scheduler.start("10.0.0.1", 1, 1) for _ in range(10)]
+        await asyncio.sleep(0)
+        assert [session.status for session in sessions].count("running") == 3
+        assert [session.status for session in sessions].count("queued") == 7
+        await asyncio.wait([session.task for session in sessions])
+
+    asyncio.run(main())
+    assert peak == 3
+
+
+def test_stop_cancels_immediately():
+    async def run(session):
+        await asyncio.sleep(3600)
+
+    async def main():
+        scheduler = SessionScheduler(run)
+        session = scheduler.start("10.0.0.1", 3600, 1)
+        other = scheduler.start("10.0.0.2", 3600, 1)
+        await asyncio.sleep(0)
+        assert scheduler.get() is other # senza id: l'ultima avviata
+        assert scheduler.stop(session.id) is session
+        await asyncio.wait_for(session.task, 1)
+        assert session.stopped and session.status == "finished"
+        assert session.measurements.closed # i lettori dello stream vengono risvegliati
+        assert other.status == "running"
+        assert scheduler.stop("missing") is None
+        await asyncio.wait_for(scheduler.shutdown(), 1)
+        assert other.status == "finished"
+
+    asyncio.run(main())
+
+
+def test_failing_session_is_finished():
+    async def run(session):
+        raise RuntimeError("probe fallito")
+
+    async def main():
+        scheduler = SessionScheduler(run)
+        session = scheduler.start("10.0.0.1", 1, 1)
+        await session.task
+        return session
+
+    assert asyncio.run(main()).status == "finished"
+
+
+def test_only_recent_finished_sessions_are_kept():
+    async def run(session):
+        pass
+
+    async def main():
+        scheduler = SessionScheduler(run, max_finished=5)
+        sessions = []
+        for _ in range(12):
+            sessions.append(scheduler.start("10.0.0.1", 1, 1))
+            await sessions[-1].task
+        return scheduler, sessions
+
+    scheduler, sessions = asyncio.run(main())
+    # la sessione appena avviata si aggiunge alle 5 concluse conservate
+    assert [session.id for session in scheduler.sessions()] == [session.id for session in sessions[-6:]]
+    assert scheduler.get(sessions[0].id) is None
@@ -0,0 +1,146 @@
+# coding: utf-8
+
+"""
+Generatori di topologie (`topo_generators`): numero di switch e collegamenti
+atteso per ciascuna famiglia, grafo connesso e senza collegamenti ripetuti,
+indirizzi dei collegamenti e delle subnet distinti e coerenti fra loro.
+"""
+
+import ipaddress
+from collections import Counter
+
+import pytest
+
+from topo_generators import LINK_POOL, SUBNET_POOL, fat_tree, grid, leaf_spine, ring, waxman
+
+
+def connected(fabric):
+    adjacency = { dpid: set() for dpid in fabric.switches }
+    for link in fabric.links:
+        adjacency[link.src].add(link.dst)
+        adjacency[link.dst].add(link.src)
+    seen, stack = set(), fabric.switches[:1]
+    while stack:
+        dpid = stack.pop()
+        if dpid not in seen:
+            seen.add(dpid)
+            stack.extend(adjacency[dpid] - seen)
+    return seen == set(fabric.switches)
+
+
+CASES = [
+    # fabric, switch, collegamenti, switch di accesso
+    (fat_tree(2), 5, 4, 2),
+    (fat_tree(4), 20, 32, 8),
+    (fat_tree(8), 80, 256, 32),
+    (leaf_spine(2, 4), 6, 8, 4),
+    (leaf_spine(4, 16), 20, 64, 16),
+    (ring(1), 1, 0, 1),
+    (ring(2), 2, 1, 2),
+    (ring(8), 8, 8, 8),
+    (grid(1, 1), 1, 0, 1),
+    (grid(1, 5), 5, 4, 5),
+    (grid(3, 4), 12, 17, 12),
+]
+
+
+@pytest.mark.parametrize("fabric, switches, links, access", CASES, ids=[case[0].name for case in CASES])
+def test_counts(fabric, switches, links, access):
+    assert len(fabric.switches) == len(set(fabric.switches)) == switches
+    assert len(fabric.links) == links
+    assert len(fabric.access_switches) == access
+    assert set(fabric.access_switches) <= set(fabric.switches)
+
+
+@pytest.mark.parametrize("k", [2, 4, 6, 8])
+def test_fat_tree_formulas(k):
+    fabric = fat_tree(k)
+    assert len(fabric.switches) == 5 * k * k // 4
+    assert len(fabric.links) == k ** 3 // 2
+    degree = Counter()
+    for link in fabric.links:
+        degree[link.src] += 1
+        degree[link.dst] += 1
+    # ogni switch ha k porte verso altri switch, tranne quelli di accesso (k/2, il resto va agli host)
+    access = set(fabric.access_switches)
+    assert all(degree[dpid] == (k // 2 if dpid in access else k) for dpid in fabric.switches)
+
+
+@pytest.mark.parametrize("k", [0, 3, 5])
+def test_fat_tree_requires_even_k(k):
+    with pytest.raises(ValueError):
+        fat_tree(k)
+
+
+def all_fabrics():
+    return [case[0] for case in CASES] + [waxman(n, seed=seed) for n, seed in ((1, 0), (2, 0), (20, 0), (50, 3))]
+
+
+@pytest.mark.parametrize("fabric", all_fabrics(), ids=lambda fabric: fabric.name)
+def test_connected_without_duplicates(fabric):
+    assert connected(fabric)
+    pairs = [frozenset((link.src, link.dst)) for link in fabric.links]
+    assert all(len(pair) == 2 for pair in pairs) # nessun anello su sé stesso
+    assert len(pairs) == len(set(pairs))
+
+
+def test_waxman_is_deterministic():
+    assert waxman(30, seed=5) == waxman(30, seed=5)
+    assert waxman(30, seed=5).links != waxman(30, seed=6).links
+    for link in waxman(30, seed=5).links:
+        assert link.delay.endswith("ms") and float(link.delay[:-2]) >= 0.01
+
+
+@pytest.mark.parametrize("fabric", all_fabrics(), ids=lambda fabric: fabric.name)
+def test_addresses(fabric):
+    addresses = fabric.addresses()
+    degree = Counter()
+    for link in fabric.links:
+        degree[link.src] += 1
+        degree[link.dst] += 1
+    access = Counter(fabric.access_switches)
+    interfaces = []
+    for dpid in fabric.switches:
+        # un indirizzo per collegamento più il gateway della subnet degli host
+        assert len(addresses[dpid]) == degree[dpid] + access[dpid]
+        interfaces.extend(ipaddress.ip_interface(address) for address in addresses[dpid])
+    assert len(interfaces) == len({ interface.ip for interface in interfaces }) == 2 * len(fabric.links) + len(fabric.access_switches)
+
+    for index, link in enumerate(fabric.links):
+        src_ip, dst_ip = fabric.link_addresses(index)
+        src, dst = ipaddress.ip_interface(src_ip + "/30"), ipaddress.ip_interface(dst_ip + "/30")
+        assert src.network == dst.network and src.network.subnet_of(LINK_POOL)
+        assert src.ip not in (src.network.network_address, src.network.broadcast_address)
+        assert dst.ip not in (dst.network.network_address, dst.network.broadcast_address)
+        assert src_ip + "/30" in addresses[link.src] and dst_ip + "/30" in addresses[link.dst]
+
+    subnets = [fabric.subnet(index) for index in range(len(fabric.access_switches))]
+    assert len(set(subnets)) == len(subnets)
+    for index, dpid in enumerate(fabric.access_switches):
+        assert subnets[index].prefixlen == 24 and subnets[index].subnet_of(SUBNET_POOL)
+        assert "%s/24" % (subnets[index].network_address + 254) in addresses[dpid]
+
+
+@pytest.mark.parametrize("fabric", all_fabrics(), ids=lambda fabric: fabric.name)
+def test_dijkstra_payload(fabric):
+    networks = fabric.networks()
+    assert [network["switch_id"] for network in networks] == fabric.switches
+    assert sum(len(network["subnets"]) for network in networks) == len(fabric.access_switches)
+
+    payload = fabric.link_payload()
+    assert len(payload) == 2 * len(fabric.links)
+    directions = { (entry["src_switch"]["id"], entry["dst_switch"]["id"]): entry for entry in payload }
+    assert len(directions) == len(payload)
+    for link in fabric.links:
+        forward, backward = directions[link.src, link.dst], directions[link.dst, link.src]
+        # l'indirizzo con cui si raggiunge uno switch è lo stesso nelle due direzioni
+        assert forward["dst_switch"]["ip_addr"] == backward["src_switch"]["ip_addr"]
+        assert forward["src_switch"]["ip_addr"] == backward["dst_switch"]["ip_addr"]
+        assert (forward["bw"], forward["delay"]) == (link.bw, link.delay)
+
+
+def test_large_fabric_addresses_stay_in_pools():
+    fabric = leaf_spine(64, 1024) # 65536 collegamenti
+    last = fabric.link_addresses(len(fabric.links) - 1)
+    assert all(ipaddress.ip_address(address) in LINK_POOL for address in last)
+    assert fabric.subnet(len(fabric.access_switches) - 1).subnet_of(SUBNET_POOL)